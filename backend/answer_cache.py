@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from backend.config import settings
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Sorted ((collection_name, collection_version), ...) for the collections a question was asked against
+CacheScope = Tuple[Tuple[str, int], ...]
+
+
+class AnswerCache:
+    """
+    In-memory cache of final answers for first-turn questions.
+    Lookups match near-duplicate queries by cosine similarity of their embeddings,
+    scoped to a collection version so any upload or delete makes old answers unreachable.
+    Entries expire after `ttl_seconds`; the least recently used entry is evicted past `max_entries`.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int, similarity: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _expire(self, now: float):
+        expired = [k for k, e in self._entries.items() if now - e["created_at"] > self.ttl_seconds]
+        for k in expired:
+            del self._entries[k]
+
+    def _drop_stale_versions(self, scope: CacheScope):
+        names = tuple(name for name, _ in scope)
+        stale = [
+            k for k, e in self._entries.items()
+            if e["scope"] != scope and tuple(name for name, _ in e["scope"]) == names
+        ]
+        for k in stale:
+            del self._entries[k]
+
+    def lookup(self, scope: CacheScope, embedding: List[float]) -> Optional[str]:
+        query = self._normalize(embedding)
+        with self._lock:
+            self._expire(time.time())
+            self._drop_stale_versions(scope)
+            candidates = [(k, e) for k, e in self._entries.items() if e["scope"] == scope]
+            if not candidates:
+                self.misses += 1
+                return None
+
+            matrix = np.stack([e["embedding"] for _, e in candidates])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity:
+                self.misses += 1
+                return None
+
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            logger.info(f"Answer cache hit for {[name for name, _ in scope]} (similarity={scores[best]:.3f})")
+            return entry["answer"]
+
+    def store(self, scope: CacheScope, embedding: List[float], answer: str):
+        if not answer.strip():
+            return
+        with self._lock:
+            self._drop_stale_versions(scope)
+            self._entries[self._next_id] = {
+                "scope": scope,
+                "embedding": self._normalize(embedding),
+                "answer": answer,
+                "created_at": time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    similarity=settings.ANSWER_CACHE_SIMILARITY,
+)
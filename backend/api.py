@@ -1,6 +1,7 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Body
-from fastapi.responses import StreamingResponse
-from typing import List, Generator
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Body, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Dict, List, Generator
 import shutil
 import os
 import sys
@@ -10,12 +11,23 @@ import json
 import sqlite3
 import asyncio
 import re
+import threading
 from datetime import datetime
 
-from backend.models import ChatRequest, ChatResponse, CollectionCreate, CollectionInfo, DocInfo, ChatMessage
-from backend.database import get_chroma_client, get_db_connection
+from backend.models import ChatRequest, ChatResponse, CollectionCreate, CollectionInfo, DocInfo, ChatMessage, RuntimeReconfigure
+from backend.database import get_db_connection, bump_collection_version
+from backend.vector_store import get_vector_store
 from backend.rag_engine import chat_stream, get_embedding, settings, APP_DIR, BUNDLE_DIR
-from backend.ingest import load_document, split_text
+from backend.dedup import forget_signatures
+from backend.indexing import delete_document, enqueue_ingest, enqueue_rebuild, enqueue_reindex, source_name
+from backend.embedder import EmbeddingMismatch, check_fingerprint
+from backend.snapshots import SnapshotConflict, SnapshotError, export_snapshot, import_snapshot
+from backend.jobs import job_queue
+from backend.batch_engine import engine_stats
+from backend import model_server
+from backend.uploads import iter_multipart, ReceivedField, UploadTooLarge
+from backend.retrieval import ALL_COLLECTIONS, retrieval_service
+from backend.runtime_config import ReconfigureBusy, ReconfigureError, current_params, runtime_config
 from backend.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -34,9 +46,15 @@ def _version_tuple(raw_version: str) -> tuple:
 
 # --- Chat Endpoints ---
 
+# request_id -> cancel flag for chats that are still generating
+_active_chats: Dict[str, threading.Event] = {}
+
 @router.post("/chat")
 async def chat(request: ChatRequest):
-    logger.info(f"Chat request received. Session: {request.session_id}, Collection: {request.collection_name}")
+    request_id = request.request_id or uuid.uuid4().hex
+    logger.info(f"Chat request received. Session: {request.session_id}, Collection: {request.collection_name}, Request: {request_id}")
+    if request_id in _active_chats:
+        raise HTTPException(status_code=409, detail=f"Chat {request_id} is already running")
     conn = get_db_connection()
     c = conn.cursor()
     
@@ -55,27 +73,72 @@ async def chat(request: ChatRequest):
         conn.commit()
     conn.close()
 
+    cancel = threading.Event()
+    _active_chats[request_id] = cancel
+    loop = asyncio.get_running_loop()
+    chunks: asyncio.Queue = asyncio.Queue()
+
+    def put(chunk):
+        try:
+            loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+        except RuntimeError:  # Event loop already closed (server shutting down)
+            pass
+
+    def produce():
+        # Runs on its own thread and owns the generator, so generation stops at the next token
+        # once `cancel` is set and the model is released even if nobody reads the response.
+        stream = chat_stream(request.messages, request.collection_name, cancel, request.session_id)
+        try:
+            for chunk in stream:
+                put(chunk)
+        except Exception as e:
+            logger.exception(f"Chat generation failed: {e}")
+            put(f"\n\nError: {e}")
+        finally:
+            stream.close()
+            put(None)
+
     async def response_generator():
         full_response = ""
-        stream = chat_stream(request.messages, request.collection_name)
-
-        for chunk in stream:
-            full_response += chunk
-            yield chunk
-            await asyncio.sleep(0)
-                  
-        if request.session_id:
-            clean_response = full_response.split("\n\n[METRICS]", 1)[0].strip()
-            conn2 = get_db_connection()
-            c2 = conn2.cursor()
-            if clean_response:
-                c2.execute("INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)", 
-                          (request.session_id, "assistant", clean_response))
-                conn2.commit()
-            conn2.close()
-            logger.info("Bot response saved to DB")
-
-    return StreamingResponse(response_generator(), media_type="text/plain")
+        finished = False
+        threading.Thread(target=produce, name=f"chat-{request_id[:8]}", daemon=True).start()
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    finished = True
+                    break
+                full_response += chunk
+                yield chunk
+        finally:
+            # Also reached when the client disconnects: the response task is cancelled mid-stream.
+            if not finished and not cancel.is_set():
+                logger.info(f"Client disconnected from chat {request_id}; stopping generation")
+            cancel.set()
+            _active_chats.pop(request_id, None)
+            if request.session_id:
+                # Whatever was generated before a stop or disconnect is kept.
+                clean_response = full_response.split("\n\n[METRICS]", 1)[0].strip()
+                conn2 = get_db_connection()
+                c2 = conn2.cursor()
+                if clean_response:
+                    c2.execute("INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)", 
+                              (request.session_id, "assistant", clean_response))
+                    conn2.commit()
+                conn2.close()
+                logger.info("Bot response saved to DB")
+
+    return StreamingResponse(response_generator(), media_type="text/plain", headers={"X-Request-ID": request_id})
+
+@router.post("/chat/{request_id}/cancel")
+async def cancel_chat(request_id: str):
+    """Stops a running chat before its next token; the partial answer is still streamed and saved."""
+    cancel = _active_chats.get(request_id)
+    if cancel is None:
+        raise HTTPException(status_code=404, detail="No running chat with this request id")
+    cancel.set()
+    logger.info(f"Cancel requested for chat {request_id}")
+    return {"status": "cancelling", "request_id": request_id}
 
 @router.get("/history")
 async def get_history(search: str = None):
@@ -175,7 +238,7 @@ async def get_profile_stats():
     conn.close()
     
     # Count collections
-    client = get_chroma_client()
+    client = get_vector_store()
     collections = client.list_collections()
     
     return {
@@ -204,24 +267,43 @@ async def get_runtime_profile():
     else:
         qwen3_status = "unknown"
 
+    params = current_params()
+    if settings.INFERENCE_MODE == "server":
+        # The batched engine and the (possibly reconfigured) models live in the model-server process.
+        try:
+            batched_engine = await asyncio.to_thread(model_server.call, "stats")
+            params = (await asyncio.to_thread(runtime_config.status))["current"]
+        except RuntimeError as e:
+            batched_engine = {"error": str(e)}
+    else:
+        batched_engine = engine_stats()
+
     return {
         "auto_profile": settings.AUTO_PROFILE,
         "auto_profile_strict": settings.AUTO_PROFILE_STRICT,
         "detected_profile": settings.PROFILE,
         "effective": {
-            "n_ctx": settings.N_CTX,
-            "chat_max_tokens": settings.CHAT_MAX_TOKENS,
-            "n_threads": settings.N_THREADS,
-            "n_batch": settings.N_BATCH,
+            "n_ctx": params["n_ctx"],
+            "chat_max_tokens": params["chat_max_tokens"],
+            "n_threads": params["n_threads"],
+            "n_batch": params["n_batch"],
             "summary_chunk_size": settings.SUMMARY_CHUNK_SIZE,
             "summary_max_chunks": settings.SUMMARY_MAX_CHUNKS,
             "n_gpu_layers": settings.N_GPU_LAYERS,
             "chat_model_format": settings.CHAT_MODEL_FORMAT,
+            "speculative_chat": settings.SPECULATIVE_CHAT,
+            "speculative_summary": settings.SPECULATIVE_SUMMARY,
+            "batched_decoding": settings.BATCHED_DECODING,
+            "batched_slots": settings.BATCHED_SLOTS,
+            "inference_mode": settings.INFERENCE_MODE,
+            "api_workers": settings.API_WORKERS,
             "profile_suggested_quant": settings.PROFILE_SUGGESTED_QUANT
         },
         "runtime": {
             "python": sys.version.split()[0],
-            "llama_cpp_python": llama_cpp_version
+            "llama_cpp_python": llama_cpp_version,
+            "pid": os.getpid(),
+            "batched_engine": batched_engine
         },
         "compatibility": {
             "qwen3_status": qwen3_status,
@@ -234,13 +316,54 @@ async def get_runtime_profile():
         }
     }
 
+@router.post("/runtime/reconfigure", status_code=202)
+async def reconfigure_runtime(params: RuntimeReconfigure):
+    """
+    Applies new n_ctx / n_batch / n_threads / chat_max_tokens without a restart. Values are validated
+    here; the affected model is reloaded in the background and swapped in once running chats finish.
+    Poll GET /api/runtime/reconfigure for progress.
+    """
+    requested = params.model_dump(exclude_none=True)
+    if not requested:
+        raise HTTPException(status_code=422, detail="No parameters given")
+    try:
+        result = await asyncio.to_thread(runtime_config.start, requested)
+    except ReconfigureBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ReconfigureError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    logger.info(f"Runtime reconfiguration requested: {requested} -> {result['status']}")
+    return result
+
+@router.get("/runtime/reconfigure")
+async def get_reconfigure_status():
+    try:
+        return await asyncio.to_thread(runtime_config.status)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.get("/retrieval/stats")
+async def get_retrieval_stats():
+    """Per-collection latency of the first query on a freshly opened collection (cold) vs later ones (warm)."""
+    return {"collections": retrieval_service.latency_stats(), "warmup": retrieval_service.warmup}
+
 # --- Collection Endpoints ---
 
 @router.get("/collections")
 async def list_collections():
-    client = get_chroma_client()
+    client = get_vector_store()
     collections = client.list_collections()
-    return [{"name": c.name} for c in collections]
+    result = []
+    for c in collections:
+        try:
+            check_fingerprint(c.name, c.metadata)
+            needs_reindex = False
+        except EmbeddingMismatch:
+            needs_reindex = True
+        result.append({"name": c.name, "needs_reindex": needs_reindex})
+    return result
 
 @router.post("/collections")
 async def create_collection(collection: CollectionCreate):
@@ -249,10 +372,14 @@ async def create_collection(collection: CollectionCreate):
     sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', collection.name)
     sanitized_name = re.sub(r'_+', '_', sanitized_name).strip('_')  # Remove multiple underscores
     
+    if sanitized_name.lower() == ALL_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"'{ALL_COLLECTIONS}' is reserved for querying every collection")
+    
     logger.info(f"Creating collection: {sanitized_name} (original: {collection.name})")
-    client = get_chroma_client()
+    client = get_vector_store()
     try:
         client.create_collection(name=sanitized_name)
+        retrieval_service.invalidate(sanitized_name)
         return {"status": "success", "name": sanitized_name}
     except Exception as e:
         logger.error(f"Error creating collection: {e}")
@@ -261,14 +388,119 @@ async def create_collection(collection: CollectionCreate):
 @router.delete("/collections/{name}")
 async def delete_collection(name: str):
     logger.info(f"Deleting collection: {name}")
-    client = get_chroma_client()
+    client = get_vector_store()
     try:
         client.delete_collection(name=name)
+        forget_signatures(name)
+        bump_collection_version(name)
+        retrieval_service.invalidate(name)
         return {"status": "success"}
     except Exception as e:
         logger.error(f"Error deleting collection: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/collections/{name}/rebuild")
+async def rebuild_collection(name: str):
+    """Re-chunks and re-embeds a collection from cached extracted text, e.g. after changing CHUNK_SIZE."""
+    client = get_vector_store()
+    if name not in [c.name for c in client.list_collections()]:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    job_id, task_id = enqueue_rebuild(name)
+    logger.info(f"Rebuild of {name} queued as job {job_id}")
+    return {"status": "queued", "job_id": job_id, "task_id": task_id}
+
+@router.post("/collections/{name}/reindex")
+async def reindex_collection(name: str):
+    """Re-embeds a collection with the current embedding model into a shadow copy, then swaps it in."""
+    client = get_vector_store()
+    if name not in [c.name for c in client.list_collections()]:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    job_id, task_id = enqueue_reindex(name)
+    logger.info(f"Re-index of {name} queued as job {job_id}")
+    return {"status": "queued", "job_id": job_id, "task_id": task_id}
+
+@router.get("/collections/{name}/snapshot")
+async def export_collection_snapshot(name: str):
+    """Downloads the collection as a snapshot archive: chunks, embeddings and document rows, importable elsewhere."""
+    client = get_vector_store()
+    if name not in [c.name for c in client.list_collections()]:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    export_dir = APP_DIR / "snapshots"
+    os.makedirs(export_dir, exist_ok=True)
+    path = export_dir / f"{name}_{uuid.uuid4().hex}.zip"
+    try:
+        await asyncio.to_thread(export_snapshot, name, path)
+    except EmbeddingMismatch as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return FileResponse(path, media_type="application/zip", filename=f"{name}.snapshot.zip",
+                        background=BackgroundTask(os.remove, path))
+
+@router.post("/collections/import")
+async def import_collection_snapshot(request: Request):
+    """
+    Imports a snapshot archive (multipart field `file`, optional `name` and `replace`) using its
+    stored embeddings. An existing collection is only overwritten with `replace=true`.
+    """
+    form = {}
+    received = None
+    try:
+        async for item in iter_multipart(request, APP_DIR / "uploads" / ".incoming", settings.UPLOAD_MAX_REQUEST_MB * 1024 * 1024,
+                                         settings.UPLOAD_MAX_REQUEST_MB * 1024 * 1024):
+            if isinstance(item, ReceivedField):
+                form[item.name] = item.value
+            elif received is None:
+                received = item
+            else:
+                await asyncio.to_thread(_remove_received, item)
+    except Exception as e:
+        if received:
+            await asyncio.to_thread(_remove_received, received)
+        if isinstance(e, UploadTooLarge):
+            raise HTTPException(status_code=413, detail=str(e))
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}")
+    if received is None:
+        raise HTTPException(status_code=422, detail="file is required")
+    if received.error:
+        raise HTTPException(status_code=413, detail=received.error)
+
+    replace = form.get("replace", "false").lower() == "true"
+    try:
+        result = await asyncio.to_thread(import_snapshot, received.path, form.get("name") or None, replace)
+    except EmbeddingMismatch as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SnapshotConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await asyncio.to_thread(_remove_received, received)
+    retrieval_service.invalidate(result["collection_name"])
+    return {"status": "success", **result}
+
+# --- Job Endpoints ---
+
+@router.get("/jobs")
+async def list_jobs(limit: int = 50):
+    return {"jobs": job_queue.list_jobs(limit)}
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: int):
+    status = job_queue.cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    logger.info(f"Cancel requested for job {job_id}: {status}")
+    return {"status": status}
+
+@router.post("/jobs/{job_id}/retry")
+async def retry_job(job_id: int):
+    status = job_queue.retry(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status != "queued":
+        raise HTTPException(status_code=409, detail=f"Only failed or cancelled jobs can be retried (job is {status})")
+    logger.info(f"Retrying job {job_id}")
+    return {"status": status}
+
 # --- Notification Endpoints ---
 
 @router.get("/notifications")
@@ -320,178 +552,227 @@ async def get_collection_summary(name: str):
     logger.info(f"Fetching document summaries for collection: {name}")
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT filename, summary FROM documents WHERE collection_name = ?", (name,))
+    c.execute("SELECT filename, summary, source FROM documents WHERE collection_name = ?", (name,))
     rows = c.fetchall()
     conn.close()
     
-    summaries = [{"filename": r[0], "summary": r[1] or "No summary available."} for r in rows]
+    summaries = [{"filename": r[0], "summary": r[1] or "No summary available.", "source": r[2]} for r in rows]
     return {"name": name, "documents": summaries}
 
+@router.delete("/collections/{name}/documents/{source}")
+async def delete_collection_document(name: str, source: str):
+    logger.info(f"Deleting document {source} from {name}")
+    if name not in [c.name for c in get_vector_store().list_collections()]:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    try:
+        result = await asyncio.to_thread(delete_document, name, source)
+    except Exception as e:
+        logger.error(f"Error deleting document: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not result["chunks"] and not result["documents"]:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"status": "success", **result}
+
+@router.put("/collections/{name}/documents/{source}")
+async def replace_collection_document(name: str, source: str, request: Request):
+    """
+    Replaces one document with a new file (multipart field `file`, optional `summarize`).
+    The old chunks are removed in the same step the new ones are stored; if indexing fails, the old document stays.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM documents WHERE collection_name = ? AND source = ?", (name, source))
+    exists = c.fetchone()
+    conn.close()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    upload_dir = APP_DIR / "uploads"
+    form = {}
+    received = None
+    try:
+        async for item in iter_multipart(request, upload_dir / ".incoming", settings.UPLOAD_MAX_FILE_MB * 1024 * 1024,
+                                         settings.UPLOAD_MAX_REQUEST_MB * 1024 * 1024):
+            if isinstance(item, ReceivedField):
+                form[item.name] = item.value
+            elif received is None:
+                received = item
+            else:
+                await asyncio.to_thread(_remove_received, item)
+    except Exception as e:
+        if received:
+            await asyncio.to_thread(_remove_received, received)
+        if isinstance(e, UploadTooLarge):
+            raise HTTPException(status_code=413, detail=str(e))
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}")
+    if received is None:
+        raise HTTPException(status_code=422, detail="file is required")
+    if received.error:
+        raise HTTPException(status_code=413, detail=received.error)
+
+    new_name = source_name(received.filename, name, int(time.time()))
+    path = os.path.join(upload_dir, new_name)
+    await asyncio.to_thread(os.replace, received.path, path)
+
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    def listener(event: dict):
+        if "job_status" in event:
+            loop.call_soon_threadsafe(lambda: done.done() or done.set_result(event))
+
+    should_summarize = form.get("summarize", "false").lower() == "true"
+    await asyncio.to_thread(
+        enqueue_ingest, name, received.filename, new_name, path,
+        should_summarize, received.sha256, "", listener, source
+    )
+    event = await done
+    result = event.get("result") or {}
+    if event["job_status"] != "completed" or result.get("status") != "success":
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise HTTPException(status_code=400, detail=result.get("error") or event.get("error") or event["job_status"])
+    logger.info(f"Replaced {source} with {new_name} in {name}")
+    return {"status": "success", "source": new_name, "replaced": source, "chunks": result.get("chunks", 0)}
+
+def _remove_received(received):
+    try:
+        os.remove(received.path)
+    except OSError:
+        pass
+
+def _discard_arrivals(arrivals: asyncio.Queue):
+    while not arrivals.empty():
+        received = arrivals.get_nowait()
+        if received is not None and os.path.exists(received.path):
+            os.remove(received.path)
+
 @router.post("/upload")
-async def upload_document(
-    background_tasks: BackgroundTasks,
-    collection_name: str = Form(...),
-    summarize: str = Form("false"),
-    files: List[UploadFile] = File(...)
-):
-    # Parse summarize as boolean (form data sends strings)
-    should_summarize = summarize.lower() == "true"
-
-    logger.info(f"Starting multi-file upload for {len(files)} files to {collection_name} (summarize: {should_summarize})")
-    
+async def upload_document(request: Request):
+    """
+    Multipart upload with fields `collection_name`, `summarize`, optional `file_count`, and `files`.
+    The body is parsed as it streams in: each file is indexed on a worker thread as soon as it has
+    fully arrived, while later files are still uploading. Progress is returned as NDJSON.
+    """
+    content_length = int(request.headers.get("content-length") or 0)
+    if content_length > settings.UPLOAD_MAX_REQUEST_MB * 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {settings.UPLOAD_MAX_REQUEST_MB} MB")
+
     upload_dir = APP_DIR / "uploads"
     os.makedirs(upload_dir, exist_ok=True)
-    
-    saved_files = []
+
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    arrivals: asyncio.Queue = asyncio.Queue()
+    form = {}
+    form_ready = asyncio.Event()
     timestamp = int(time.time())
 
-    # 1. Save all files first
-    for file in files:
-        original_name = os.path.splitext(file.filename)[0]
-        ext = os.path.splitext(file.filename)[1]
-        safe_name = "".join([c for c in original_name if c.isalnum() or c in (' ', '-', '_')]).strip()
-        new_filename = f"{safe_name}_{collection_name}_{timestamp}{ext}"
-        file_path = os.path.join(upload_dir, new_filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        old_file_name = f"{original_name}_{timestamp}.{ext}"
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        saved_files.append((file.filename, new_filename, file_path))
+    def emit(event: dict):
+        loop.call_soon_threadsafe(events.put_nowait, json.dumps(event) + "\n")
+
+    async def process_arrivals():
+        await form_ready.wait()
+        collection_name = form["collection_name"]
+        # Parse summarize as boolean (form data sends strings)
+        should_summarize = form.get("summarize", "false").lower() == "true"
+        file_count = form.get("file_count", "")
+        logger.info(f"Starting streamed upload to {collection_name} (summarize: {should_summarize})")
+
+        pending = []
+        index = 0
+        while True:
+            received = await arrivals.get()
+            if received is None:
+                break
+            index += 1
+            orig_name = received.filename
+            progress_prefix = f"[{index}/{file_count}]" if file_count.isdigit() else f"[{index}]"
+            done = loop.create_future()
+            pending.append((orig_name, done))
+            if received.error:
+                done.set_result({"file": orig_name, "status": "failed", "error": received.error})
+                emit({"status": "error", "message": f"{progress_prefix} Error: {received.error}"})
+                continue
+
+            new_name = source_name(orig_name, collection_name, timestamp)
+            path = os.path.join(upload_dir, new_name)
+
+            def listener(event: dict, done=done, orig_name=orig_name, progress_prefix=progress_prefix):
+                # Called on a job worker thread.
+                if "job_status" not in event:
+                    emit(event)
+                    return
+                result = event.get("result") or {"file": orig_name, "status": "failed", "error": event.get("error") or event["job_status"]}
+                if event["job_status"] != "completed":
+                    emit({"status": "error", "message": f"{progress_prefix} Error: {result['error']}"})
+                loop.call_soon_threadsafe(lambda: done.done() or done.set_result(result))
 
-    async def process_files():
-        results = []
-        for index, (orig_name, new_name, path) in enumerate(saved_files):
             try:
-                progress_prefix = f"[{index+1}/{len(saved_files)}]"
-                yield json.dumps({"status": "loading", "message": f"{progress_prefix} Upload Started..."}) + "\n"
-                await asyncio.sleep(0) # Flush
-                
-                text = load_document(path)
-                if not text:
-                    logger.error(f"Failed to extract text: {new_name}")
-                    results.append({"file": orig_name, "status": "failed", "error": "No text extracted"})
-                    yield json.dumps({"status": "error", "message": f"{progress_prefix} Failed to extract text"}) + "\n"
-                    await asyncio.sleep(0)
-                    continue # Skip to next file
-
-                yield json.dumps({"status": "loading", "message": f"{progress_prefix} Found {len(text)} characters in document"}) + "\n"
-                await asyncio.sleep(0)
-                
-                chunks = split_text(text)
-                yield json.dumps({"status": "chunking", "message": f"{progress_prefix} Chunked into {len(chunks)} documents"}) + "\n"
-                await asyncio.sleep(0)
-                
-                client = get_chroma_client()
-                collection = client.get_or_create_collection(name=collection_name)
-                
-                ids = [f"{new_name}_{i}" for i in range(len(chunks))]
-                temp_metadatas = []
-                for i in range(len(chunks)):
-                     temp_metadatas.append({
-                        "source": new_name,
-                        "original_name": orig_name,
-                        "chunk_index": i, 
-                        "total_chunks": len(chunks),
-                        "upload_timestamp": timestamp
-                    })
-                
-                # Batch Embedding with granular progress
-                BATCH_SIZE = 10
-                total_chunks = len(chunks)
-                all_embeddings = []
-                
-                for i in range(0, total_chunks, BATCH_SIZE):
-                    batch_chunks = chunks[i : i + BATCH_SIZE]
-                    batch_embeddings = [get_embedding(chunk) for chunk in batch_chunks]
-                    all_embeddings.extend(batch_embeddings)
-                    
-                    current_count = min(i + BATCH_SIZE, total_chunks)
-                    yield json.dumps({
-                        "status": "embedding", 
-                        "progress": f"{current_count}/{total_chunks}",
-                        "message": f"{progress_prefix} Embedding {current_count}/{total_chunks} documents"
-                    }) + "\n"
-                    await asyncio.sleep(0) # Flush after each batch
-
-                yield json.dumps({"status": "saving", "message": f"{progress_prefix} Saving to ChromaDB..."}) + "\n"
-                await asyncio.sleep(0)
-                
-                # Add to Chroma
-                collection.add(
-                    documents=chunks,
-                    embeddings=all_embeddings,
-                    metadatas=temp_metadatas,
-                    ids=ids
+                await asyncio.to_thread(os.replace, received.path, path)
+                # Ingestion is a durable job: it survives a disconnect or restart and shares the worker pool.
+                await asyncio.to_thread(
+                    enqueue_ingest, collection_name, orig_name, new_name, path,
+                    should_summarize, received.sha256, progress_prefix, listener
                 )
-                
-                # Insert document record
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                summary_text = "Summary generation in progress..." if should_summarize else "No summary requested."
-                cursor.execute("INSERT INTO documents (collection_name, filename, summary) VALUES (?, ?, ?)",
-                          (collection_name, orig_name, summary_text))
-                conn.commit()
-                conn.close()
-                
-                # Only trigger summarization if requested
-                if should_summarize:
-                    import threading
-                    import uuid
-                    
-                    task_id = str(uuid.uuid4())
-                    conn = get_db_connection()
-                    c = conn.cursor()
-                    c.execute("INSERT INTO notifications (message, type, task_id, progress, status) VALUES (?, ?, ?, ?, ?)",
-                              (f"Summarization started for {orig_name}", "info", task_id, 0, "processing"))
-                    conn.commit()
-                    conn.close()
-
-                    def run_summary_thread(c_name, f_name, txt, t_id):
-                        from backend.rag_engine import summarize_text, update_task_progress
-                        try:
-                            logger.info(f"Starting background summary thread for {f_name} (Task {t_id})")
-                            summary = summarize_text(txt, task_id=t_id)
-                            
-                            conn = get_db_connection()
-                            c = conn.cursor()
-                            c.execute("UPDATE documents SET summary = ? WHERE collection_name = ? AND filename = ?", 
-                                      (summary, c_name, f_name))
-                            c.execute("UPDATE notifications SET progress = 100, status = 'completed', message = ? WHERE task_id = ?",
-                                      (f"Summary ready: {f_name}", t_id))
-                            conn.commit()
-                            conn.close()
-                            
-                            logger.info(f"Completed background summary for {f_name}")
-                        except Exception as e:
-                            logger.error(f"Background summary thread failed: {e}")
-                            try:
-                                conn = get_db_connection()
-                                c = conn.cursor()
-                                c.execute("UPDATE notifications SET status = 'failed', message = ? WHERE task_id = ?",
-                                          (f"Summary failed for {f_name}", t_id))
-                                conn.commit()
-                                conn.close()
-                            except: pass
-
-                    thread = threading.Thread(target=run_summary_thread, args=(collection_name, orig_name, text, task_id))
-                    thread.daemon = True
-                    thread.start()
-                    
-                    yield json.dumps({"status": "summary_started", "message": f"Summarization started for {orig_name}", "task_id": task_id}) + "\n"
-                    await asyncio.sleep(0)
-                
-                results.append({"file": orig_name, "status": "success", "chunks": len(chunks)})
-                yield json.dumps({"status": "completed", "message": f"{progress_prefix} Done!"}) + "\n"
-                await asyncio.sleep(0)
-
-                
             except Exception as e:
                 logger.error(f"Upload failed for {orig_name}: {e}")
-                results.append({"file": orig_name, "status": "failed", "error": str(e)})
-                yield json.dumps({"status": "error", "message": f"{progress_prefix} Error: {str(e)}"}) + "\n"
-        
-        # specific 'summary' event or just final message
-        yield json.dumps({"status": "all_completed", "results": results, "message": "All files processed."}) + "\n"
+                done.set_result({"file": orig_name, "status": "failed", "error": str(e)})
+                emit({"status": "error", "message": f"{progress_prefix} Error: {str(e)}"})
+
+        results = [await done for _, done in pending]
+        duplicates = sum(r.get("duplicates", 0) for r in results)
+        message = "All files processed."
+        if duplicates:
+            message += f" Skipped {duplicates} near-duplicate chunks."
+        emit({
+            "status": "all_completed",
+            "results": results,
+            "duplicates": duplicates,
+            "embed_calls_saved": sum(r.get("embed_calls_saved", 0) for r in results),
+            "message": message,
+        })
+        loop.call_soon_threadsafe(events.put_nowait, None)
 
-    return StreamingResponse(process_files(), media_type="application/x-ndjson")
+    processor = asyncio.create_task(process_arrivals())
+    try:
+        async for item in iter_multipart(request, upload_dir / ".incoming", settings.UPLOAD_MAX_FILE_MB * 1024 * 1024,
+                                         settings.UPLOAD_MAX_REQUEST_MB * 1024 * 1024):
+            if isinstance(item, ReceivedField):
+                form[item.name] = item.value
+                continue
+            logger.info(f"Received {item.filename} ({item.size} bytes, sha256={item.sha256[:12]})")
+            await arrivals.put(item)
+            # Fields sent before the files are all known by now; start indexing immediately.
+            if form.get("collection_name"):
+                form_ready.set()
+    except Exception as e:
+        logger.error(f"Upload stream failed: {e}")
+        if form_ready.is_set():
+            # Files that fully arrived before the failure are still indexed.
+            await arrivals.put(None)
+        else:
+            processor.cancel()
+            _discard_arrivals(arrivals)
+        if isinstance(e, UploadTooLarge):
+            raise HTTPException(status_code=413, detail=str(e))
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}")
+
+    if not form.get("collection_name"):
+        processor.cancel()
+        _discard_arrivals(arrivals)
+        raise HTTPException(status_code=422, detail="collection_name is required")
+
+    form_ready.set()
+    await arrivals.put(None)
+
+    async def stream_events():
+        while True:
+            line = await events.get()
+            if line is None:
+                break
+            yield line
+
+    return StreamingResponse(stream_events(), media_type="application/x-ndjson")
@@ -0,0 +1,379 @@
+import codecs
+import collections
+import inspect
+import queue
+import threading
+import time
+from typing import Callable, Deque, Dict, List, Optional
+
+import llama_cpp
+from llama_cpp import _internals, llama_chat_format
+
+from backend.config import settings
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class GenerationHandle:
+    """One submitted request: iterate it for text pieces as the engine samples them."""
+
+    def __init__(self, tokens: List[int], max_tokens: int, temperature: float, presence_penalty: float,
+                 repeat_penalty: float, stop: List[str]):
+        self.prompt_tokens = tokens
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.presence_penalty = presence_penalty
+        self.repeat_penalty = repeat_penalty
+        self.stop = [s for s in stop if s]
+        self.completion_tokens = 0
+        self.finish_reason: Optional[str] = None
+        self.error: Optional[str] = None
+        self.queued_at = time.time()
+        self.first_token_at: Optional[float] = None
+        self._out: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._cancelled = threading.Event()
+        # Engine-thread state
+        self.seq_id: Optional[int] = None
+        self.sampler = None
+        self.n_past = 0
+        self.pending_prompt: List[int] = list(tokens)
+        self.last_token: Optional[int] = None
+        self.held = ""
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+
+    def cancel(self):
+        """Stops generation at the engine's next step; the iterator then ends."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def __iter__(self):
+        while True:
+            piece = self._out.get()
+            if piece is None:
+                if self.error:
+                    raise RuntimeError(self.error)
+                return
+            yield piece
+
+
+def _penalties_sampler(n_vocab: int, last_n: int, repeat: float, present: float):
+    # Older llama.cpp builds take the vocabulary size as the first argument.
+    init = llama_cpp.llama_sampler_init_penalties
+    if len(inspect.signature(init).parameters) == 5:
+        return init(n_vocab, last_n, repeat, 0.0, present)
+    return init(last_n, repeat, 0.0, present)
+
+
+class BatchedEngine:
+    """
+    Runs several chat generations as parallel sequences in one llama.cpp context.
+
+    A scheduler thread owns the context. Every step it admits queued requests into free sequence
+    slots, then builds one batch holding the next token of every decoding sequence plus prompt
+    chunks of newly admitted ones (up to n_batch tokens), decodes it once and samples each sequence
+    from its own logits row. Each slot has its own KV cells (n_ctx per sequence), cleared when the
+    request finishes, so new requests join without waiting for running ones to end.
+    """
+
+    def __init__(self, llm: llama_cpp.Llama, slots: int, n_ctx: int, n_batch: int, n_threads: int):
+        if hasattr(llama_cpp, "llama_max_parallel_sequences"):
+            slots = min(slots, int(llama_cpp.llama_max_parallel_sequences()))
+        self.llm = llm
+        self.slots = max(1, slots)
+        self.n_ctx_seq = n_ctx
+        self.n_batch = n_batch
+
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = n_ctx * self.slots
+        params.n_batch = n_batch
+        params.n_seq_max = self.slots
+        params.n_threads = n_threads
+        params.n_threads_batch = n_threads
+        if hasattr(params, "kv_unified"):
+            params.kv_unified = False  # Each sequence gets its own n_ctx cells
+        # Shares the already-loaded weights with `llm`; only the KV cache is new memory.
+        self._context = _internals.LlamaContext(model=llm._model, params=params, verbose=False)
+        self._ctx = self._context.ctx
+        self._batch = llama_cpp.llama_batch_init(n_batch, 0, self.slots)
+        self._n_vocab = llm.n_vocab()
+        self._vocab = llm._model.vocab
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._waiting: Deque[GenerationHandle] = collections.deque()
+        self._active: Dict[int, GenerationHandle] = {}
+        self._free_slots = list(range(self.slots))
+        self._stopping = False
+        self._tokens_generated = 0
+        self._busy_seconds = 0.0
+        self._thread = threading.Thread(target=self._loop, name="batched-decoder", daemon=True)
+        self._thread.start()
+        logger.info(f"Batched decoding engine ready: {self.slots} slots x {n_ctx} tokens, n_batch={n_batch}")
+
+    # --- Producer API ---
+
+    def submit(self, prompt_tokens: List[int], max_tokens: int, temperature: float = 0.3,
+               presence_penalty: float = 0.0, repeat_penalty: float = 1.1,
+               stop: Optional[List[str]] = None) -> GenerationHandle:
+        # As in llama_cpp, max_tokens <= 0 means whatever the prompt leaves; at least one prompt token must fit.
+        if max_tokens <= 0:
+            max_tokens = max(self.n_ctx_seq - len(prompt_tokens), 1)
+        if max_tokens >= self.n_ctx_seq:
+            logger.warning(f"max_tokens {max_tokens} clamped to {self.n_ctx_seq - 1} (n_ctx per sequence)")
+            max_tokens = self.n_ctx_seq - 1
+        handle = GenerationHandle(prompt_tokens, max_tokens, temperature, presence_penalty, repeat_penalty, stop or [])
+        if not prompt_tokens or max_tokens < 1:
+            self._finish(handle, "error", f"Cannot generate: {len(prompt_tokens)} prompt tokens, "
+                                          f"n_ctx per sequence {self.n_ctx_seq}")
+            return handle
+        room = self.n_ctx_seq - max_tokens
+        if len(prompt_tokens) > room:
+            logger.warning(f"Prompt of {len(prompt_tokens)} tokens truncated to the last {room} for batched decoding")
+            handle.prompt_tokens = handle.pending_prompt = prompt_tokens[-room:]
+        with self._lock:
+            self._waiting.append(handle)
+            self._wakeup.notify()
+        return handle
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "active": len(self._active),
+                "waiting": len(self._waiting),
+                "tokens_generated": self._tokens_generated,
+                "tokens_per_sec": round(self._tokens_generated / self._busy_seconds, 1) if self._busy_seconds else 0.0,
+            }
+
+    def stop(self, timeout: float = 5.0):
+        """Stops the scheduler thread and frees the batch and KV cache, before the model they use is closed."""
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            # Still inside llama_decode: freeing now would pull the context from under it.
+            logger.warning(f"Batched decoder still busy after {timeout}s; leaving its context to the garbage collector")
+            return
+        llama_cpp.llama_batch_free(self._batch)
+        self._context.close()
+        self._context = self._ctx = None
+
+    # --- Scheduler thread ---
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                while not self._stopping and not self._waiting and not self._active:
+                    self._wakeup.wait()
+                if self._stopping:
+                    break
+                self._admit()
+            started = time.perf_counter()
+            try:
+                produced = self._step()
+            except Exception as e:
+                logger.exception(f"Batched decode step failed: {e}")
+                for handle in list(self._active.values()):
+                    self._finish(handle, "error", f"Batched decode step failed: {e}")
+                continue
+            with self._lock:
+                self._busy_seconds += time.perf_counter() - started
+                self._tokens_generated += produced
+        for handle in list(self._active.values()) + list(self._waiting):
+            self._finish(handle, "shutdown")
+
+    def _admit(self):
+        # Called with self._lock held.
+        while self._waiting and self._free_slots:
+            handle = self._waiting.popleft()
+            if handle.cancelled:
+                handle._out.put(None)
+                continue
+            handle.seq_id = self._free_slots.pop(0)
+            handle.sampler = self._build_sampler(handle)
+            self._active[handle.seq_id] = handle
+
+    def _build_sampler(self, handle: GenerationHandle):
+        chain = llama_cpp.llama_sampler_chain_init(llama_cpp.llama_sampler_chain_default_params())
+        llama_cpp.llama_sampler_chain_add(
+            chain, _penalties_sampler(self._n_vocab, 64, handle.repeat_penalty, handle.presence_penalty))
+        if handle.temperature <= 0:
+            llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_greedy())
+            return chain
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_top_k(40))
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_top_p(0.95, 1))
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_min_p(0.05, 1))
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_temp(handle.temperature))
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_dist(llama_cpp.LLAMA_DEFAULT_SEED))
+        return chain
+
+    def _step(self) -> int:
+        for handle in list(self._active.values()):
+            if handle.cancelled:
+                self._finish(handle, "cancelled")
+
+        batch = self._batch
+        n = 0
+        sample_at = []  # (handle, batch row whose logits it samples from)
+
+        def add(handle: GenerationHandle, token: int, logits: bool):
+            nonlocal n
+            batch.token[n] = token
+            batch.pos[n] = handle.n_past
+            batch.n_seq_id[n] = 1
+            batch.seq_id[n][0] = handle.seq_id
+            batch.logits[n] = logits
+            if logits:
+                sample_at.append((handle, n))
+            handle.n_past += 1
+            n += 1
+
+        # Decoding sequences first, so a long prompt never stalls running answers.
+        for handle in self._active.values():
+            if not handle.pending_prompt:
+                add(handle, handle.last_token, True)
+        # Remaining batch room prefills admitted prompts, a chunk at a time.
+        for handle in self._active.values():
+            if not handle.pending_prompt or n >= self.n_batch:
+                continue
+            take = handle.pending_prompt[:self.n_batch - n]
+            handle.pending_prompt = handle.pending_prompt[len(take):]
+            for i, token in enumerate(take):
+                add(handle, token, not handle.pending_prompt and i == len(take) - 1)
+        if n == 0:
+            return 0
+
+        batch.n_tokens = n
+        rc = llama_cpp.llama_decode(self._ctx, batch)
+        if rc != 0:
+            raise RuntimeError(f"llama_decode returned {rc}")
+
+        for handle, row in sample_at:
+            token = llama_cpp.llama_sampler_sample(handle.sampler, self._ctx, row)
+            self._emit(handle, token)
+        return len(sample_at)
+
+    def _emit(self, handle: GenerationHandle, token: int):
+        if llama_cpp.llama_vocab_is_eog(self._vocab, token):
+            self._finish(handle, "stop")
+            return
+        if handle.first_token_at is None:
+            handle.first_token_at = time.time()
+        handle.completion_tokens += 1
+        handle.last_token = token
+        handle.held += handle.decoder.decode(self.llm.detokenize([token]))
+
+        for stop in handle.stop:
+            index = handle.held.find(stop)
+            if index != -1:
+                handle.held = handle.held[:index]
+                self._finish(handle, "stop")
+                return
+        # Hold back a tail that could still grow into a stop string.
+        keep = 0
+        for stop in handle.stop:
+            for size in range(min(len(stop) - 1, len(handle.held)), 0, -1):
+                if handle.held.endswith(stop[:size]):
+                    keep = max(keep, size)
+                    break
+        ready = handle.held[:len(handle.held) - keep]
+        handle.held = handle.held[len(ready):]
+        if ready:
+            handle._out.put(ready)
+
+        if handle.completion_tokens >= handle.max_tokens or handle.n_past >= self.n_ctx_seq:
+            self._finish(handle, "length")
+
+    def _finish(self, handle: GenerationHandle, reason: str, error: Optional[str] = None):
+        if handle.finish_reason is not None:
+            return
+        handle.finish_reason = reason
+        handle.error = error
+        if handle.held and reason in ("stop", "length"):
+            handle._out.put(handle.held)
+        handle.held = ""
+        if handle.seq_id is not None:
+            self._context.kv_cache_seq_rm(handle.seq_id, -1, -1)
+            if handle.sampler is not None:
+                llama_cpp.llama_sampler_free(handle.sampler)
+                handle.sampler = None
+            with self._lock:
+                self._active.pop(handle.seq_id, None)
+                self._free_slots.append(handle.seq_id)
+        handle._out.put(None)
+
+
+def chat_formatter(llm: llama_cpp.Llama, chat_format: Optional[str]) -> Optional[Callable[[List[dict]], str]]:
+    """
+    Returns messages -> prompt text for `chat_format`, matching what llm.create_chat_completion would send.
+    Named formats use llama_cpp's built-in formatter; otherwise the model's embedded Jinja template.
+    """
+    if chat_format:
+        formatter = getattr(llama_chat_format, "format_" + chat_format.replace("-", "_"), None) \
+            or getattr(llama_chat_format, "format_" + chat_format.replace("-", ""), None)
+        if formatter:
+            return lambda messages: formatter(messages=messages).prompt
+    template = (llm.metadata or {}).get("tokenizer.chat_template")
+    if template:
+        eos_id, bos_id = llm.token_eos(), llm.token_bos()
+        jinja = llama_chat_format.Jinja2ChatFormatter(
+            template=template,
+            eos_token=llm._model.token_get_text(eos_id) if eos_id != -1 else "",
+            bos_token=llm._model.token_get_text(bos_id) if bos_id != -1 else "",
+        )
+        return lambda messages: jinja(messages=messages).prompt
+    return None
+
+
+_engine: Optional[BatchedEngine] = None
+_formatter: Optional[Callable[[List[dict]], str]] = None
+_engine_unavailable = False
+_engine_lock = threading.Lock()
+
+
+def get_engine(llm: llama_cpp.Llama) -> Optional[BatchedEngine]:
+    """The shared engine when BATCHED_DECODING is on and it could start, else None (sequential fallback)."""
+    global _engine, _formatter, _engine_unavailable
+    if not settings.BATCHED_DECODING or _engine_unavailable:
+        return None
+    with _engine_lock:
+        if _engine is None and not _engine_unavailable:
+            _formatter = chat_formatter(llm, settings.CHAT_MODEL_FORMAT)
+            if _formatter is None:
+                logger.warning(f"No prompt formatter for chat format {settings.CHAT_MODEL_FORMAT!r}; batched decoding disabled")
+                _engine_unavailable = True
+                return None
+            try:
+                _engine = BatchedEngine(llm, settings.BATCHED_SLOTS, settings.N_CTX, settings.N_BATCH, settings.N_THREADS)
+            except Exception as e:
+                logger.exception(f"Batched decoding unavailable, falling back to sequential generation: {e}")
+                _engine_unavailable = True
+        return _engine
+
+
+def generate_chat(llm: llama_cpp.Llama, messages: List[dict], **kwargs) -> Optional[GenerationHandle]:
+    """Submits a chat to the batched engine; returns None when the caller should use llm directly."""
+    engine = get_engine(llm)
+    if engine is None:
+        return None
+    prompt = _formatter(messages)
+    tokens = llm.tokenize(prompt.encode("utf-8"), add_bos=True, special=True)
+    return engine.submit(tokens, **kwargs)
+
+
+def engine_stats() -> Optional[dict]:
+    return _engine.stats() if _engine is not None else None
+
+
+def stop_engine():
+    """Stops the engine; the next chat starts a new one for whichever model it is given then."""
+    global _engine, _formatter, _engine_unavailable
+    with _engine_lock:
+        if _engine is not None:
+            _engine.stop()
+        _engine, _formatter, _engine_unavailable = None, None, False
@@ -6,6 +6,9 @@ from dotenv import load_dotenv
 
 
 def get_app_dir() -> Path:
+    # Override for throwaway runs (e.g. benchmarks/load_test.py) that must not touch the real data.
+    if os.getenv("RAG_APP_DIR"):
+        return Path(os.environ["RAG_APP_DIR"]).resolve()
     if getattr(sys, "frozen", False):
         return Path(sys.executable).parent
     return Path(__file__).resolve().parents[1]
@@ -30,6 +33,17 @@ def _to_bool(value: str | None, default: bool) -> bool:
     return value.strip().lower() in {"1", "true", "yes", "on"}
 
 
+def _to_mapping(value: str | None) -> dict:
+    # "name:value,other:value" -> {"name": "value", "other": "value"}
+    mapping = {}
+    for item in (value or "").split(","):
+        if ":" in item:
+            key, val = item.split(":", 1)
+            if key.strip():
+                mapping[key.strip()] = val.strip().lower()
+    return mapping
+
+
 def _is_env_explicit(name: str) -> bool:
     return name in os.environ and os.environ[name].strip() != ""
 
@@ -151,7 +165,62 @@ class Settings:
 
         self.CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 2000))
         self.CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 400))
+        # Near-duplicate chunks (repeated headers, footers, template slides) are dropped before embedding:
+        # "document" compares chunks within each file, "collection" also across the collection, "off" disables.
+        # Collection scope keeps each dropped chunk and re-adds it if the document holding its kept copy is deleted
+        self.DEDUP_SCOPE = os.getenv("DEDUP_SCOPE", "document").strip().lower()
+        self.DEDUP_SCOPE_COLLECTIONS = _to_mapping(os.getenv("DEDUP_SCOPE_COLLECTIONS"))
+        self.DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.9))
         self.RETRIEVED_DOCS_COUNT = int(os.getenv("RETRIEVED_DOCS_COUNT", 3))
+        self.RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", 4))
+        # Most recently queried collections to open in the background at startup (0 disables)
+        self.RETRIEVAL_WARMUP_COLLECTIONS = int(os.getenv("RETRIEVAL_WARMUP_COLLECTIONS", 3))
+
+        # Upload limits, enforced while the request body streams in
+        self.UPLOAD_MAX_FILE_MB = int(os.getenv("UPLOAD_MAX_FILE_MB", 200))
+        self.UPLOAD_MAX_REQUEST_MB = int(os.getenv("UPLOAD_MAX_REQUEST_MB", 2048))
+
+        # Chunks per embedding call for bulk ingestion (cli.py ingest)
+        self.INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", 64))
+
+        # Background job queue (ingestion, summarization, re-embedding)
+        self.JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+        self.JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+        # A failed attempt is retried after JOB_RETRY_DELAY_SECONDS, doubling each time up to JOB_RETRY_MAX_DELAY_SECONDS
+        self.JOB_RETRY_DELAY_SECONDS = float(os.getenv("JOB_RETRY_DELAY_SECONDS", 5))
+        self.JOB_RETRY_MAX_DELAY_SECONDS = float(os.getenv("JOB_RETRY_MAX_DELAY_SECONDS", 300))
+        # Running jobs are touched every JOB_HEARTBEAT_SECONDS; after JOB_STALE_SECONDS without one,
+        # their process is taken to have died and the job is requeued
+        self.JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", 10))
+        self.JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", 60))
+
+        # Vector storage: "chroma" or "numpy" (in-process, quantized, memory-mapped)
+        self.VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").strip().lower()
+        self.VECTOR_BACKEND_COLLECTIONS = _to_mapping(os.getenv("VECTOR_BACKEND_COLLECTIONS"))
+        self.VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "float16").strip().lower()
+        self.VECTOR_IVF_MIN_VECTORS = int(os.getenv("VECTOR_IVF_MIN_VECTORS", 50000))
+        self.VECTOR_IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", 8))
+        self.VECTOR_DECODE_CACHE_MB = int(os.getenv("VECTOR_DECODE_CACHE_MB", 64))
+        # Share of deleted rows in a NumPy collection that triggers rewriting it without them
+        self.VECTOR_COMPACT_DELETED_RATIO = float(os.getenv("VECTOR_COMPACT_DELETED_RATIO", 0.25))
+
+        # Embedding-similarity intent router: confident chit-chat / history messages skip retrieval
+        self.INTENT_ROUTER_ENABLED = _to_bool(os.getenv("INTENT_ROUTER_ENABLED"), True)
+        self.INTENT_ROUTER_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", 0.8))
+        self.INTENT_ROUTER_MARGIN = float(os.getenv("INTENT_ROUTER_MARGIN", 0.05))
+
+        # Chat history: recent turns up to HISTORY_TOKEN_BUDGET tokens go in raw; older turns of a saved
+        # session are folded into a rolling summary by a background job and sent instead.
+        self.CONVERSATION_SUMMARY_ENABLED = _to_bool(os.getenv("CONVERSATION_SUMMARY_ENABLED"), True)
+        self.HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 1024))
+        self.CONVERSATION_SUMMARY_WORDS = int(os.getenv("CONVERSATION_SUMMARY_WORDS", 200))
+        self.CONVERSATION_SUMMARY_FOLD_CHARS = int(os.getenv("CONVERSATION_SUMMARY_FOLD_CHARS", 6000))
+
+        # Semantic answer cache for context-free first turns (opt-in)
+        self.ANSWER_CACHE_ENABLED = _to_bool(os.getenv("ANSWER_CACHE_ENABLED"), False)
+        self.ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+        self.ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 86400))
+        self.ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 512))
 
         # Model paths
         self.CHAT_MODEL_PATH = _resolve_model_path("chat.nextgen", APP_DIR)
@@ -164,6 +233,27 @@ class Settings:
         self.CHAT_PRESENCE_PENALTY = float(os.getenv("CHAT_PRESENCE_PENALTY", 0.9))
         self.CHAT_REPEAT_PENALTY = float(os.getenv("CHAT_REPEAT_PENALTY", 1.1))
 
+        # Prompt-lookup speculative decoding (drafts tokens from prompt + retrieved context).
+        # Enabling either mode keeps logits for every context position, which costs extra RAM.
+        self.SPECULATIVE_CHAT = _to_bool(os.getenv("SPECULATIVE_CHAT"), False)
+        self.SPECULATIVE_SUMMARY = _to_bool(os.getenv("SPECULATIVE_SUMMARY"), False)
+        self.SPECULATIVE_NUM_PRED_TOKENS = int(os.getenv("SPECULATIVE_NUM_PRED_TOKENS", 10))
+        self.SPECULATIVE_MAX_NGRAM_SIZE = int(os.getenv("SPECULATIVE_MAX_NGRAM_SIZE", 2))
+
+        # Batched decoding: concurrent chats run as parallel sequences in one llama.cpp context.
+        # Each slot reserves its own N_CTX tokens of KV cache on top of the main context.
+        # Batched chats do not use SPECULATIVE_CHAT (no draft model in the engine); summaries still can.
+        self.BATCHED_DECODING = _to_bool(os.getenv("BATCHED_DECODING"), False)
+        self.BATCHED_SLOTS = int(os.getenv("BATCHED_SLOTS", 4))
+
+        # Inference placement: "local" loads the models in the API process; "server" loads them once
+        # in a model-server process that API_WORKERS uvicorn workers share over a local connection.
+        self.INFERENCE_MODE = os.getenv("INFERENCE_MODE", "local").strip().lower()
+        self.API_WORKERS = int(os.getenv("API_WORKERS", 1))
+        self.MODEL_SERVER_HOST = os.getenv("MODEL_SERVER_HOST", "127.0.0.1")
+        self.MODEL_SERVER_PORT = int(os.getenv("MODEL_SERVER_PORT", 8799))
+        self.MODEL_SERVER_START_TIMEOUT = int(os.getenv("MODEL_SERVER_START_TIMEOUT", 300))
+
         # Runtime params (can be auto-profiled)
         self.N_CTX = self._resolve_int("N_CTX", 4096, "n_ctx")
         self.CHAT_MAX_TOKENS = self._resolve_int("CHAT_MAX_TOKENS", 512, "chat_max_tokens")
@@ -171,6 +261,13 @@ class Settings:
         self.SUMMARY_MAX_CHUNKS = self._resolve_int("SUMMARY_MAX_CHUNKS", 12, "summary_max_chunks")
         self.N_BATCH = self._resolve_int("N_BATCH", 256, "n_batch")
         self.N_THREADS = self._resolve_int("N_THREADS", max((os.cpu_count() or 4) - 1, 2), "n_threads")
+        # POST /api/runtime/reconfigure waits this long for running generations before abandoning a model swap
+        self.RECONFIGURE_DRAIN_TIMEOUT = int(os.getenv("RECONFIGURE_DRAIN_TIMEOUT", 120))
+
+        # Document summaries: "sequential" reads the first SUMMARY_MAX_CHUNKS sections; "coverage" clusters
+        # the stored chunk embeddings and summarizes one representative chunk per cluster, so the whole
+        # document is covered for the same LLM budget; "auto" uses coverage only when sequential would truncate.
+        self.SUMMARY_MODE = os.getenv("SUMMARY_MODE", "auto").strip().lower()
 
         self.PROFILE_SUGGESTED_QUANT = self.PROFILE.get("suggested_quant", "Q4_K_M")
 
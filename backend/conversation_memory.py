@@ -0,0 +1,149 @@
+from typing import List, Optional, Tuple
+
+from backend.config import settings
+from backend.database import get_db_connection
+from backend.jobs import Job, PRIORITY_LOW, job_queue
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+FOLD_KIND = "fold_summary"
+
+
+def estimate_tokens(text: str) -> int:
+    # About four characters per token for English; API workers in server mode have no tokenizer.
+    return len(text) // 4 + 1
+
+
+def split_history(history: List[dict], budget: int) -> Tuple[List[dict], List[dict]]:
+    """
+    Splits chat messages into (older, recent): `recent` is the longest tail that fits in `budget`
+    tokens and always holds at least the last message.
+    """
+    used = 0
+    start = len(history)
+    while start > 0:
+        cost = estimate_tokens(history[start - 1]["content"])
+        if start < len(history) and used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    return history[:start], history[start:]
+
+
+def recall_summary(session_id: int, keep: int) -> str:
+    """
+    Returns the session's rolling summary. If the session has messages before its last `keep`
+    that are not folded into the summary yet, queues a low-priority job to fold them in.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT summary, summary_upto FROM sessions WHERE id = ?", (session_id,))
+    row = c.fetchone()
+    if not row:
+        conn.close()
+        return ""
+    summary, summary_upto = row
+    c.execute("SELECT COUNT(*) FROM messages WHERE session_id = ? AND id > ?", (session_id, summary_upto or 0))
+    unfolded = c.fetchone()[0]
+    conn.close()
+    if unfolded > keep:
+        enqueue_fold(session_id, keep)
+    return summary or ""
+
+
+def enqueue_fold(session_id: int, keep: int) -> int:
+    """Queues a summary fold for the session, or returns the one already queued or running."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT id FROM jobs
+        WHERE kind = ? AND status IN ('queued', 'running') AND json_extract(payload, '$.session_id') = ?
+    ''', (FOLD_KIND, session_id))
+    row = c.fetchone()
+    conn.close()
+    if row:
+        return row[0]
+    return job_queue.enqueue(FOLD_KIND, {"session_id": session_id, "keep": keep}, priority=PRIORITY_LOW)
+
+
+def _fold_batches(rows: List[tuple], max_chars: int) -> List[List[tuple]]:
+    batches: List[List[tuple]] = [[]]
+    size = 0
+    for row in rows:
+        if batches[-1] and size + len(row[2]) > max_chars:
+            batches.append([])
+            size = 0
+        batches[-1].append(row)
+        size += min(len(row[2]), max_chars)
+    return [b for b in batches if b]
+
+
+def _fold_prompt(summary: str, turns: List[tuple], max_chars: int) -> str:
+    lines = []
+    for _, role, content in turns:
+        speaker = "User" if role in ("user", "human") else "Assistant"
+        lines.append(f"{speaker}: {content[:max_chars].strip()}")
+    transcript = "\n".join(lines)
+    return f"""You keep a running summary of a conversation between a user and an assistant.
+Update the summary with the new turns below.
+Rules:
+- Keep names, numbers, decisions, open questions and what the user asked for.
+- Drop greetings and filler.
+- Write at most {settings.CONVERSATION_SUMMARY_WORDS} words.
+
+Current summary:
+{summary or "(empty)"}
+
+New turns:
+{transcript}
+
+Updated summary:
+"""
+
+
+def _fold_job(job: Job) -> Optional[dict]:
+    from backend.rag_engine import complete
+
+    session_id = job.payload["session_id"]
+    keep = job.payload.get("keep", 0)
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT summary, summary_upto FROM sessions WHERE id = ?", (session_id,))
+    row = c.fetchone()
+    if not row:
+        conn.close()
+        return {"folded": 0}  # Session was deleted
+    summary, summary_upto = row[0] or "", row[1] or 0
+    c.execute("SELECT id, role, content FROM messages WHERE session_id = ? ORDER BY id", (session_id,))
+    rows = c.fetchall()
+    conn.close()
+
+    older = rows[:-keep] if keep else rows
+    pending = [r for r in older if r[0] > summary_upto]
+    if not pending:
+        return {"folded": 0}
+
+    max_chars = settings.CONVERSATION_SUMMARY_FOLD_CHARS
+    for batch in _fold_batches(pending, max_chars):
+        job.checkpoint()
+        summary = complete(
+            _fold_prompt(summary, batch, max_chars),
+            "summary",
+            max_tokens=settings.CONVERSATION_SUMMARY_WORDS * 2,
+            temperature=0.1,
+            repeat_penalty=1.1,
+            stop=["\n\n\n", "User:", "New turns:"],
+        )
+        # Saved per batch, so a cancelled or failed fold keeps the turns it already covered.
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute("UPDATE sessions SET summary = ?, summary_upto = ? WHERE id = ?", (summary, batch[-1][0], session_id))
+        conn.commit()
+        conn.close()
+    logger.info(f"Folded {len(pending)} messages into the summary of session {session_id} ({len(summary)} chars)")
+    return {"folded": len(pending)}
+
+
+# Folding drives the chat model; one at a time, behind chats and ingestion (PRIORITY_LOW).
+job_queue.register(FOLD_KIND, _fold_job, max_concurrency=1)
@@ -1,7 +1,6 @@
 import sqlite3
-import chromadb
-from chromadb.config import Settings
 import os
+import threading
 from backend.logger import setup_logger
 from backend.config import APP_DIR
 
@@ -11,7 +10,12 @@ logger = setup_logger(__name__)
 # SQLite Setup
 DB_PATH = APP_DIR  / "chat_history.db"
 
-def init_sqlite():
+def init_sqlite(recover: bool = True):
+    """
+    Creates and migrates the schema. With `recover`, also requeues jobs and fails notifications
+    left over from a previous run. The CLI and extra API worker processes skip that, since the
+    server's launcher did it and a server may be running those jobs now.
+    """
     logger.info(f"Initializing SQLite DB: {DB_PATH}")
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
@@ -29,6 +33,13 @@ def init_sqlite():
         c.execute("ALTER TABLE sessions ADD COLUMN is_archived BOOLEAN DEFAULT 0")
     except sqlite3.OperationalError:
         pass 
+
+    # Migration: rolling summary of turns that no longer fit the history budget, and the last message it covers
+    for column in ("summary TEXT", "summary_upto INTEGER"):
+        try:
+            c.execute(f"ALTER TABLE sessions ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass
         
     c.execute('''
         CREATE TABLE IF NOT EXISTS messages (
@@ -50,6 +61,13 @@ def init_sqlite():
             upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+
+    # Migration: stored upload name (chunk `source` metadata) and content hash
+    for column in ("source TEXT", "file_hash TEXT"):
+        try:
+            c.execute(f"ALTER TABLE documents ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass
     
     c.execute('''
         CREATE TABLE IF NOT EXISTS notifications (
@@ -63,10 +81,126 @@ def init_sqlite():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS collection_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Migration: when a collection was last queried (startup warm-up picks the most recent)
+    try:
+        c.execute("ALTER TABLE collection_versions ADD COLUMN last_used_at TIMESTAMP")
+    except sqlite3.OperationalError:
+        pass
+
+    # Logical collection name -> physical collection, so a re-indexed copy can replace the original atomically
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS collection_aliases (
+            name TEXT PRIMARY KEY,
+            target TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT, -- ingest, summarize, ...
+            payload TEXT, -- JSON
+            priority INTEGER DEFAULT 0, -- higher runs first
+            status TEXT DEFAULT 'queued', -- queued, running, completed, failed, cancelled
+            attempts INTEGER DEFAULT 0,
+            max_attempts INTEGER DEFAULT 3,
+            cancel_requested BOOLEAN DEFAULT 0,
+            progress INTEGER DEFAULT 0,
+            error TEXT,
+            task_id TEXT, -- notification tracking this job, if any
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority, id)")
+
+    # MinHash signatures of indexed chunks and their LSH band buckets, for collection-scope near-duplicate detection
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_signatures (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            collection_name TEXT,
+            source TEXT,
+            signature BLOB
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chunk_signatures_source ON chunk_signatures (collection_name, source)")
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_signature_bands (
+            signature_id INTEGER,
+            collection_name TEXT,
+            band INTEGER,
+            bucket INTEGER,
+            FOREIGN KEY(signature_id) REFERENCES chunk_signatures(id)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_signature_bands_bucket ON chunk_signature_bands (collection_name, band, bucket)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_signature_bands_signature ON chunk_signature_bands (signature_id)")
+    # Chunks dropped as copies of another document's (keeper_source), to put back if that document goes
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS dropped_chunks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            collection_name TEXT,
+            source TEXT,
+            keeper_source TEXT,
+            chunk_id TEXT,
+            document TEXT,
+            metadata TEXT -- JSON
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dropped_chunks_source ON dropped_chunks (collection_name, source)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dropped_chunks_keeper ON dropped_chunks (collection_name, keeper_source)")
+
+    # Migration: process that must run the job because it holds the in-memory progress listener
+    try:
+        c.execute("ALTER TABLE jobs ADD COLUMN owner_pid INTEGER")
+    except sqlite3.OperationalError:
+        pass
+    # Migration: last sign of life from the process running (or, with owner_pid, waiting for) the job
+    try:
+        c.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at TIMESTAMP")
+    except sqlite3.OperationalError:
+        pass
+    # Migration: a job requeued after a failed attempt is not claimed before this time (retry backoff)
+    try:
+        c.execute("ALTER TABLE jobs ADD COLUMN not_before TIMESTAMP")
+    except sqlite3.OperationalError:
+        pass
     conn.commit()
 
+    if not recover:
+        conn.close()
+        return
+
+    # Crash recovery: jobs interrupted mid-run go back to the queue unless they are out of attempts
+    c.execute('''
+        UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+            cancel_requested = 0
+        WHERE status = 'running'
+    ''')
+    if c.rowcount:
+        logger.info(f"Recovered {c.rowcount} interrupted jobs")
+    # Their listeners died with the old processes; any worker may pick them up now.
+    c.execute("UPDATE jobs SET owner_pid = NULL WHERE owner_pid IS NOT NULL")
+
     # Cleanup stale 'processing' tasks from previous runs (app was closed during task)
-    c.execute("SELECT task_id, message FROM notifications WHERE status = 'processing'")
+    # Notifications of requeued jobs stay 'processing'; they resume once the workers start.
+    c.execute('''
+        SELECT task_id, message FROM notifications
+        WHERE status = 'processing' AND (task_id IS NULL OR task_id NOT IN (
+            SELECT task_id FROM jobs WHERE status = 'queued' AND task_id IS NOT NULL
+        ))
+    ''')
     stale_tasks = c.fetchall()
     
     if stale_tasks:
@@ -76,7 +210,8 @@ def init_sqlite():
                 filename = message.split("started for ")[-1]
                 c.execute("UPDATE documents SET summary = 'Upload cancelled' WHERE summary = 'Summary generation in progress...' AND filename = ?", (filename,))
         
-        c.execute("UPDATE notifications SET status = 'failed', message = message || ' (interrupted)' WHERE status = 'processing'")
+        c.executemany("UPDATE notifications SET status = 'failed', message = message || ' (interrupted)' WHERE status = 'processing' AND task_id IS ?",
+                      [(task_id,) for task_id, _ in stale_tasks])
         logger.info(f"Marked {len(stale_tasks)} stale 'processing' notifications as 'failed'")
     conn.commit()
 
@@ -85,11 +220,91 @@ def init_sqlite():
 def get_db_connection():
     return sqlite3.connect(DB_PATH, check_same_thread=False)
 
-# ChromaDB Setup
+def get_collection_version(name: str) -> int:
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT version FROM collection_versions WHERE name = ?", (name,))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+def bump_collection_version(name: str) -> int:
+    """Marks a collection's contents as changed (upload, delete) and returns the new version."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO collection_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    ''', (name,))
+    c.execute("SELECT version FROM collection_versions WHERE name = ?", (name,))
+    version = c.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return version
+
+def touch_collection(name: str):
+    """Records that `name` was just queried."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO collection_versions (name, version, last_used_at) VALUES (?, 0, CURRENT_TIMESTAMP)
+        ON CONFLICT(name) DO UPDATE SET last_used_at = CURRENT_TIMESTAMP
+    ''', (name,))
+    conn.commit()
+    conn.close()
+
+def get_recent_collections(limit: int) -> list:
+    """Names of the most recently queried collections, newest first."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT name FROM collection_versions WHERE last_used_at IS NOT NULL
+        ORDER BY last_used_at DESC LIMIT ?
+    ''', (limit,))
+    names = [row[0] for row in c.fetchall()]
+    conn.close()
+    return names
+
+def get_collection_aliases() -> dict:
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        c.execute("SELECT name, target FROM collection_aliases")
+        rows = c.fetchall()
+    except sqlite3.OperationalError:  # Before init_sqlite() has run
+        rows = []
+    conn.close()
+    return dict(rows)
+
+def set_collection_alias(name: str, target: str):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO collection_aliases (name, target) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET target = excluded.target, updated_at = CURRENT_TIMESTAMP
+    ''', (name, target))
+    conn.commit()
+    conn.close()
+
+def delete_collection_alias(name: str):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM collection_aliases WHERE name = ?", (name,))
+    conn.commit()
+    conn.close()
+
+# ChromaDB Setup: the client is created on first use, since importing chromadb alone
+# takes seconds and numpy-only or chat-only sessions never need it.
 CHROMA_PATH = APP_DIR / "chroma_db"
-logger.info(f"Initializing ChromaDB: {CHROMA_PATH}")
-settings = Settings(anonymized_telemetry=False)
-chroma_client = chromadb.PersistentClient(path=str(CHROMA_PATH), settings=settings)
+_chroma_client = None
+_chroma_lock = threading.Lock()
 
 def get_chroma_client():
-    return chroma_client
+    global _chroma_client
+    with _chroma_lock:
+        if _chroma_client is None:
+            import chromadb
+            from chromadb.config import Settings
+            logger.info(f"Initializing ChromaDB: {CHROMA_PATH}")
+            _chroma_client = chromadb.PersistentClient(path=str(CHROMA_PATH), settings=Settings(anonymized_telemetry=False))
+        return _chroma_client
@@ -0,0 +1,260 @@
+"""
+Near-duplicate chunk detection at ingestion, so boilerplate is not embedded, stored and retrieved.
+
+PDF and PPTX exports repeat headers, footers, disclaimers and template slides, which leaves many
+near-identical chunks. Each chunk gets a MinHash signature over its lowercased word 5-grams, with
+page numbers ("Page 3 of 12") folded so they do not tell copies apart. Signatures are cut into LSH
+bands; only chunks sharing a band bucket are compared, and a chunk whose estimated Jaccard similarity
+to a kept one reaches DEDUP_THRESHOLD and whose figures (every other number) are the same is dropped
+before embedding, so invoices or table rows differing only in their numbers are all kept. The kept
+chunk records how many copies it stands for in its `duplicates` metadata.
+
+DEDUP_SCOPE (per collection: DEDUP_SCOPE_COLLECTIONS) is "document" to compare chunks within each
+file, "collection" to also compare against the collection's other documents, whose signatures are
+kept in sqlite (chunk_signatures), or "off". A chunk dropped as a copy of another document's is kept
+in sqlite too (dropped_chunks), with the document holding the kept copy; when that document is
+deleted or replaced, the chunk is pointed at another document still holding a copy, or put back.
+"""
+import hashlib
+import json
+import math
+import re
+import zlib
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from backend.config import settings
+from backend.database import get_db_connection
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+SCOPES = ("off", "document", "collection")
+NUM_PERM = 128
+# 16 bands of 8 rows: pairs above ~0.7 similarity become candidates, pairs at 0.9 almost always do.
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+
+_PRIME = (1 << 31) - 1
+_DTYPE = np.dtype("<u4")
+# Derived from fixed strings rather than a seeded RNG: stored signatures must match across numpy versions.
+_A, _B = (
+    np.array([int.from_bytes(hashlib.blake2b(f"{name}{i}".encode(), digest_size=8).digest(), "little") % (_PRIME - 1) + 1
+              for i in range(NUM_PERM)], dtype=np.uint64)
+    for name in ("a", "b")
+)
+_WORD = re.compile(r"\w+")
+_PAGE_NUMBER = re.compile(r"\b(?:page|slide|p\.)\s*\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?\b")
+_FIGURE = re.compile(r"\b\d+(?:[.,:/-]\d+)*\b")
+
+
+def dedup_scope(collection_name: str) -> str:
+    scope = settings.DEDUP_SCOPE_COLLECTIONS.get(collection_name, settings.DEDUP_SCOPE)
+    return scope if scope in SCOPES else "document"
+
+
+def signature(text: str) -> np.ndarray:
+    """
+    MinHash signature (NUM_PERM uint32 values) of the text's word shingles, followed by a checksum
+    of its figures (standalone numbers, dates, amounts) in order. Signatures stored before the checksum was added never match.
+    """
+    text = _PAGE_NUMBER.sub("page", text.lower())
+    words = _WORD.findall(text)
+    if len(words) > SHINGLE_WORDS:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    else:
+        shingles = {" ".join(words)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # Products stay below 2**63: hashes < 2**32 and multipliers < 2**31.
+    minhash = ((hashes[:, None] * _A + _B) % _PRIME).min(axis=0)
+    figures = zlib.crc32(" ".join(_FIGURE.findall(text)).encode("utf-8"))
+    return np.append(minhash, figures).astype(_DTYPE)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the two chunks' shingle sets."""
+    return float(np.mean(a[:NUM_PERM] == b[:NUM_PERM]))
+
+
+def is_duplicate(a: np.ndarray, b: np.ndarray) -> bool:
+    """Whether the chunks are near-identical in wording and have exactly the same figures."""
+    return len(a) == len(b) == NUM_PERM + 1 and a[NUM_PERM] == b[NUM_PERM] and similarity(a, b) >= settings.DEDUP_THRESHOLD
+
+
+def _band_keys(sig: np.ndarray) -> List[tuple]:
+    rows = sig[:NUM_PERM].reshape(BANDS, ROWS)
+    return [
+        (band, int.from_bytes(hashlib.blake2b(rows[band].tobytes(), digest_size=8).digest(), "little", signed=True))
+        for band in range(BANDS)
+    ]
+
+
+def _stored_match(conn, collection_name: str, sig: np.ndarray, exclude: set) -> Optional[str]:
+    """Source of a stored chunk in the collection that `sig` nearly duplicates, if any."""
+    keys = _band_keys(sig)
+    rows = conn.execute(f'''
+        SELECT DISTINCT s.id, s.source, s.signature FROM chunk_signature_bands b
+        JOIN chunk_signatures s ON s.id = b.signature_id
+        WHERE b.collection_name = ? AND (b.band, b.bucket) IN (VALUES {", ".join("(?, ?)" for _ in keys)})
+    ''', [collection_name, *(value for key in keys for value in key)])
+    for _, source, blob in rows:
+        if source not in exclude and is_duplicate(sig, np.frombuffer(blob, dtype=_DTYPE)):
+            return source
+    return None
+
+
+def deduplicate(collection_name: str, ids: List[str], chunks: List[str], metadatas: List[dict],
+                exclude_sources: Iterable[str] = (), embed_batch: int = 1) -> dict:
+    """
+    Drops near-duplicate chunks of one document, keeping the first of each group (ids and
+    `chunk_index` are left as they were, so retrieval still sees which chunks are adjacent).
+    With collection scope, chunks repeating another document of the collection (other than
+    `exclude_sources`, e.g. the version being replaced) are dropped too, unless that would drop
+    them all. Returns the kept ids, chunks, metadatas and, with collection scope, the signatures
+    and collection-level drops to store once they are indexed (record_signatures), plus counts of
+    what was dropped.
+    """
+    scope = dedup_scope(collection_name)
+    result = {
+        "ids": ids, "chunks": chunks, "metadatas": metadatas, "signatures": [], "dropped": [],
+        "duplicates": 0, "collection_duplicates": 0, "embed_calls_saved": 0,
+    }
+    if scope == "off" or not chunks:
+        return result
+
+    signatures = [signature(chunk) for chunk in chunks]
+    buckets = {}
+    kept, copies = [], {}
+    for i, sig in enumerate(signatures):
+        keys = _band_keys(sig)
+        candidates = dict.fromkeys(j for key in keys for j in buckets.get(key, ()))
+        match = next((j for j in candidates if is_duplicate(sig, signatures[j])), None)
+        if match is not None:
+            copies[match] = copies.get(match, 0) + 1
+            continue
+        kept.append(i)
+        for key in keys:
+            buckets.setdefault(key, []).append(i)
+
+    for i, count in copies.items():
+        metadatas[i]["duplicates"] = count
+
+    collection_duplicates = 0
+    if scope == "collection":
+        exclude = set(exclude_sources)
+        conn = get_db_connection()
+        keepers = {i: _stored_match(conn, collection_name, signatures[i], exclude) for i in kept}
+        conn.close()
+        unique = [i for i in kept if keepers[i] is None]
+        if unique:
+            collection_duplicates = len(kept) - len(unique)
+            result["dropped"] = [
+                {"id": ids[i], "document": chunks[i], "metadata": metadatas[i], "keeper": keepers[i]}
+                for i in kept if keepers[i] is not None
+            ]
+            kept = unique
+        result["signatures"] = [signatures[i] for i in kept]
+
+    dropped = len(chunks) - len(kept)
+    if dropped:
+        logger.info(f"Dropped {dropped} of {len(chunks)} chunks as near-duplicates "
+                    f"({collection_duplicates} already in {collection_name})")
+    result.update(
+        ids=[ids[i] for i in kept],
+        chunks=[chunks[i] for i in kept],
+        metadatas=[metadatas[i] for i in kept],
+        duplicates=dropped,
+        collection_duplicates=collection_duplicates,
+        embed_calls_saved=math.ceil(len(chunks) / embed_batch) - math.ceil(len(kept) / embed_batch),
+    )
+    return result
+
+
+def _insert_signatures(c, collection_name: str, source: str, signatures: Sequence[np.ndarray]):
+    for sig in signatures:
+        c.execute("INSERT INTO chunk_signatures (collection_name, source, signature) VALUES (?, ?, ?)",
+                  (collection_name, source, sig.tobytes()))
+        c.executemany("INSERT INTO chunk_signature_bands (signature_id, collection_name, band, bucket) VALUES (?, ?, ?, ?)",
+                      [(c.lastrowid, collection_name, band, bucket) for band, bucket in _band_keys(sig)])
+
+
+def record_signatures(collection_name: str, source: str, signatures: Sequence[np.ndarray], dropped: Sequence[dict] = ()):
+    """
+    Stores an indexed document's chunk signatures for collection-scope comparison, and the chunks
+    deduplicate() dropped as copies of other documents' so they can be put back later.
+    """
+    if not signatures and not dropped:
+        return
+    conn = get_db_connection()
+    c = conn.cursor()
+    _insert_signatures(c, collection_name, source, signatures)
+    c.executemany('''
+        INSERT INTO dropped_chunks (collection_name, source, keeper_source, chunk_id, document, metadata)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(collection_name, source, d["keeper"], d["id"], d["document"], json.dumps(d["metadata"])) for d in dropped])
+    conn.commit()
+    conn.close()
+
+
+def orphaned_duplicates(collection_name: str, keeper: str, sources: Optional[Iterable[str]] = None) -> List[dict]:
+    """
+    Chunks (of `sources`, default all documents) dropped as copies of `keeper`'s that no stored
+    document covers any more (call once `keeper`'s signatures are forgotten or replaced). Those
+    another document still covers are pointed at it instead; of orphans repeating each other,
+    only the first is returned.
+    """
+    sources = None if sources is None else set(sources)
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT id, source, chunk_id, document, metadata FROM dropped_chunks WHERE collection_name = ? AND keeper_source = ?",
+              (collection_name, keeper))
+    orphans = []
+    for row_id, source, chunk_id, document, metadata in c.fetchall():
+        if sources is not None and source not in sources:
+            continue
+        sig = signature(document)
+        match = _stored_match(conn, collection_name, sig, {source})
+        if match is None:
+            match = next((o["source"] for o in orphans
+                          if o["source"] != source and is_duplicate(sig, o["signature"])), None)
+        if match is not None:
+            c.execute("UPDATE dropped_chunks SET keeper_source = ? WHERE id = ?", (match, row_id))
+            continue
+        orphans.append({"row_id": row_id, "source": source, "id": chunk_id, "document": document,
+                        "metadata": json.loads(metadata), "signature": sig})
+    conn.commit()
+    conn.close()
+    return orphans
+
+
+def readmit_duplicates(collection_name: str, orphans: Sequence[dict]):
+    """Records orphaned_duplicates() put back in the collection as regular chunks of their documents."""
+    if not orphans:
+        return
+    conn = get_db_connection()
+    c = conn.cursor()
+    for orphan in orphans:
+        _insert_signatures(c, collection_name, orphan["source"], [orphan["signature"]])
+    c.executemany("DELETE FROM dropped_chunks WHERE id = ?", [(orphan["row_id"],) for orphan in orphans])
+    conn.commit()
+    conn.close()
+
+
+def forget_signatures(collection_name: str, source: Optional[str] = None):
+    """
+    Removes stored signatures and dropped chunks of one document, or of the whole collection when
+    `source` is None. Chunks other documents dropped as copies of this one's are left for
+    orphaned_duplicates().
+    """
+    condition, params = "collection_name = ?", (collection_name,)
+    if source is not None:
+        condition, params = "collection_name = ? AND source = ?", (collection_name, source)
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(f"DELETE FROM chunk_signature_bands WHERE signature_id IN (SELECT id FROM chunk_signatures WHERE {condition})", params)
+    c.execute(f"DELETE FROM chunk_signatures WHERE {condition}", params)
+    c.execute(f"DELETE FROM dropped_chunks WHERE {condition}", params)
+    conn.commit()
+    conn.close()
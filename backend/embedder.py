@@ -0,0 +1,138 @@
+import hashlib
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+from llama_cpp import Llama
+
+from backend import model_server
+from backend.config import settings
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+EMBED_MODEL_PATH = str(settings.EMBED_MODEL_PATH)
+
+# Collection metadata keys recording which model produced a collection's vectors
+FINGERPRINT_KEY = "embed_fingerprint"
+DIMENSION_KEY = "embed_dim"
+
+_embed_model: Optional[Llama] = None
+_fingerprint: Optional[dict] = None
+_digest: Optional[str] = None
+# llama.cpp contexts are not thread-safe; chat queries and ingestion jobs share this one.
+_embed_lock = threading.Lock()
+
+
+def _load_embed_model(n_batch: int, n_threads: int) -> Llama:
+    logger.info(f"Initializing Embed Model: {EMBED_MODEL_PATH}")
+    try:
+        return Llama(
+            model_path=EMBED_MODEL_PATH,
+            embedding=True,
+            n_batch=n_batch,
+            n_threads=n_threads,
+            verbose=False
+        )
+    except Exception as e:
+        logger.exception(f"Error loading the Embed Model: {e}")
+        raise RuntimeError(f"Failed to load embedding model: {EMBED_MODEL_PATH}") from e
+
+
+def get_embed_model() -> Llama:
+    """Loads the embedding model on first use, so tools that only embed never load the chat model."""
+    global _embed_model
+    with _embed_lock:
+        if _embed_model is None:
+            _embed_model = _load_embed_model(settings.N_BATCH, settings.N_THREADS)
+        return _embed_model
+
+
+def reload_embed_model(n_batch: int, n_threads: int):
+    """Loads the embedding model with new parameters, swaps it in between embedding calls and frees the old one."""
+    global _embed_model
+    new_model = _load_embed_model(n_batch, n_threads)
+    with _embed_lock:
+        old_model, _embed_model = _embed_model, new_model
+    if old_model is not None:
+        old_model.close()
+    logger.info(f"Embed model reloaded: n_batch={n_batch}, n_threads={n_threads}")
+
+
+def get_embedding(text: str) -> List[float]:
+    return embed_texts([text])[0]
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """
+    Embeds several texts in one model call; results keep the input order. Vectors are
+    unit-normalized, so stored chunks and queries compare by cosine in every distance space.
+    """
+    if not texts:
+        return []
+    if settings.INFERENCE_MODE == "server":
+        return model_server.call("embed", texts=texts)
+    get_embed_model()
+    with _embed_lock:
+        # Read under the lock: reload_embed_model() swaps the model between calls.
+        data = _embed_model.create_embedding(texts)["data"]
+    vectors = np.asarray([item["embedding"] for item in data], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.where(norms > 0, norms, 1.0)).tolist()
+
+
+def model_digest() -> str:
+    """
+    Identifies the embedding model file without loading it: SHA-256 over its size, first 8 MB
+    and last 1 MB (cheap for multi-GB GGUF files, yet changes whenever the weights do).
+    """
+    global _digest
+    if _digest is None:
+        digest = hashlib.sha256()
+        size = os.path.getsize(EMBED_MODEL_PATH)
+        digest.update(str(size).encode())
+        with open(EMBED_MODEL_PATH, "rb") as f:
+            digest.update(f.read(8 * 1024 * 1024))
+            if size > 9 * 1024 * 1024:
+                f.seek(-1024 * 1024, os.SEEK_END)
+                digest.update(f.read())
+        _digest = digest.hexdigest()[:16]
+    return _digest
+
+
+def embed_fingerprint() -> dict:
+    """The model_digest() of the embedding model plus the dimension of the vectors it produces."""
+    global _fingerprint
+    if _fingerprint is None:
+        _fingerprint = {
+            FINGERPRINT_KEY: model_digest(),
+            DIMENSION_KEY: len(get_embedding("fingerprint")),
+        }
+    return _fingerprint
+
+
+class EmbeddingMismatch(ValueError):
+    """A collection's vectors were produced by a different embedding model than the loaded one."""
+
+
+def check_fingerprint(name: str, metadata: Optional[dict]):
+    """Raises EmbeddingMismatch if the collection metadata records a different model or dimension."""
+    metadata = metadata or {}
+    current = embed_fingerprint()
+    stored = metadata.get(FINGERPRINT_KEY)
+    if stored and stored != current[FINGERPRINT_KEY]:
+        raise EmbeddingMismatch(f"Collection {name} was indexed with a different embedding model ({stored}); re-index it")
+    dim = metadata.get(DIMENSION_KEY)
+    if dim and int(dim) != current[DIMENSION_KEY]:
+        raise EmbeddingMismatch(f"Collection {name} has {dim}-dim vectors but the embedding model produces {current[DIMENSION_KEY]}; re-index it")
+
+
+def stamp_fingerprint(collection):
+    """Records the current model fingerprint in collection metadata (keeping existing keys)."""
+    metadata = dict(collection.metadata or {})
+    if hasattr(collection, "configuration_json"):
+        # Chroma keeps the distance space in its configuration and rejects hnsw:* keys on modify.
+        metadata = {k: v for k, v in metadata.items() if not k.startswith("hnsw:")}
+    metadata.update(embed_fingerprint())
+    collection.modify(metadata=metadata)
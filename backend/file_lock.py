@@ -0,0 +1,78 @@
+"""
+Exclusive locks that hold across processes (API workers, the CLI) as well as threads.
+Uses flock() on POSIX and msvcrt.locking() on Windows, on a small lock file.
+"""
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class InterProcessLock:
+    """
+    Reentrant lock on `path`. The first acquire in a process takes the OS lock on the file and
+    nested acquires by the same thread only count; other threads wait on the in-process lock, since
+    an OS lock is held by the process, not the thread.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                self._file = self._lock_file()
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            file, self._file = self._file, None
+            try:
+                if fcntl:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+                else:
+                    file.seek(0)
+                    msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+            finally:
+                file.close()
+        self._lock.release()
+
+    def _lock_file(self):
+        os.makedirs(self.path.parent, exist_ok=True)
+        file = open(self.path, "a+b")
+        try:
+            if fcntl:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                return file
+            # LK_LOCK gives up after 10 seconds; writers can hold the lock longer (e.g. a compaction).
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                    return file
+                except OSError:
+                    time.sleep(0.05)
+        except BaseException:
+            file.close()
+            raise
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,615 @@
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from backend.config import APP_DIR, settings
+from backend.database import get_db_connection, bump_collection_version
+from backend.ingest import load_document
+from backend.text_cache import hash_file, load_chunks_cached, remove_extracted
+from backend.dedup import deduplicate, forget_signatures, orphaned_duplicates, readmit_duplicates, record_signatures
+from backend.file_lock import InterProcessLock
+from backend.embedder import (
+    DIMENSION_KEY, FINGERPRINT_KEY, EmbeddingMismatch,
+    check_fingerprint, embed_fingerprint, embed_texts, stamp_fingerprint,
+)
+from backend.vector_store import SHADOW_MARKER, get_vector_store
+from backend.jobs import Job, JobCancelled, JobFailed, job_queue, PRIORITY_DEFAULT, PRIORITY_INGEST
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+EMBED_BATCH_SIZE = 10
+LOCK_DIR = APP_DIR / "locks"
+
+
+def _noop(event: dict):
+    pass
+
+
+def _set_summary(collection_name: str, source: str, summary: str):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("UPDATE documents SET summary = ? WHERE collection_name = ? AND source = ?",
+              (summary, collection_name, source))
+    conn.commit()
+    conn.close()
+
+
+def _indexed_chunks(collection_name: str, source: str) -> tuple[List[str], list]:
+    """A document's stored chunks and their embeddings, in document order."""
+    collection = get_vector_store().get_collection(name=collection_name)
+    result = collection.get(where={"source": source}, include=["documents", "metadatas", "embeddings"])
+    metadatas = result.get("metadatas") or [{} for _ in result["ids"]]
+    order = sorted(range(len(result["ids"])), key=lambda i: (metadatas[i] or {}).get("chunk_index", i))
+    return [result["documents"][i] for i in order], [result["embeddings"][i] for i in order]
+
+
+def _summarize_job(job: Job):
+    from backend.rag_engine import summarize_by_coverage, summarize_text
+    payload = job.payload
+    c_name, f_name, source = payload["collection_name"], payload["filename"], payload["source"]
+    logger.info(f"Summarizing {f_name} (job {job.id}, task {job.task_id})")
+
+    chunks, embeddings = [], []
+    if settings.SUMMARY_MODE in ("auto", "coverage"):
+        # Reuses the embeddings computed at upload; no extra model calls to pick what to read.
+        try:
+            chunks, embeddings = _indexed_chunks(c_name, source)
+        except Exception as e:
+            logger.warning(f"Falling back to sequential summary for {f_name}: {e}")
+    covered = settings.SUMMARY_CHUNK_SIZE * settings.SUMMARY_MAX_CHUNKS
+    use_coverage = len(chunks) > settings.SUMMARY_MAX_CHUNKS and (
+        settings.SUMMARY_MODE == "coverage" or sum(len(chunk) for chunk in chunks) > covered
+    )
+    try:
+        if use_coverage:
+            summary = summarize_by_coverage(chunks, embeddings, task_id=job.task_id, checkpoint=job.checkpoint)
+        else:
+            text = load_document(payload["path"])
+            summary = summarize_text(text, task_id=job.task_id, checkpoint=job.checkpoint)
+    except JobCancelled:
+        _set_summary(c_name, source, "Summary cancelled.")
+        raise
+    except Exception:
+        # Earlier attempts leave "in progress" in place; the queue retries them.
+        if job.last_attempt:
+            _set_summary(c_name, source, "Summary generation failed.")
+        raise
+    _set_summary(c_name, source, summary)
+
+    conn = get_db_connection()
+    c = conn.cursor()
+    if job.task_id:
+        c.execute("UPDATE notifications SET progress = 100, status = 'completed', message = ? WHERE task_id = ?",
+                  (f"Summary ready: {f_name}", job.task_id))
+    conn.commit()
+    conn.close()
+    logger.info(f"Completed background summary for {f_name}")
+
+
+def _update_notification(task_id: Optional[str], progress: int, status: str = "processing", message: Optional[str] = None):
+    if not task_id:
+        return
+    conn = get_db_connection()
+    c = conn.cursor()
+    if message:
+        c.execute("UPDATE notifications SET progress = ?, status = ?, message = ? WHERE task_id = ?",
+                  (progress, status, message, task_id))
+    else:
+        c.execute("UPDATE notifications SET progress = ?, status = ? WHERE task_id = ?", (progress, status, task_id))
+    conn.commit()
+    conn.close()
+
+
+_collection_locks = {}
+_collection_locks_guard = threading.Lock()
+
+
+@contextmanager
+def collection_lock(collection_name: str):
+    """
+    Serializes writes to one collection (uploads, deletes, re-index swaps) across job workers,
+    API worker processes and the CLI. Reentrant within a thread.
+    """
+    with _collection_locks_guard:
+        lock = _collection_locks.get(collection_name)
+        if lock is None:
+            lock = _collection_locks[collection_name] = InterProcessLock(LOCK_DIR / f"{collection_name}.lock")
+    with lock:
+        yield
+
+
+def prepare_collection(collection_name: str):
+    """
+    Gets or creates a collection for writing, refusing one built by another embedding model.
+    Collections without a fingerprint are stamped with the current model on first write,
+    after checking that any vector already stored has the same dimension.
+    """
+    collection = get_vector_store().get_or_create_collection(name=collection_name)
+    metadata = collection.metadata or {}
+    check_fingerprint(collection_name, metadata)
+    if FINGERPRINT_KEY not in metadata:
+        sample = collection.get(limit=1, include=["embeddings"])
+        embeddings = sample.get("embeddings")
+        if embeddings is not None and len(embeddings) and len(embeddings[0]) != embed_fingerprint()[DIMENSION_KEY]:
+            raise EmbeddingMismatch(
+                f"Collection {collection_name} has {len(embeddings[0])}-dim vectors but the embedding model "
+                f"produces {embed_fingerprint()[DIMENSION_KEY]}; re-index it"
+            )
+        stamp_fingerprint(collection)
+    return collection
+
+
+def _sources(collection) -> List[str]:
+    metadatas = collection.get(include=["metadatas"]).get("metadatas") or []
+    return list(dict.fromkeys(m["source"] for m in metadatas if m and m.get("source")))
+
+
+def _copy_sources(source_collection, target, sources: List[str], job: Optional[Job] = None, task_id: Optional[str] = None) -> int:
+    """Re-embeds the stored chunks of `sources` into `target`, keeping ids, texts and metadata."""
+    copied = 0
+    for n, source in enumerate(sources, start=1):
+        stored = source_collection.get(where={"source": source}, include=["documents", "metadatas"])
+        for i in range(0, len(stored["ids"]), EMBED_BATCH_SIZE):
+            documents = stored["documents"][i:i + EMBED_BATCH_SIZE]
+            target.add(
+                ids=stored["ids"][i:i + EMBED_BATCH_SIZE],
+                documents=documents,
+                embeddings=embed_texts(documents),
+                metadatas=stored["metadatas"][i:i + EMBED_BATCH_SIZE],
+            )
+        copied += len(stored["ids"])
+        if job:
+            progress = int(n / len(sources) * 100)
+            _update_notification(task_id, min(progress, 99))
+            job.checkpoint(progress)
+    return copied
+
+
+def _replace_collection(job: Job, collection_name: str, fill: Callable[[object], dict]) -> dict:
+    """
+    Builds a replacement for `collection_name` in a shadow collection while the current one keeps
+    serving, then swaps the alias atomically. Documents uploaded or deleted during the build are
+    reconciled under the collection lock just before the swap.
+    """
+    store = get_vector_store()
+    physical = store.resolve(collection_name)
+    store.get_collection(name=collection_name)  # Fails early if the collection is gone
+    shadow_name = f"{collection_name}{SHADOW_MARKER}{job.id}"
+    try:
+        store.delete_physical_collection(shadow_name)  # Left behind by an interrupted attempt
+    except Exception:
+        pass
+    shadow = store.create_collection(name=shadow_name, backend=store.backend_for(physical))
+    stamp_fingerprint(shadow)
+    swapped = False
+    try:
+        stats = fill(shadow)
+        with collection_lock(collection_name):
+            current = store.get_collection(name=collection_name)
+            current_sources = _sources(current)
+            shadow_sources = set(_sources(shadow))
+            late = [source for source in current_sources if source not in shadow_sources]
+            for source in shadow_sources.difference(current_sources):
+                shadow.delete(where={"source": source})
+            stats["late_sources"] = len(late)
+            _copy_sources(current, shadow, late)
+            previous = store.swap_collection(collection_name, shadow_name)
+            swapped = True
+            bump_collection_version(collection_name)
+    except BaseException:
+        # Once swapped, the shadow is the live collection and the previous one is unreferenced.
+        store.delete_physical_collection(previous if swapped else shadow_name)
+        raise
+    store.delete_physical_collection(previous)
+    return stats
+
+
+def _rebuild_job(job: Job) -> dict:
+    """Re-chunks and re-embeds every document of a collection from the extracted-text cache."""
+    collection_name = job.payload["collection_name"]
+    upload_dir = APP_DIR / "uploads"
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT id, filename, source, file_hash FROM documents WHERE collection_name = ? AND source IS NOT NULL ORDER BY id",
+              (collection_name,))
+    documents = c.fetchall()
+    conn.close()
+    logger.info(f"Rebuilding {collection_name}: {len(documents)} documents (job {job.id})")
+
+    def fill(shadow) -> dict:
+        rebuilt, total_chunks, duplicates, failed = 0, 0, 0, []
+        rebuilt_sources = []
+        for n, (doc_id, filename, source, file_hash) in enumerate(documents, start=1):
+            path = upload_dir / source
+            if not file_hash and path.exists():
+                # Uploaded before hashes were recorded; hash now so the text is cached from here on.
+                file_hash = hash_file(path)
+                conn = get_db_connection()
+                conn.execute("UPDATE documents SET file_hash = ? WHERE id = ?", (file_hash, doc_id))
+                conn.commit()
+                conn.close()
+
+            chunks, chunk_metadata = load_chunks_cached(str(path), file_hash)
+            if not chunks:
+                # Its existing chunks are carried over (re-embedded) when the shadow is reconciled.
+                failed.append(filename)
+            else:
+                ids, metadatas = chunk_records(filename, source, chunks, file_hash, chunk_metadata)
+                dedup = deduplicate(collection_name, ids, chunks, metadatas, exclude_sources=(source,))
+                ids, chunks, metadatas = dedup["ids"], dedup["chunks"], dedup["metadatas"]
+                embeddings = []
+                for i in range(0, len(chunks), EMBED_BATCH_SIZE):
+                    embeddings.extend(embed_texts(chunks[i:i + EMBED_BATCH_SIZE]))
+                shadow.add(documents=chunks, embeddings=embeddings, metadatas=metadatas, ids=ids)
+                # Refreshed as each document is rebuilt, so later documents are compared against its new chunks.
+                forget_signatures(collection_name, source)
+                record_signatures(collection_name, source, dedup["signatures"], dedup["dropped"])
+                rebuilt_sources.append(source)
+                rebuilt += 1
+                total_chunks += len(chunks)
+                duplicates += dedup["duplicates"]
+
+            progress = int(n / len(documents) * 100)
+            _update_notification(job.task_id, min(progress, 99))
+            job.checkpoint(progress)
+        # Once every document has its new chunks: a rebuilt one may no longer hold text others dropped as copies.
+        # Only into rebuilt documents; the others are carried over whole when the shadow is reconciled.
+        for source in rebuilt_sources:
+            total_chunks += restore_duplicates(shadow, collection_name, source, rebuilt_sources)
+        return {"documents": rebuilt, "chunks": total_chunks, "duplicates": duplicates, "failed": failed}
+
+    stats = _replace_collection(job, collection_name, fill)
+    message = f"Rebuilt {collection_name}: {stats['documents']} documents, {stats['chunks']} chunks"
+    if stats["duplicates"]:
+        message += f", {stats['duplicates']} near-duplicate chunks skipped"
+    if stats["failed"]:
+        message += f" ({len(stats['failed'])} re-embedded without re-chunking: {', '.join(stats['failed'][:5])})"
+    _update_notification(job.task_id, 100, "completed", message)
+    logger.info(message)
+    return {"collection_name": collection_name, **stats}
+
+
+def _reindex_job(job: Job) -> dict:
+    """Re-embeds the stored chunks of a collection with the current embedding model."""
+    collection_name = job.payload["collection_name"]
+    current = get_vector_store().get_collection(name=collection_name)
+    sources = _sources(current)
+    logger.info(f"Re-indexing {collection_name}: {len(sources)} documents (job {job.id})")
+
+    def fill(shadow) -> dict:
+        return {"documents": len(sources), "chunks": _copy_sources(current, shadow, sources, job, job.task_id)}
+
+    stats = _replace_collection(job, collection_name, fill)
+    message = f"Re-indexed {collection_name}: {stats['documents']} documents, {stats['chunks']} chunks"
+    _update_notification(job.task_id, 100, "completed", message)
+    logger.info(message)
+    return {"collection_name": collection_name, **stats}
+
+
+def _ingest_job(job: Job) -> dict:
+    payload = job.payload
+    try:
+        return index_document(
+            payload["collection_name"],
+            payload["orig_name"],
+            payload["new_name"],
+            payload["path"],
+            should_summarize=payload.get("should_summarize", False),
+            file_hash=payload.get("file_hash"),
+            emit=job.emit,
+            progress_prefix=payload.get("progress_prefix", ""),
+            checkpoint=job.checkpoint,
+            # A retried or crash-recovered job may have stored part of its work already.
+            replace_existing=job.attempts > 1,
+            replaces=payload.get("replaces"),
+        )
+    except EmbeddingMismatch as e:
+        raise JobFailed(str(e)) from e
+
+
+def enqueue_summary(collection_name: str, filename: str, source: str, path: str) -> tuple[int, str]:
+    task_id = str(uuid.uuid4())
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("INSERT INTO notifications (message, type, task_id, progress, status) VALUES (?, ?, ?, ?, ?)",
+              (f"Summarization started for {filename}", "info", task_id, 0, "processing"))
+    conn.commit()
+    conn.close()
+    job_id = job_queue.enqueue(
+        "summarize",
+        {"collection_name": collection_name, "filename": filename, "source": source, "path": path},
+        priority=PRIORITY_DEFAULT,
+        task_id=task_id,
+    )
+    return job_id, task_id
+
+
+def _enqueue_collection_job(kind: str, collection_name: str, message: str) -> tuple[int, str]:
+    """Queues a whole-collection job, or returns the one of that kind already queued or running."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT id, task_id FROM jobs
+        WHERE kind = ? AND status IN ('queued', 'running') AND json_extract(payload, '$.collection_name') = ?
+    ''', (kind, collection_name))
+    row = c.fetchone()
+    if row:
+        conn.close()
+        return row[0], row[1]
+    task_id = str(uuid.uuid4())
+    c.execute("INSERT INTO notifications (message, type, task_id, progress, status) VALUES (?, ?, ?, ?, ?)",
+              (message, "info", task_id, 0, "processing"))
+    conn.commit()
+    conn.close()
+    job_id = job_queue.enqueue(kind, {"collection_name": collection_name}, priority=PRIORITY_DEFAULT, task_id=task_id)
+    return job_id, task_id
+
+
+def enqueue_rebuild(collection_name: str) -> tuple[int, str]:
+    return _enqueue_collection_job("rebuild", collection_name, f"Rebuilding {collection_name}")
+
+
+def enqueue_reindex(collection_name: str) -> tuple[int, str]:
+    return _enqueue_collection_job("reindex", collection_name, f"Re-indexing {collection_name}")
+
+
+def enqueue_ingest(collection_name: str, orig_name: str, new_name: str, path: str, should_summarize: bool,
+                   file_hash: Optional[str] = None, progress_prefix: str = "",
+                   listener: Optional[Callable[[dict], None]] = None, replaces: Optional[str] = None) -> int:
+    return job_queue.enqueue(
+        "ingest",
+        {
+            "collection_name": collection_name,
+            "orig_name": orig_name,
+            "new_name": new_name,
+            "path": path,
+            "should_summarize": should_summarize,
+            "file_hash": file_hash,
+            "progress_prefix": progress_prefix,
+            "replaces": replaces,
+        },
+        priority=PRIORITY_INGEST,
+        listener=listener,
+    )
+
+
+def source_name(orig_name: str, collection_name: str, suffix: str) -> str:
+    """Stored file name (and chunk `source`) for an indexed document: `{safe_name}_{collection}_{suffix}{ext}`."""
+    original_name, ext = os.path.splitext(orig_name)
+    safe_name = "".join([c for c in original_name if c.isalnum() or c in (' ', '-', '_')]).strip()
+    return f"{safe_name}_{collection_name}_{suffix}{ext}"
+
+
+def chunk_records(orig_name: str, source: str, chunks: List[str], file_hash: Optional[str] = None,
+                  extra: Optional[List[dict]] = None) -> tuple[List[str], List[dict]]:
+    """Ids and metadata for a document's chunks, in the layout retrieval and merging expect."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    ids = [f"{source}_{i}" for i in range(len(chunks))]
+    metadatas = []
+    for i in range(len(chunks)):
+        metadata = {
+            "source": source,
+            "original_name": orig_name,
+            "chunk_index": i,
+            "total_chunks": len(chunks),
+            "upload_timestamp": timestamp
+        }
+        if file_hash:
+            metadata["file_hash"] = file_hash
+        if extra:
+            metadata.update(extra[i])
+        metadatas.append(metadata)
+    return ids, metadatas
+
+
+def record_document(collection_name: str, orig_name: str, source: str, file_hash: Optional[str], summary: str):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO documents (collection_name, filename, summary, source, file_hash) VALUES (?, ?, ?, ?, ?)",
+                   (collection_name, orig_name, summary, source, file_hash))
+    conn.commit()
+    conn.close()
+
+
+def clear_document(collection, collection_name: str, source: str):
+    """Removes any chunks and `documents` row already stored for `source` (e.g. by an interrupted run)."""
+    collection.delete(where={"source": source})
+    forget_signatures(collection_name, source)
+    conn = get_db_connection()
+    conn.execute("DELETE FROM documents WHERE collection_name = ? AND source = ?", (collection_name, source))
+    conn.commit()
+    conn.close()
+
+
+def restore_duplicates(collection, collection_name: str, keeper: str, sources: Optional[List[str]] = None) -> int:
+    """
+    Puts back chunks (of `sources`, default all documents) collection-scope dedup dropped as
+    copies of `keeper`'s that no remaining document holds once `keeper` is deleted or replaced;
+    returns how many. Caller holds collection_lock(collection_name) and has already updated
+    `keeper`'s signatures.
+    """
+    orphans = orphaned_duplicates(collection_name, keeper, sources)
+    if not orphans:
+        return 0
+    documents = [orphan["document"] for orphan in orphans]
+    embeddings = []
+    for i in range(0, len(documents), EMBED_BATCH_SIZE):
+        embeddings.extend(embed_texts(documents[i:i + EMBED_BATCH_SIZE]))
+    collection.add(
+        documents=documents,
+        embeddings=embeddings,
+        metadatas=[orphan["metadata"] for orphan in orphans],
+        ids=[orphan["id"] for orphan in orphans]
+    )
+    readmit_duplicates(collection_name, orphans)
+    logger.info(f"Restored {len(orphans)} chunks of {collection_name} that duplicated {keeper}")
+    return len(orphans)
+
+
+def _delete_document_locked(collection, collection_name: str, source: str) -> dict:
+    # Caller holds collection_lock(collection_name).
+    ids = collection.get(where={"source": source}, include=[])["ids"]
+    if ids:
+        collection.delete(ids=ids)
+    forget_signatures(collection_name, source)
+    restore_duplicates(collection, collection_name, source)
+
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT file_hash FROM documents WHERE collection_name = ? AND source = ?", (collection_name, source))
+    hashes = {row[0] for row in c.fetchall() if row[0]}
+    c.execute("DELETE FROM documents WHERE collection_name = ? AND source = ?", (collection_name, source))
+    rows = c.rowcount
+    c.execute('''
+        SELECT id FROM jobs
+        WHERE kind = 'summarize' AND status IN ('queued', 'running')
+          AND json_extract(payload, '$.collection_name') = ? AND json_extract(payload, '$.source') = ?
+    ''', (collection_name, source))
+    summary_jobs = [row[0] for row in c.fetchall()]
+    # Cached text is shared by every upload of the same content, in any collection.
+    orphaned = []
+    for file_hash in hashes:
+        c.execute("SELECT 1 FROM documents WHERE file_hash = ? LIMIT 1", (file_hash,))
+        if not c.fetchone():
+            orphaned.append(file_hash)
+    # A snapshot imported under another name shares stored uploads with the collection it came from.
+    c.execute("SELECT 1 FROM documents WHERE source = ? LIMIT 1", (source,))
+    upload_shared = c.fetchone() is not None
+    conn.commit()
+    conn.close()
+
+    for job_id in summary_jobs:
+        job_queue.cancel(job_id)
+    for file_hash in orphaned:
+        remove_extracted(file_hash)
+    if not upload_shared:
+        try:
+            os.remove(APP_DIR / "uploads" / source)
+        except OSError:
+            pass
+    logger.info(f"Deleted {source} from {collection_name}: {len(ids)} chunks, {rows} document rows")
+    return {"source": source, "chunks": len(ids), "documents": rows}
+
+
+def delete_document(collection_name: str, source: str) -> dict:
+    """
+    Removes one document from a collection: its chunks, `documents` row, pending summary,
+    cached text (if no other document shares it) and stored upload, as one locked operation.
+    """
+    with collection_lock(collection_name):
+        collection = get_vector_store().get_collection(name=collection_name)
+        result = _delete_document_locked(collection, collection_name, source)
+        if result["chunks"] or result["documents"]:
+            bump_collection_version(collection_name)
+    return result
+
+
+def index_document(
+    collection_name: str,
+    orig_name: str,
+    new_name: str,
+    path: str,
+    should_summarize: bool = False,
+    file_hash: Optional[str] = None,
+    emit: Callable[[dict], None] = _noop,
+    progress_prefix: str = "",
+    checkpoint: Optional[Callable[[Optional[int]], None]] = None,
+    replace_existing: bool = False,
+    replaces: Optional[str] = None,
+) -> dict:
+    """
+    Parses, chunks, embeds and stores one uploaded file, then records it in `documents`.
+    With `replaces`, that document is deleted in the same locked step the new one is stored.
+    Progress is reported through `emit` as the upload NDJSON events; returns the per-file result.
+    Blocking: runs on a job worker (see enqueue_ingest), not the event loop.
+    """
+    emit({"status": "loading", "message": f"{progress_prefix} Upload Started..."})
+
+    chunks, chunk_metadata = load_chunks_cached(path, file_hash)
+    if not chunks:
+        logger.error(f"Failed to extract text: {new_name}")
+        emit({"status": "error", "message": f"{progress_prefix} Failed to extract text"})
+        return {"file": orig_name, "status": "failed", "error": "No text extracted"}
+
+    emit({"status": "loading", "message": f"{progress_prefix} Found {sum(len(c) for c in chunks)} characters in document"})
+
+    emit({"status": "chunking", "message": f"{progress_prefix} Chunked into {len(chunks)} documents"})
+
+    prepare_collection(collection_name)
+    ids, metadatas = chunk_records(orig_name, new_name, chunks, file_hash, chunk_metadata)
+    dedup = deduplicate(collection_name, ids, chunks, metadatas, exclude_sources=(new_name, replaces),
+                        embed_batch=EMBED_BATCH_SIZE)
+    ids, chunks, metadatas = dedup["ids"], dedup["chunks"], dedup["metadatas"]
+    if dedup["duplicates"]:
+        in_collection = f", {dedup['collection_duplicates']} already in the collection" if dedup["collection_duplicates"] else ""
+        emit({
+            "status": "deduplicating",
+            "duplicates": dedup["duplicates"],
+            "embed_calls_saved": dedup["embed_calls_saved"],
+            "message": f"{progress_prefix} Skipped {dedup['duplicates']} near-duplicate chunks{in_collection}; "
+                       f"embedding calls saved: {dedup['embed_calls_saved']}"
+        })
+
+    # Batch Embedding with granular progress
+    total_chunks = len(chunks)
+    all_embeddings = []
+    for i in range(0, total_chunks, EMBED_BATCH_SIZE):
+        batch_chunks = chunks[i : i + EMBED_BATCH_SIZE]
+        all_embeddings.extend(embed_texts(batch_chunks))
+
+        current_count = min(i + EMBED_BATCH_SIZE, total_chunks)
+        if checkpoint:
+            checkpoint(int(current_count / total_chunks * 90))
+        emit({
+            "status": "embedding",
+            "progress": f"{current_count}/{total_chunks}",
+            "message": f"{progress_prefix} Embedding {current_count}/{total_chunks} documents"
+        })
+
+    emit({"status": "saving", "message": f"{progress_prefix} Saving to ChromaDB..."})
+
+    with collection_lock(collection_name):
+        # Resolved under the lock: a re-index may have swapped the collection while this file was embedding.
+        collection = get_vector_store().get_collection(name=collection_name)
+        if replace_existing:
+            clear_document(collection, collection_name, new_name)
+        collection.add(
+            documents=chunks,
+            embeddings=all_embeddings,
+            metadatas=metadatas,
+            ids=ids
+        )
+        record_signatures(collection_name, new_name, dedup["signatures"], dedup["dropped"])
+        if replace_existing:
+            restore_duplicates(collection, collection_name, new_name)
+        bump_collection_version(collection_name)
+
+        record_document(collection_name, orig_name, new_name, file_hash,
+                        "Summary generation in progress..." if should_summarize else "No summary requested.")
+        if replaces and replaces != new_name:
+            _delete_document_locked(collection, collection_name, replaces)
+
+    if should_summarize:
+        _, task_id = enqueue_summary(collection_name, orig_name, new_name, path)
+        emit({"status": "summary_started", "message": f"Summarization started for {orig_name}", "task_id": task_id})
+
+    emit({"status": "completed", "message": f"{progress_prefix} Done!"})
+    return {
+        "file": orig_name,
+        "status": "success",
+        "chunks": len(chunks),
+        "duplicates": dedup["duplicates"],
+        "embed_calls_saved": dedup["embed_calls_saved"],
+    }
+
+
+# Ingestion, rebuilds and re-indexes embed with the single embedding model and summaries drive the chat model,
+# so each kind runs one job at a time regardless of the worker pool size.
+job_queue.register("ingest", _ingest_job, max_concurrency=1)
+job_queue.register("summarize", _summarize_job, max_concurrency=1)
+job_queue.register("rebuild", _rebuild_job, max_concurrency=1)
+job_queue.register("reindex", _reindex_job, max_concurrency=1)
@@ -1,13 +1,18 @@
-import fitz  # PyMuPDF
-import pandas as pd
-from pptx import Presentation
-from docx import Document
+# Parsers (fitz, pandas, pptx, docx, openpyxl) are imported by the branch that needs them:
+# together they add seconds to startup, and most files only need one of them.
 import os
+from typing import Iterable, Iterator, List, Optional, Tuple
 from backend.config import settings
 from backend.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+SUPPORTED_EXTENSIONS = (".pdf", ".xlsx", ".xls", ".csv", ".docx", ".doc", ".pptx", ".ppt", ".txt")
+TABLE_EXTENSIONS = (".xlsx", ".xls", ".csv")
+
+# Rows read per block from CSV files
+TABLE_READ_ROWS = 5000
+
 def load_document(file_path: str) -> str:
     logger.info(f"Loading document: {file_path}")
     ext = os.path.splitext(file_path)[1].lower()
@@ -15,19 +20,18 @@ def load_document(file_path: str) -> str:
     
     try:
         if ext == ".pdf":
+            import fitz  # PyMuPDF
             doc = fitz.open(file_path)
             for page in doc:
                 text += page.get_text()
-        elif ext in [".xlsx", ".xls"]:
-            df = pd.read_excel(file_path)
-            text = df.to_string()
-        elif ext == ".csv":
-            df = pd.read_csv(file_path)
-            text = df.to_string()
+        elif ext in TABLE_EXTENSIONS:
+            text = "\n\n".join(chunk for chunk, _ in iter_table_chunks(file_path))
         elif ext in [".docx", ".doc"]:
+            from docx import Document
             doc = Document(file_path)
             text = "\n".join([para.text for para in doc.paragraphs])
         elif ext in [".pptx", ".ppt"]:
+            from pptx import Presentation
             prs = Presentation(file_path)
             for slide in prs.slides:
                 for shape in slide.shapes:
@@ -59,3 +63,163 @@ def split_text(text: str) -> list[str]:
     
     logger.info(f"Created {len(chunks)} chunks")
     return chunks
+
+
+def _clean_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return " ".join(str(value).split()).replace("|", "/")
+
+
+def _iter_csv_rows(file_path: str) -> Iterator[Tuple[Optional[str], int, list]]:
+    import pandas as pd
+    # header=None keeps the header row in the stream so it is handled like a sheet's first row
+    reader = pd.read_csv(file_path, header=None, dtype=str, keep_default_na=False,
+                         chunksize=TABLE_READ_ROWS, encoding_errors="replace")
+    row_number = 0
+    for block in reader:
+        for row in block.itertuples(index=False, name=None):
+            row_number += 1
+            yield None, row_number, list(row)
+
+
+def _iter_excel_rows(file_path: str) -> Iterator[Tuple[Optional[str], int, list]]:
+    if file_path.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                for row_number, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+                    yield sheet.title, row_number, list(row)
+        finally:
+            workbook.close()
+    else:
+        import pandas as pd
+        # Legacy .xls has no streaming reader; these files are capped at 65,536 rows per sheet.
+        sheets = pd.read_excel(file_path, sheet_name=None, header=None, dtype=str, keep_default_na=False)
+        for title, df in sheets.items():
+            for row_number, row in enumerate(df.itertuples(index=False, name=None), start=1):
+                yield str(title), row_number, list(row)
+
+
+def iter_table_rows(file_path: str) -> Iterator[Tuple[Optional[str], List[str], int, str]]:
+    """
+    Streams the non-empty data rows of a CSV or of every sheet in a workbook as
+    (sheet, header, row_number, line). The first non-empty row of each sheet is its header;
+    row numbers are 1-based spreadsheet rows.
+    """
+    rows = _iter_csv_rows(file_path) if file_path.lower().endswith(".csv") else _iter_excel_rows(file_path)
+    current_sheet, header = object(), None
+    for sheet, row_number, values in rows:
+        if sheet != current_sheet:
+            current_sheet, header = sheet, None
+        cells = [_clean_cell(v) for v in values]
+        while cells and not cells[-1]:
+            cells.pop()
+        if not cells:
+            continue
+        if header is None:
+            header = [cell or f"Column {i + 1}" for i, cell in enumerate(cells)]
+            continue
+        yield sheet, header, row_number, " | ".join(cells)
+
+
+def group_table_rows(rows: Iterable[Tuple[Optional[str], List[str], int, str]], max_chars: Optional[int] = None) -> Iterator[Tuple[str, dict]]:
+    """
+    Groups rows into chunks of up to `max_chars`. Each chunk repeats its sheet's column header
+    so it can be read on its own, and carries `sheet`, `row_start` and `row_end` metadata.
+    """
+    max_chars = max_chars or settings.CHUNK_SIZE
+    current_sheet, current_header, lines, size, row_start, row_end = object(), None, [], 0, 0, 0
+
+    def make_chunk():
+        title = f"Sheet: {current_sheet} | " if current_sheet else ""
+        text = f"{title}Rows {row_start}-{row_end}\n{' | '.join(current_header)}\n" + "\n".join(lines)
+        metadata = {"row_start": row_start, "row_end": row_end}
+        if current_sheet:
+            metadata["sheet"] = current_sheet
+        return text, metadata
+
+    for sheet, header, row_number, line in rows:
+        if sheet != current_sheet or (lines and size + len(line) > max_chars):
+            if lines:
+                yield make_chunk()
+            lines, size = [], 0
+        current_sheet, current_header = sheet, header
+        if not lines:
+            row_start = row_number
+        lines.append(line)
+        size += len(line) + 1
+        row_end = row_number
+    if lines:
+        yield make_chunk()
+
+
+def iter_table_chunks(file_path: str, max_chars: Optional[int] = None) -> Iterator[Tuple[str, dict]]:
+    """Streams a CSV or every sheet of a workbook as header-aware row-group chunks."""
+    return group_table_rows(iter_table_rows(file_path), max_chars)
+
+
+def is_table(file_path: str) -> bool:
+    return os.path.splitext(file_path)[1].lower() in TABLE_EXTENSIONS
+
+
+def extract_document(file_path: str) -> Optional[dict]:
+    """
+    The expensive, chunking-independent part of ingestion for text documents. Returns None if
+    nothing could be extracted. The result is JSON-serializable so it can be cached (see
+    backend/text_cache.py). Spreadsheets are not extracted as a whole; see chunk_table_rows().
+    """
+    text = load_document(file_path)
+    return {"kind": "text", "text": text} if text else None
+
+
+def chunk_table_rows(rows: Iterable[Tuple[Optional[str], List[str], int, str]], file_path: str) -> Tuple[List[str], List[dict]]:
+    """
+    Row-group chunks, with their metadata, from streamed table rows (iter_table_rows() or the
+    text cache); rows are consumed one at a time. A read error drops the whole table.
+    """
+    chunks, metadatas = [], []
+    try:
+        for chunk, metadata in group_table_rows(rows):
+            chunks.append(chunk)
+            metadatas.append(metadata)
+    except Exception as e:
+        logger.error(f"Error loading {file_path}: {e}")
+        return [], []
+    logger.info(f"Created {len(chunks)} row-group chunks")
+    return chunks, metadatas
+
+
+def chunk_extracted(extracted: Optional[dict]) -> Tuple[List[str], List[dict]]:
+    """
+    Chunks for indexing, with per-chunk extra metadata, from extract_document() output or a
+    table cached whole by an earlier version.
+    """
+    if not extracted:
+        return [], []
+    if extracted["kind"] == "text":
+        chunks = split_text(extracted["text"])
+        # Characters each chunk repeats from the previous one, so retrieval can stitch neighbours back exactly.
+        overlap = max(settings.CHUNK_OVERLAP, 0)
+        return chunks, [{"overlap": min(overlap, len(chunk))} if i else {} for i, chunk in enumerate(chunks)]
+
+    rows = (
+        (sheet["sheet"], sheet["header"], row_number, line)
+        for sheet in extracted["sheets"]
+        for row_number, line in sheet["rows"]
+    )
+    return chunk_table_rows(rows, "cached table")
+
+
+def load_chunks(file_path: str) -> Tuple[List[str], List[dict]]:
+    """
+    Chunks for indexing with per-chunk extra metadata. Spreadsheets are streamed as
+    header-aware row groups; other formats are extracted and split with split_text().
+    """
+    if is_table(file_path):
+        logger.info(f"Streaming table rows: {file_path}")
+        return chunk_table_rows(iter_table_rows(file_path), file_path)
+    return chunk_extracted(extract_document(file_path))
@@ -0,0 +1,121 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.config import settings
+from backend.embedder import embed_texts
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Example messages per route; a message goes to the route of its most similar example.
+PROTOTYPES: Dict[str, List[str]] = {
+    "chitchat": [
+        "hi", "hello", "hey there", "good morning", "good evening", "how are you?",
+        "thanks!", "thank you so much", "great, thanks", "ok", "okay cool", "nice",
+        "bye", "see you later", "you are helpful", "that's all for now",
+    ],
+    "history": [
+        "what did we talk about?", "what was my previous question?", "repeat your last answer",
+        "what did you say earlier?", "summarize our conversation so far", "can you say that again?",
+        "go back to my first question", "what did I ask before?", "explain your previous answer in simpler words",
+    ],
+    "knowledge": [
+        "what does the policy say about leave?", "how do I configure the system?",
+        "explain the process for submitting an expense claim", "what are the requirements for approval?",
+        "who is responsible for this project?", "when is the deadline for the report?",
+        "list the key findings of the document", "what is the difference between the two plans?",
+        "summarize the contract terms", "how many days of vacation do employees get?",
+    ],
+}
+RETRIEVAL_ROUTES = ("knowledge",)
+
+
+class IntentRouter:
+    """
+    Routes a chat message to chitchat, history or knowledge by cosine similarity between its
+    embedding and the PROTOTYPES examples. Only a confident non-knowledge match (score above
+    `threshold` and ahead of the best knowledge example by `margin`) skips retrieval, so
+    ambiguous messages keep today's behaviour.
+    """
+
+    def __init__(self, threshold: float, margin: float):
+        self.threshold = threshold
+        self.margin = margin
+        self._labels: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        # Moving average of retrieval time, used to estimate what a skip saves
+        self._retrieval_seconds: Optional[float] = None
+        self.skipped = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(rows) -> np.ndarray:
+        rows = np.asarray(rows, dtype=np.float32)
+        norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+        return rows / np.where(norms > 0, norms, 1.0)
+
+    def _prototypes(self) -> Tuple[List[str], np.ndarray]:
+        with self._lock:
+            if self._matrix is None:
+                labels = [route for route, examples in PROTOTYPES.items() for _ in examples]
+                texts = [text for examples in PROTOTYPES.values() for text in examples]
+                self._matrix = self._normalize(embed_texts(texts))
+                self._labels = labels
+                logger.info(f"Intent router prototypes embedded: {len(texts)} examples")
+            return self._labels, self._matrix
+
+    def route(self, embedding: List[float]) -> Tuple[str, Dict[str, float]]:
+        """Returns (route, best similarity per route) for a message embedding."""
+        labels, matrix = self._prototypes()
+        similarities = matrix @ self._normalize(embedding)
+        scores: Dict[str, float] = {}
+        for label, score in zip(labels, similarities.tolist()):
+            scores[label] = max(scores.get(label, -1.0), score)
+        best = max(scores, key=scores.get)
+        if best in RETRIEVAL_ROUTES:
+            return best, scores
+        if scores[best] < self.threshold or scores[best] - scores.get("knowledge", -1.0) < self.margin:
+            return "knowledge", scores
+        return best, scores
+
+    def record_retrieval(self, seconds: float):
+        with self._lock:
+            if self._retrieval_seconds is None:
+                self._retrieval_seconds = seconds
+            else:
+                self._retrieval_seconds = 0.8 * self._retrieval_seconds + 0.2 * seconds
+
+    def record_skip(self) -> float:
+        """Counts a skipped retrieval; returns the estimated seconds it saved."""
+        with self._lock:
+            saved = self._retrieval_seconds or 0.0
+            self.skipped += 1
+            self.saved_seconds += saved
+            return saved
+
+
+intent_router = IntentRouter(
+    threshold=settings.INTENT_ROUTER_THRESHOLD,
+    margin=settings.INTENT_ROUTER_MARGIN,
+)
+
+
+def route_message(message: str, embedding: List[float]) -> str:
+    """Routes one message and logs the decision; falls back to knowledge on any error."""
+    started = time.perf_counter()
+    try:
+        route, scores = intent_router.route(embedding)
+    except Exception as e:
+        logger.error(f"Intent routing failed, defaulting to knowledge: {e}")
+        return "knowledge"
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        f"Intent routed to {route} in {elapsed_ms:.1f}ms | "
+        + ", ".join(f"{label}={score:.2f}" for label, score in scores.items())
+        + f" | message={message[:60]!r}"
+    )
+    return route
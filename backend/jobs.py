@@ -0,0 +1,364 @@
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from backend.config import settings
+from backend.database import get_db_connection
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+PRIORITY_INGEST = 10
+PRIORITY_DEFAULT = 0
+PRIORITY_LOW = -10
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+_NO_LIMIT = 1 << 30
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobFailed(Exception):
+    """Raised by a handler for errors that retrying cannot fix; the job fails on this attempt."""
+
+
+class Job:
+    """Handle passed to job handlers: payload access, progress reporting and cancellation checks."""
+
+    def __init__(self, queue: "JobQueue", job_id: int, kind: str, payload: dict, task_id: Optional[str], attempts: int,
+                 max_attempts: int):
+        self.queue = queue
+        self.id = job_id
+        self.kind = kind
+        self.payload = payload
+        self.task_id = task_id
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+
+    @property
+    def last_attempt(self) -> bool:
+        """True if a retryable failure of this attempt will not be retried."""
+        return self.attempts >= self.max_attempts
+
+    def emit(self, event: dict):
+        """Forwards a progress event to in-process listeners (e.g. an upload response stream)."""
+        self.queue._notify(self.id, event)
+
+    def cancel_requested(self) -> bool:
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,))
+        row = c.fetchone()
+        conn.close()
+        return bool(row and row[0])
+
+    def checkpoint(self, progress: Optional[int] = None):
+        """Records progress and raises JobCancelled if a cancel was requested."""
+        if progress is not None:
+            conn = get_db_connection()
+            c = conn.cursor()
+            c.execute("UPDATE jobs SET progress = ? WHERE id = ?", (progress, self.id))
+            conn.commit()
+            conn.close()
+        if self.cancel_requested():
+            raise JobCancelled()
+
+
+class JobQueue:
+    """
+    Durable job queue backed by the `jobs` table with a fixed pool of worker threads.
+    Jobs are claimed by priority (highest first), then age. Each kind can cap how many of its
+    jobs run at once, so e.g. only one job drives the chat model at a time; the cap is checked
+    against the table, so it also holds across API worker processes.
+    Failed jobs are retried up to `max_attempts`, each retry waiting twice as long as the one before
+    (JOB_RETRY_DELAY_SECONDS, capped at JOB_RETRY_MAX_DELAY_SECONDS) so a transient error such as a
+    locked database or a model reload does not use up every attempt at once. Running jobs are
+    requeued on restart by init_sqlite().
+    Each process heartbeats the jobs it runs or owns. Running jobs whose heartbeat is older than
+    JOB_STALE_SECONDS are requeued by any process, so a crashed worker does not keep holding a
+    per-kind slot.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._handlers: Dict[str, Callable[[Job], Optional[dict]]] = {}
+        self._limits: Dict[str, int] = {}
+        self._listeners: Dict[int, List[Callable[[dict], None]]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._running: set = set()
+        self._stopping = False
+
+    def register(self, kind: str, handler: Callable[[Job], Optional[dict]], max_concurrency: Optional[int] = None):
+        self._handlers[kind] = handler
+        if max_concurrency:
+            self._limits[kind] = max_concurrency
+
+    # --- Producer API ---
+
+    def enqueue(self, kind: str, payload: dict, priority: int = PRIORITY_DEFAULT, task_id: Optional[str] = None,
+                max_attempts: Optional[int] = None, listener: Optional[Callable[[dict], None]] = None) -> int:
+        conn = get_db_connection()
+        c = conn.cursor()
+        # A job with a listener must run in this process, where the waiting response can hear it.
+        c.execute(
+            "INSERT INTO jobs (kind, payload, priority, task_id, max_attempts, owner_pid, heartbeat_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+            (kind, json.dumps(payload), priority, task_id, max_attempts or settings.JOB_MAX_ATTEMPTS,
+             os.getpid() if listener else None),
+        )
+        job_id = c.lastrowid
+        conn.commit()
+        conn.close()
+        with self._lock:
+            if listener:
+                self._listeners.setdefault(job_id, []).append(listener)
+            self._wakeup.notify_all()
+        logger.info(f"Enqueued job {job_id} ({kind}, priority={priority})")
+        return job_id
+
+    def cancel(self, job_id: int) -> Optional[str]:
+        """Cancels a queued job immediately, or asks a running job to stop at its next checkpoint."""
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute("SELECT status, task_id FROM jobs WHERE id = ?", (job_id,))
+        row = c.fetchone()
+        if not row:
+            conn.close()
+            return None
+        status, task_id = row
+        if status == "queued":
+            c.execute("UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP WHERE id = ?", (job_id,))
+            if task_id:
+                c.execute("UPDATE notifications SET status = 'cancelled', message = message || ' (cancelled)' WHERE task_id = ?", (task_id,))
+            status = "cancelled"
+        elif status == "running":
+            c.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            status = "cancelling"
+        conn.commit()
+        conn.close()
+        if status == "cancelled":
+            self._notify(job_id, {"job_status": "cancelled"}, final=True)
+        return status
+
+    def retry(self, job_id: int) -> Optional[str]:
+        """Requeues a failed or cancelled job with a fresh attempt budget."""
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute("SELECT status, task_id FROM jobs WHERE id = ?", (job_id,))
+        row = c.fetchone()
+        if not row:
+            conn.close()
+            return None
+        status, task_id = row
+        if status in ("failed", "cancelled"):
+            c.execute('''
+                UPDATE jobs SET status = 'queued', attempts = 0, cancel_requested = 0, error = NULL,
+                    progress = 0, started_at = NULL, finished_at = NULL, owner_pid = NULL, not_before = NULL
+                WHERE id = ?
+            ''', (job_id,))
+            if task_id:
+                c.execute("UPDATE notifications SET status = 'processing', progress = 0 WHERE task_id = ?", (task_id,))
+            status = "queued"
+        conn.commit()
+        conn.close()
+        with self._lock:
+            self._wakeup.notify_all()
+        return status
+
+    def list_jobs(self, limit: int = 50) -> List[dict]:
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute('''
+            SELECT id, kind, priority, status, attempts, max_attempts, progress, error, task_id,
+                   created_at, started_at, finished_at, not_before
+            FROM jobs ORDER BY id DESC LIMIT ?
+        ''', (limit,))
+        rows = c.fetchall()
+        conn.close()
+        keys = ("id", "kind", "priority", "status", "attempts", "max_attempts", "progress", "error", "task_id",
+                "created_at", "started_at", "finished_at", "not_before")
+        return [dict(zip(keys, r)) for r in rows]
+
+    # --- Workers ---
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        logger.info(f"Started {self.workers} job workers")
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def _heartbeat_loop(self):
+        with self._lock:
+            while not self._stopping:
+                running = list(self._running)
+                conn = get_db_connection()
+                c = conn.cursor()
+                c.execute(f'''
+                    UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP
+                    WHERE (status = 'running' AND id IN ({",".join("?" for _ in running) or "NULL"}))
+                       OR (status = 'queued' AND owner_pid = ?)
+                ''', running + [os.getpid()])
+                conn.commit()
+                conn.close()
+                self._wakeup.wait(timeout=settings.JOB_HEARTBEAT_SECONDS)
+
+    def _reclaim_stale(self, c):
+        """Requeues (or fails, when out of attempts or cancelled) jobs left by processes that stopped heartbeating."""
+        stale_before = f"-{int(settings.JOB_STALE_SECONDS)} seconds"
+        c.execute('''
+            SELECT id, task_id, attempts >= max_attempts OR cancel_requested FROM jobs
+            WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < datetime('now', ?)
+        ''', (stale_before,))
+        for job_id, task_id, finished in c.fetchall():
+            logger.warning(f"Job {job_id} stopped heartbeating; its worker process is gone")
+            if finished:
+                c.execute('''
+                    UPDATE jobs SET status = 'failed', error = 'Worker process stopped', owner_pid = NULL,
+                        finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'running'
+                ''', (job_id,))
+                if task_id:
+                    c.execute("UPDATE notifications SET status = 'failed', message = message || ' (interrupted)' WHERE task_id = ?", (task_id,))
+            else:
+                c.execute("UPDATE jobs SET status = 'queued', owner_pid = NULL WHERE id = ? AND status = 'running'", (job_id,))
+        # Queued jobs waiting for a listener in a process that died can run anywhere now.
+        c.execute('''
+            UPDATE jobs SET owner_pid = NULL
+            WHERE status = 'queued' AND owner_pid IS NOT NULL AND owner_pid != ?
+              AND COALESCE(heartbeat_at, created_at) < datetime('now', ?)
+        ''', (os.getpid(), stale_before))
+
+    def _claim(self) -> Optional[Job]:
+        # Called with self._lock held. Running counts come from the jobs table, so per-kind limits
+        # cover every process sharing the database, not just this one.
+        conn = get_db_connection()
+        c = conn.cursor()
+        self._reclaim_stale(c)
+        c.execute("SELECT kind, COUNT(*) FROM jobs WHERE status = 'running' GROUP BY kind")
+        running = dict(c.fetchall())
+        known = [kind for kind in self._handlers if running.get(kind, 0) < self._limits.get(kind, _NO_LIMIT)]
+        if not known:
+            conn.close()
+            return None
+        placeholders = ",".join("?" for _ in known)
+        c.execute(f'''
+            SELECT id, kind, payload, task_id, attempts, max_attempts FROM jobs
+            WHERE status = 'queued' AND kind IN ({placeholders}) AND (owner_pid IS NULL OR owner_pid = ?)
+              AND (not_before IS NULL OR not_before <= datetime('now'))
+            ORDER BY priority DESC, id ASC LIMIT 1
+        ''', known + [os.getpid()])
+        row = c.fetchone()
+        if not row:
+            conn.close()
+            return None
+        job_id, kind, payload, task_id, attempts, max_attempts = row
+        # The limit is re-checked inside the UPDATE; sqlite serializes writers, so two processes
+        # cannot both take the last slot of a kind.
+        c.execute('''
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = CURRENT_TIMESTAMP,
+                heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'queued'
+              AND (SELECT COUNT(*) FROM jobs WHERE kind = ? AND status = 'running') < ?
+        ''', (job_id, kind, self._limits.get(kind, _NO_LIMIT)))
+        claimed = c.rowcount == 1
+        conn.commit()
+        conn.close()
+        if not claimed:
+            return None
+        self._running.add(job_id)
+        return Job(self, job_id, kind, json.loads(payload or "{}"), task_id, attempts + 1, max_attempts)
+
+    def _worker_loop(self):
+        while True:
+            with self._lock:
+                job = None
+                while not self._stopping:
+                    job = self._claim()
+                    if job:
+                        break
+                    # Timeout also picks up jobs enqueued by other processes (e.g. the CLI).
+                    self._wakeup.wait(timeout=2.0)
+                if self._stopping:
+                    return
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._running.discard(job.id)
+                    self._wakeup.notify_all()
+
+    def _run(self, job: Job):
+        logger.info(f"Running job {job.id} ({job.kind}, attempt {job.attempts})")
+        handler = self._handlers[job.kind]
+        status, error, result = "completed", None, None
+        retryable = True
+        try:
+            result = handler(job)
+        except JobCancelled:
+            status = "cancelled"
+        except JobFailed as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            status, error, retryable = "failed", str(e), False
+        except Exception as e:
+            logger.exception(f"Job {job.id} ({job.kind}) failed: {e}")
+            status, error = "failed", str(e)
+
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute("SELECT max_attempts FROM jobs WHERE id = ?", (job.id,))
+        max_attempts = c.fetchone()[0]
+        if status == "failed" and retryable and job.attempts < max_attempts:
+            status = "queued"
+            delay = min(settings.JOB_RETRY_DELAY_SECONDS * 2 ** (job.attempts - 1), settings.JOB_RETRY_MAX_DELAY_SECONDS)
+            c.execute("UPDATE jobs SET status = 'queued', error = ?, not_before = datetime('now', ?) WHERE id = ?",
+                      (error, f"+{int(delay)} seconds", job.id))
+            logger.info(f"Job {job.id} will be retried in {delay:.0f}s ({job.attempts}/{max_attempts})")
+        else:
+            c.execute('''
+                UPDATE jobs SET status = ?, error = ?, progress = CASE WHEN ? = 'completed' THEN 100 ELSE progress END,
+                    finished_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (status, error, status, job.id))
+            if job.task_id and status == "cancelled":
+                c.execute("UPDATE notifications SET status = 'cancelled', message = message || ' (cancelled)' WHERE task_id = ?", (job.task_id,))
+            elif job.task_id and status == "failed":
+                c.execute("UPDATE notifications SET status = 'failed' WHERE task_id = ?", (job.task_id,))
+        conn.commit()
+        conn.close()
+
+        if status in TERMINAL_STATUSES:
+            self._notify(job.id, {"job_status": status, "error": error, "result": result}, final=True)
+
+    def _notify(self, job_id: int, event: dict, final: bool = False):
+        with self._lock:
+            listeners = list(self._listeners.get(job_id, []))
+            if final:
+                self._listeners.pop(job_id, None)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Job listener for {job_id} failed: {e}")
+
+
+job_queue = JobQueue(workers=settings.JOB_WORKERS)
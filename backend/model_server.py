@@ -0,0 +1,197 @@
+"""
+Optional model-server process (INFERENCE_MODE=server).
+
+One process loads the chat and embedding models and serves them to any number of API workers
+over multiprocessing.connection on MODEL_SERVER_HOST:MODEL_SERVER_PORT. Requests are dicts with
+an "op"; chat replies stream as {"chunk": text} messages followed by {"done": stats}, and the
+client stops a chat by sending {"op": "cancel"} or by closing the connection.
+
+main.py starts it automatically; to run it on its own:
+    python -m backend.model_server
+"""
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Generator, List, Optional
+
+from backend.config import settings, APP_DIR
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Shared secret for the connection handshake; only processes that can read APP_DIR may connect.
+AUTHKEY_PATH = APP_DIR / "model_server.key"
+
+
+def _address():
+    return (settings.MODEL_SERVER_HOST, settings.MODEL_SERVER_PORT)
+
+
+def _authkey(create: bool = False) -> bytes:
+    if create and not AUTHKEY_PATH.exists():
+        tmp_path = AUTHKEY_PATH.with_suffix(".tmp")
+        tmp_path.write_bytes(secrets.token_bytes(32))
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, AUTHKEY_PATH)
+    return AUTHKEY_PATH.read_bytes()
+
+
+# --- Client side (API workers) ---
+
+def _connect() -> Connection:
+    try:
+        return Client(_address(), authkey=_authkey())
+    except (OSError, FileNotFoundError) as e:
+        host, port = _address()
+        raise RuntimeError(
+            f"Model server not reachable at {host}:{port} (INFERENCE_MODE=server); "
+            "start the app with main.py or run `python -m backend.model_server`"
+        ) from e
+
+
+def call(op: str, **payload):
+    """Sends one request and returns its result; raises RuntimeError if the server reports an error."""
+    with _connect() as conn:
+        conn.send({"op": op, **payload})
+        reply = conn.recv()
+    if not reply.get("ok"):
+        raise RuntimeError(f"Model server {op} failed: {reply.get('error')}")
+    return reply["result"]
+
+
+def stream_chat(messages: List[dict], cancel: Optional[threading.Event] = None,
+                **kwargs) -> Generator[str, None, dict]:
+    """Streams answer text from the server; the generator's return value is the generation stats."""
+    with _connect() as conn:
+        conn.send({"op": "chat", "messages": messages, "kwargs": kwargs})
+        cancel_sent = False
+        while True:
+            reply = conn.recv()
+            if "chunk" in reply:
+                yield reply["chunk"]
+                if cancel is not None and cancel.is_set() and not cancel_sent:
+                    conn.send({"op": "cancel"})
+                    cancel_sent = True
+            elif "done" in reply:
+                return reply["done"]
+            else:
+                raise RuntimeError(f"Model server chat failed: {reply.get('error')}")
+
+
+# --- Server side ---
+
+def _stream_chat(conn: Connection, request: dict):
+    from backend.rag_engine import generate_answer
+
+    cancel = threading.Event()
+    stream = generate_answer(request["messages"], cancel, **request.get("kwargs", {}))
+    try:
+        while True:
+            try:
+                piece = next(stream)
+            except StopIteration as stop:
+                conn.send({"done": stop.value or {}})
+                return
+            conn.send({"chunk": piece})
+            # Checked between tokens; a closed client surfaces here or in the next send.
+            while conn.poll():
+                if conn.recv().get("op") == "cancel":
+                    cancel.set()
+    finally:
+        stream.close()  # Releases the model lock or batched slot if the client went away
+
+
+def _run_op(request: dict):
+    from backend import rag_engine
+    from backend.batch_engine import engine_stats
+    from backend.embedder import embed_texts
+    from backend.runtime_config import ReconfigureBusy, ReconfigureError, runtime_config
+
+    op = request.get("op")
+    if op == "ping":
+        return {"pid": os.getpid()}
+    if op == "embed":
+        return embed_texts(request["texts"])
+    if op == "complete":
+        return rag_engine.complete(request["prompt"], request.get("kind", "plain"), **request.get("kwargs", {}))
+    if op == "stats":
+        return engine_stats()
+    if op == "reconfigure":
+        try:
+            return runtime_config.start(request["requested"])
+        except ReconfigureError as e:
+            return {"rejected": str(e), "busy": isinstance(e, ReconfigureBusy)}
+    if op == "reconfigure_status":
+        return runtime_config.status()
+    raise ValueError(f"Unknown model server op: {op}")
+
+
+def _handle(conn: Connection):
+    try:
+        request = conn.recv()
+        if request.get("op") == "chat":
+            _stream_chat(conn, request)
+        else:
+            conn.send({"ok": True, "result": _run_op(request)})
+    except (EOFError, OSError):
+        pass  # Client disconnected
+    except Exception as e:
+        logger.exception(f"Model server request failed: {e}")
+        try:
+            conn.send({"ok": False, "error": str(e)})
+        except (EOFError, OSError):
+            pass
+    finally:
+        conn.close()
+
+
+def serve():
+    """Loads both models and serves requests until the process is terminated."""
+    # This process is the one that runs the models, whatever the workers are configured for.
+    settings.INFERENCE_MODE = "local"
+    from backend import rag_engine
+    from backend.embedder import get_embed_model
+
+    rag_engine.get_llm()
+    get_embed_model()
+
+    host, port = _address()
+    listener = Listener((host, port), authkey=_authkey(create=True))
+    logger.info(f"Model server listening on {host}:{port} (pid {os.getpid()})")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError) as e:
+                logger.warning(f"Model server rejected a connection: {e}")
+                continue
+            threading.Thread(target=_handle, args=(conn,), name="model-server-conn", daemon=True).start()
+    finally:
+        listener.close()
+
+
+def start_model_server() -> multiprocessing.Process:
+    """Starts serve() in a child process and waits until it answers a ping."""
+    _authkey(create=True)
+    # spawn gives the same behaviour on every platform and keeps the parent's threads out of the child.
+    process = multiprocessing.get_context("spawn").Process(target=serve, name="model-server", daemon=True)
+    process.start()
+    deadline = time.time() + settings.MODEL_SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        if not process.is_alive():
+            raise RuntimeError(f"Model server exited during startup (exit code {process.exitcode})")
+        try:
+            call("ping")
+            logger.info(f"Model server ready (pid {process.pid})")
+            return process
+        except RuntimeError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Model server did not start within {settings.MODEL_SERVER_START_TIMEOUT}s")
+
+
+if __name__ == "__main__":
+    serve()
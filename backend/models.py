@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Union
 
 class ChatMessage(BaseModel):
     role: str
@@ -7,9 +7,12 @@ class ChatMessage(BaseModel):
     
 class ChatRequest(BaseModel):
     session_id: Optional[int] = None
-    collection_name: Optional[str] = None
+    # A single collection, a list of collections, or "all"
+    collection_name: Optional[Union[str, List[str]]] = None
     messages: List[ChatMessage]
     stream: bool = True
+    # Client-chosen id for POST /api/chat/{request_id}/cancel; generated when omitted
+    request_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     content: str
@@ -17,6 +20,14 @@ class ChatResponse(BaseModel):
     time_taken: Optional[float] = 0.0
 
 
+class RuntimeReconfigure(BaseModel):
+    # Omitted fields keep their current value
+    n_ctx: Optional[int] = None
+    n_batch: Optional[int] = None
+    n_threads: Optional[int] = None
+    chat_max_tokens: Optional[int] = None
+
+
 class CollectionCreate(BaseModel):
     name: str
 
@@ -3,21 +3,37 @@ import sys
 import os
 import time
 import asyncio
-from typing import List, Generator
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Generator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
 from backend.models import ChatMessage
-from backend.database import get_chroma_client
+from backend.database import get_collection_version
+from backend.answer_cache import answer_cache
+from backend.conversation_memory import recall_summary, split_history
+from backend.batch_engine import generate_chat, stop_engine
+from backend.embedder import get_embed_model, get_embedding
+from backend import model_server
+from backend.intent_router import intent_router, route_message
+from backend.retrieval import merge_adjacent_chunks, query_collections, resolve_collection_names
+from backend.vector_store import kmeans
 from backend.config import settings, APP_DIR, BUNDLE_DIR
 from backend.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+try:
+    from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+except ImportError:  # Older llama-cpp-python wheels ship without draft model support.
+    LlamaPromptLookupDecoding = None
+
 # Do not globally suppress stderr in packaged apps; it hides fatal startup errors.
 
 # Model Configurations
 CHAT_MODEL_PATH = str(settings.CHAT_MODEL_PATH)
-EMBED_MODEL_PATH = str(settings.EMBED_MODEL_PATH)
 
-logger.info(f"Initializing Chat Model: {CHAT_MODEL_PATH}")
 if settings.AUTO_PROFILE:
     p = settings.PROFILE
     logger.info(
@@ -32,38 +48,175 @@ if settings.AUTO_PROFILE:
         settings.N_BATCH,
         settings.PROFILE_SUGGESTED_QUANT,
     )
+
+
+class _CountingDraftModel:
+    """Prompt-lookup draft model that records how many tokens it proposed."""
+
+    def __init__(self):
+        self.inner = LlamaPromptLookupDecoding(
+            max_ngram_size=settings.SPECULATIVE_MAX_NGRAM_SIZE,
+            num_pred_tokens=settings.SPECULATIVE_NUM_PRED_TOKENS,
+        )
+        self.calls = 0
+        self.proposed = 0
+
+    def __call__(self, input_ids, /, **kwargs):
+        draft = self.inner(input_ids, **kwargs)
+        self.calls += 1
+        self.proposed += len(draft)
+        return draft
+
+    def acceptance_rate(self, generated_tokens: int) -> float:
+        # Every decode step yields one sampled token plus the accepted draft tokens.
+        if not self.proposed:
+            return 0.0
+        accepted = max(generated_tokens - self.calls, 0)
+        return min(accepted / self.proposed, 1.0)
+
+
+SPECULATIVE_KINDS = {
+    "chat": settings.SPECULATIVE_CHAT,
+    "summary": settings.SPECULATIVE_SUMMARY,
+}
+SPECULATIVE_READY = any(SPECULATIVE_KINDS.values()) and LlamaPromptLookupDecoding is not None
+if any(SPECULATIVE_KINDS.values()) and not SPECULATIVE_READY:
+    logger.warning("Speculative decoding requested but this llama-cpp-python build has no draft model support")
+if settings.SPECULATIVE_CHAT and settings.BATCHED_DECODING:
+    logger.warning("SPECULATIVE_CHAT is ignored with BATCHED_DECODING: the batched engine has no draft model, so chats "
+                   "decode without it and report no draft acceptance (unless the engine cannot start)")
+
 # Initialize Chat Model
-try:
-    llm = Llama(
-        model_path=CHAT_MODEL_PATH,
-        n_gpu_layers=settings.N_GPU_LAYERS, 
-        n_ctx=settings.N_CTX,
-        n_batch=settings.N_BATCH,
-        n_threads=settings.N_THREADS,
-        chat_format=settings.CHAT_MODEL_FORMAT,
-        verbose=False
-    )
-except Exception as e:
-    logger.exception(f"Error loading the Chat Model: {e}")
-    raise RuntimeError(f"Failed to load chat model: {CHAT_MODEL_PATH}") from e
+_llm: Optional[Llama] = None
+_llm_load_lock = threading.Lock()
 
-logger.info(f"Initializing Embed Model: {EMBED_MODEL_PATH}")
-# Initialize Embed Model
-try:
-    embed_model = Llama(
-        model_path=EMBED_MODEL_PATH,
-        embedding=True,
-        n_batch=settings.N_BATCH,
-        n_threads=settings.N_THREADS,
-        verbose=False
-    )
-except Exception as e:
-    logger.exception(f"Error loading the Embed Model: {e}")
-    raise RuntimeError(f"Failed to load embedding model: {EMBED_MODEL_PATH}") from e
 
-def get_embedding(text: str) -> List[float]:
-    # logger.debug(f"Generating embedding for text length: {len(text)}") # Verbose
-    return embed_model.create_embedding(text)["data"][0]["embedding"]
+def _load_llm(n_ctx: int, n_batch: int, n_threads: int) -> Llama:
+    logger.info(f"Initializing Chat Model: {CHAT_MODEL_PATH} (n_ctx={n_ctx}, n_batch={n_batch}, n_threads={n_threads})")
+    try:
+        return Llama(
+            model_path=CHAT_MODEL_PATH,
+            n_gpu_layers=settings.N_GPU_LAYERS,
+            n_ctx=n_ctx,
+            n_batch=n_batch,
+            n_threads=n_threads,
+            chat_format=settings.CHAT_MODEL_FORMAT,
+            # A draft model at load time makes llama.cpp keep logits for all positions;
+            # it is swapped per request type by _speculative().
+            draft_model=_CountingDraftModel() if SPECULATIVE_READY else None,
+            verbose=False
+        )
+    except Exception as e:
+        logger.exception(f"Error loading the Chat Model: {e}")
+        raise RuntimeError(f"Failed to load chat model: {CHAT_MODEL_PATH}") from e
+
+
+def get_llm() -> Llama:
+    """Loads the chat model on first use; local mode calls this at import so a missing model fails fast."""
+    global _llm
+    with _llm_load_lock:
+        if _llm is None:
+            _llm = _load_llm(settings.N_CTX, settings.N_BATCH, settings.N_THREADS)
+        return _llm
+
+
+class _ModelGate:
+    """
+    Counts generations running on the chat model. reload_llm() closes the gate so running
+    generations can finish while new ones wait, then reopens it on the swapped-in model.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._users = 0
+        self._closed = False
+
+    @contextmanager
+    def use(self):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._closed)
+            self._users += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._users -= 1
+                self._cond.notify_all()
+
+    def drain(self, timeout: float) -> bool:
+        """Closes the gate and waits for running generations; reopens it and returns False on timeout."""
+        with self._cond:
+            self._closed = True
+            if self._cond.wait_for(lambda: self._users == 0, timeout):
+                return True
+        self.reopen()
+        return False
+
+    def reopen(self):
+        with self._cond:
+            self._closed = False
+            self._cond.notify_all()
+
+
+_model_gate = _ModelGate()
+
+
+def reload_llm(n_ctx: int, n_batch: int, n_threads: int, drain_timeout: float,
+               on_drain: Optional[Callable[[], None]] = None):
+    """
+    Loads a new chat model with these parameters while the current one keeps serving, then waits
+    for running generations to finish (holding new ones back), switches every caller to the new
+    model and frees the old one. Raises TimeoutError, keeping the current model, if generations
+    are still running after `drain_timeout` seconds.
+    """
+    global _llm
+    new_llm = _load_llm(n_ctx, n_batch, n_threads)
+    if on_drain:
+        on_drain()
+    if not _model_gate.drain(drain_timeout):
+        new_llm.close()
+        raise TimeoutError(f"Generations still running after {drain_timeout}s; kept the current chat model")
+    try:
+        # The batched engine's context belongs to the old model; the next chat starts a new one.
+        stop_engine()
+        settings.N_CTX, settings.N_BATCH, settings.N_THREADS = n_ctx, n_batch, n_threads
+        with _llm_load_lock:
+            old_llm, _llm = _llm, new_llm
+    finally:
+        _model_gate.reopen()
+    if old_llm is not None:
+        old_llm.close()
+    logger.info(f"Chat model reloaded: n_ctx={n_ctx}, n_batch={n_batch}, n_threads={n_threads}")
+
+
+def _remote() -> bool:
+    """True when generation and embedding run in the model-server process (INFERENCE_MODE=server)."""
+    return settings.INFERENCE_MODE == "server"
+
+
+# The main context serves one generation at a time: sequential chats, summaries, intent checks.
+_llm_lock = threading.Lock()
+
+# Load both models at startup, so a missing model fails fast. In server mode only the
+# model-server process loads them.
+if not _remote():
+    get_llm()
+    get_embed_model()
+
+@contextmanager
+def _speculative(kind: str) -> Generator[Optional[_CountingDraftModel], None, None]:
+    """Attach a fresh prompt-lookup draft model to the chat model for one request of `kind`."""
+    if not SPECULATIVE_READY:
+        yield None
+        return
+    draft = _CountingDraftModel() if SPECULATIVE_KINDS.get(kind) else None
+    llm = get_llm()
+    previous = llm.draft_model
+    llm.draft_model = draft
+    try:
+        yield draft
+    finally:
+        llm.draft_model = previous
 
 def classify_intent(message: str) -> str:
     """
@@ -81,42 +234,162 @@ def classify_intent(message: str) -> str:
     """
 
     logger.info("Classifying user intent...")
-    output = llm.create_completion(
-        prompt=prompt,
-        max_tokens=10,
-        stop=["\n"],
-        temperature=0.1
-    )
-    intent = output['choices'][0]['text'].strip().lower()
+    intent = complete(prompt, "intent", max_tokens=10, stop=["\n"], temperature=0.1).lower()
     logger.info(f"Intent classified as: {intent}")
     return intent if intent in ["history", "knowledge"] else "knowledge"
 
-def chat_stream(messages: List[ChatMessage], collection_name: str = None) -> Generator[str, None, None]:
+def complete(prompt: str, kind: str = "plain", **kwargs) -> str:
+    """
+    Runs one non-streaming completion on the main context, or on the model server in server mode.
+    `kind` selects the speculative decoding setting (see SPECULATIVE_KINDS) and labels the log line.
+    """
+    if _remote():
+        return model_server.call("complete", prompt=prompt, kind=kind, kwargs=kwargs)
+
+    start_time = time.time()
+    with _model_gate.use():
+        llm = get_llm()
+        with _llm_lock, _speculative(kind) as draft:
+            output = llm.create_completion(prompt=prompt, **kwargs)
+    duration = time.time() - start_time
+
+    completion_tokens = output.get('usage', {}).get('completion_tokens', 0)
+    tokens_per_sec = completion_tokens / duration if duration > 0 else 0.0
+    if draft is not None:
+        logger.info(
+            f"Speculative {kind}: tokens={completion_tokens} proposed={draft.proposed} "
+            f"acceptance={draft.acceptance_rate(completion_tokens):.2%} tokens_per_sec={tokens_per_sec:.1f}"
+        )
+    else:
+        logger.info(f"{kind.capitalize()} completion: tokens={completion_tokens} tokens_per_sec={tokens_per_sec:.1f}")
+    return output['choices'][0]['text'].strip()
+
+def generate_answer(formatted_messages: List[dict], cancel: Optional[threading.Event] = None,
+                    **kwargs) -> Generator[str, None, dict]:
+    """
+    Streams answer text for prompt-ready messages: through the batched engine or the main context,
+    or from the model server in server mode. Stops before the next token once `cancel` is set.
+    The generator returns stats: tokens, plus first_token_seconds or draft_* when they apply.
+    """
+    if _cancelled(cancel):
+        return {"tokens": 0}
+    if _remote():
+        return (yield from model_server.stream_chat(formatted_messages, cancel, **kwargs))
+
+    # Defaulted here rather than by the caller, so a model server applies its own (reconfigurable) limit.
+    kwargs.setdefault("max_tokens", settings.CHAT_MAX_TOKENS)
+    with _model_gate.use():
+        return (yield from _generate_local(formatted_messages, cancel, **kwargs))
+
+
+def _cancelled(cancel: Optional[threading.Event]) -> bool:
+    return cancel is not None and cancel.is_set()
+
+
+def _generate_local(formatted_messages: List[dict], cancel: Optional[threading.Event], **kwargs) -> Generator[str, None, dict]:
+    stats = {"tokens": 0}
+    # Checked again after every wait (model gate, model lock): the client may have gone while this request queued.
+    if _cancelled(cancel):
+        return stats
+    llm = get_llm()
+    handle = generate_chat(llm, formatted_messages, **kwargs)
+    if handle is not None:
+        try:
+            for content in handle:
+                yield content
+                if _cancelled(cancel):
+                    break
+        finally:
+            handle.cancel()  # Frees the slot if the client went away mid-answer
+        stats["tokens"] = handle.completion_tokens
+        if handle.first_token_at:
+            stats["first_token_seconds"] = handle.first_token_at - handle.queued_at
+        return stats
+
+    with _llm_lock, _speculative("chat") as draft:
+        if _cancelled(cancel):
+            return stats
+        stream = llm.create_chat_completion(messages=formatted_messages, stream=True, **kwargs)
+        for chunk in stream:
+            delta = chunk['choices'][0].get('delta', {})
+            if 'content' in delta:
+                stats["tokens"] += 1
+                yield delta['content']
+            if _cancelled(cancel):
+                stream.close()
+                break
+    if draft is not None:
+        stats.update(draft_proposed=draft.proposed, draft_steps=draft.calls,
+                     draft_acceptance=draft.acceptance_rate(stats["tokens"]))
+    return stats
+
+def chat_stream(messages: List[ChatMessage], collection_name: Union[str, List[str], None] = None,
+                cancel: Optional[threading.Event] = None, session_id: Optional[int] = None) -> Generator[str, None, None]:
+    """
+    Streams the answer; setting `cancel` stops decoding before the next token.
+    With `session_id`, turns beyond the history budget are replaced by the session's rolling summary.
+    """
     context_str = ""
     last_message = messages[-1].content
+    query_embedding = None
+    retrieval_latencies = {}
+    collection_names = resolve_collection_names(collection_name)
     
     # 1. Orchestrator Step
-    # intent = classify_intent(last_message)
+    # classify_intent() costs a full completion; the router compares the query embedding
+    # against prototype messages instead, and the embedding is reused for cache and retrieval.
     intent = "knowledge"
+    if settings.INTENT_ROUTER_ENABLED and collection_names:
+        try:
+            query_embedding = get_embedding(last_message)
+            intent = route_message(last_message, query_embedding)
+        except Exception as e:
+            logger.error(f"Intent routing skipped: {e}")
+
+    # Answer cache only applies to first turns, where the answer depends on nothing but the question.
+    cache_scope = None
+    if settings.ANSWER_CACHE_ENABLED and collection_names and len(messages) == 1 and intent == "knowledge":
+        try:
+            if query_embedding is None:
+                query_embedding = get_embedding(last_message)
+            cache_scope = tuple((name, get_collection_version(name)) for name in sorted(collection_names))
+            cache_start = time.time()
+            cached_answer = answer_cache.lookup(cache_scope, query_embedding)
+            if cached_answer is not None:
+                yield cached_answer
+                yield f"\n\n[METRICS] Time: {time.time() - cache_start:.2f}s | Tokens: 0 | Cached: yes"
+                return
+        except Exception as e:
+            logger.error(f"Answer cache lookup failed: {e}")
+            cache_scope = None
     
+    if _cancelled(cancel):
+        logger.info("Chat cancelled before retrieval")
+        return
+
     # 2. Retrieval Step (only if intent is knowledge and collection is selected)
-    if collection_name and intent == "knowledge":
-        logger.info(f"Intent is 'knowledge'. Proceeding with RAG for collection: {collection_name}")
-        client = get_chroma_client()
+    if collection_names and intent == "knowledge":
+        logger.info(f"Intent is 'knowledge'. Proceeding with RAG for collections: {collection_names}")
         try:
-            collection = client.get_collection(name=collection_name)
-            query_embedding = get_embedding(last_message)
+            if query_embedding is None:
+                query_embedding = get_embedding(last_message)
             
             n_results = settings.RETRIEVED_DOCS_COUNT
             logger.info(f"Querying ChromaDB. n_results={n_results}")
             
-            results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results
-            )
+            retrieval_start = time.time()
+            results = query_collections(collection_names, query_embedding, n_results)
+            intent_router.record_retrieval(time.time() - retrieval_start)
+            retrieval_latencies = results['latencies']
+            if set(collection_names) - retrieval_latencies.keys():
+                # A collection was skipped or failed: the context is partial, so the answer is not cached.
+                cache_scope = None
+            if results['mismatched']:
+                yield (f"_Note: {', '.join(results['mismatched'])} was indexed with a different embedding model "
+                       "and was skipped. Re-index it from the Manage page._\n\n")
             
-            if results and results['documents']:
-                retrieved_docs = results['documents'][0]
+            if results['documents']:
+                retrieved_docs = merge_adjacent_chunks(results['documents'], results['metadatas'])
                 context_str = "\n\nRefer to the following context:\n" + "\n".join(retrieved_docs) + "\n\n"
                 logger.info(f"Retrieved {len(retrieved_docs)} documents")
             else:
@@ -124,6 +397,13 @@ def chat_stream(messages: List[ChatMessage], collection_name: str = None) -> Gen
                 
         except Exception as e:
             logger.error(f"Error querying collection: {e}")
+            cache_scope = None
+    elif collection_names:
+        saved = intent_router.record_skip()
+        logger.info(
+            f"Skipping retrieval for {intent} message: ~{saved * 1000:.0f}ms saved "
+            f"({intent_router.skipped} skips, {intent_router.saved_seconds:.1f}s saved since startup)"
+        )
     else:
         logger.info(f"Skipping retrieval. Intent: {intent}, Collection: {collection_name}")
 
@@ -133,16 +413,30 @@ def chat_stream(messages: List[ChatMessage], collection_name: str = None) -> Gen
         "If the user asks about previous topics or questions, refer to the history to provide the correct answer. "
         "Respond to user in a clear, concise and professional manner."
     )
-    formatted_messages = [{"role": "system", "content": system_prompt}]
-
-    # Keep recent turns for stronger continuity without blowing context.
-    for m in messages[-8:]:
+    history = []
+    for m in messages:
         msg = m.model_dump()
         if msg['role'] == 'human':
             msg['role'] = 'user'
         elif msg['role'] == 'ai':
             msg['role'] = 'assistant'
-        formatted_messages.append(msg)
+        history.append(msg)
+
+    # Keep recent turns for stronger continuity without blowing context. Older turns come back
+    # as the rolling summary, so the prompt stays about the same size however long the session runs.
+    if settings.CONVERSATION_SUMMARY_ENABLED:
+        older, recent = split_history(history, settings.HISTORY_TOKEN_BUDGET)
+    else:
+        older, recent = history[:-8], history[-8:]
+    summary = ""
+    if older and session_id and settings.CONVERSATION_SUMMARY_ENABLED:
+        try:
+            summary = recall_summary(session_id, keep=len(recent))
+        except Exception as e:
+            logger.error(f"Conversation summary unavailable: {e}")
+    if summary:
+        system_prompt += f"\n\nSummary of the earlier conversation:\n{summary}"
+    formatted_messages = [{"role": "system", "content": system_prompt}] + recent
 
     if context_str:
         if formatted_messages[-1]['role'] == 'user':
@@ -151,30 +445,59 @@ def chat_stream(messages: List[ChatMessage], collection_name: str = None) -> Gen
             formatted_messages[-1]['content'] += f"\n\nContext:\n{context_str}"
 
     start_time = time.time()
-    token_count = 0
+    answer_parts: List[str] = []
     
     logger.info(f"Sending request to LLM with {len(formatted_messages)} messages")
-    stream = llm.create_chat_completion(
-        messages=formatted_messages,
-        max_tokens=settings.CHAT_MAX_TOKENS,
+    generation_kwargs = dict(
         temperature=settings.CHAT_TEMPERATURE,
         presence_penalty=settings.CHAT_PRESENCE_PENALTY,
         repeat_penalty=settings.CHAT_REPEAT_PENALTY,
         stop=["</s>", "<|im_end|>", "User:", "Human:"],
-        stream=True
     )
-    
-    for chunk in stream:
-        delta = chunk['choices'][0].get('delta', {})
-        if 'content' in delta:
-            content = delta['content']
-            token_count += 1
+    stats = {}
+    answer = generate_answer(formatted_messages, cancel, **generation_kwargs)
+    try:
+        while True:
+            try:
+                content = next(answer)
+            except StopIteration as stop:
+                stats = stop.value or {}
+                break
+            answer_parts.append(content)
             yield content
+    finally:
+        answer.close()
+    token_count = stats.get("tokens", 0)
+    cancelled = _cancelled(cancel)
 
     end_time = time.time()
     duration = end_time - start_time
-    
-    yield f"\n\n[METRICS] Time: {duration:.2f}s | Tokens: {token_count}"
+    tokens_per_sec = token_count / duration if duration > 0 else 0.0
+
+    metrics = f"Time: {duration:.2f}s | Tokens: {token_count} | Speed: {tokens_per_sec:.1f} tok/s"
+    if retrieval_latencies:
+        metrics += " | Retrieval: " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in retrieval_latencies.items())
+    if intent != "knowledge":
+        metrics += f" | Route: {intent}"
+    if older:
+        metrics += f" | History: {len(recent)} recent messages" + (" + summary" if summary else "")
+    if cancelled:
+        metrics += " | Cancelled: yes"
+        logger.info(f"Chat generation cancelled after {token_count} tokens")
+    if "first_token_seconds" in stats:
+        metrics += f" | Batched: first token {stats['first_token_seconds']:.2f}s"
+    if "draft_acceptance" in stats:
+        acceptance = stats["draft_acceptance"]
+        metrics += f" | Draft acceptance: {acceptance:.0%}"
+        logger.info(
+            f"Speculative chat: proposed={stats['draft_proposed']} steps={stats['draft_steps']} "
+            f"acceptance={acceptance:.2%} tokens_per_sec={tokens_per_sec:.1f}"
+        )
+
+    if cache_scope is not None and not cancelled:
+        answer_cache.store(cache_scope, query_embedding, "".join(answer_parts).strip())
+
+    yield f"\n\n[METRICS] {metrics}"
 
 def update_task_progress(task_id: str, progress: int, status: str = "processing"):
     if not task_id:
@@ -209,6 +532,10 @@ def _split_text_for_summary(text: str, chunk_size: int, max_chunks: int) -> List
     return [c for c in chunks if c]
 
 
+def _summary_completion(prompt: str, **kwargs) -> str:
+    return complete(prompt, "summary", **kwargs)
+
+
 def _summarize_chunk(chunk: str) -> str:
     prompt = f"""You are writing study notes.
 Read the text and produce 5 to 8 concise bullets.
@@ -222,21 +549,24 @@ Text:
 
 Bullets:
 -"""
-    output = llm.create_completion(
-        prompt=prompt,
+    text = _summary_completion(
+        prompt,
         max_tokens=280,
         temperature=0.15,
         repeat_penalty=1.15,
         stop=["\n\n\n", "User:", "Human:"]
     )
-    text = output['choices'][0]['text'].strip()
     return text if text else "No useful points found for this section."
 
 
-def _finalize_summary(combined_points: str, target_words: int) -> str:
+def _finalize_summary(combined_points: str, target_words: int, weighted: bool = False) -> str:
+    weighting = (
+        "Each section is labelled with the share of the document it stands for; "
+        "give larger sections proportionally more space.\n" if weighted else ""
+    )
     prompt = f"""Create a practical document summary using the bullet notes below.
 Write around {target_words} words.
-Structure:
+{weighting}Structure:
 1) Overview (2-4 sentences)
 2) Key Points (8-14 bullets)
 3) Actionable Notes / Risks (3-6 bullets, if relevant)
@@ -246,49 +576,92 @@ Bullet notes:
 
 Summary:
 """
-    output = llm.create_completion(
-        prompt=prompt,
+    return _summary_completion(
+        prompt,
         max_tokens=min(max(int(target_words * 1.6), 260), 900),
         temperature=0.2,
         repeat_penalty=1.15,
         stop=["User:", "Human:"]
     )
-    return output['choices'][0]['text'].strip()
 
-def summarize_text(text: str, task_id: str = None) -> str:
-    """Public wrapper for recursive summarization."""
-    try:
-        logger.info(f"Starting summarization for text length: {len(text)}")
-        if not text or not text.strip():
-            return "No content available for summarization."
+def _summarize_sections(sections: List[Tuple[str, str]], total_words: int, task_id: Optional[str],
+                        checkpoint: Optional[Callable[[int], None]], weighted: bool = False) -> str:
+    """Summarizes each (label, text) section, then merges the notes into the final summary."""
+    chunk_summaries: List[str] = []
+    for i, (label, chunk) in enumerate(sections, start=1):
+        logger.info(f"Summarizing chunk {i}/{len(sections)}")
+        summary = _summarize_chunk(chunk)
+        chunk_summaries.append(f"{label}:\n{summary}")
+        progress = min(int((i / len(sections)) * 85), 95)
+        if task_id:
+            update_task_progress(task_id, progress)
+        if checkpoint:
+            checkpoint(progress)
 
-        chunk_size = settings.SUMMARY_CHUNK_SIZE
-        max_chunks = settings.SUMMARY_MAX_CHUNKS
-        chunks = _split_text_for_summary(text, chunk_size, max_chunks)
-        if not chunks:
-            return "No content available for summarization."
+    target_words = max(140, min(int(max(total_words, 1) * 0.22), 500))
 
-        logger.info(f"Summarization chunks prepared: {len(chunks)}")
-        chunk_summaries: List[str] = []
+    combined_points = "\n\n".join(chunk_summaries)
+    final_summary = _finalize_summary(combined_points, target_words, weighted)
 
-        for i, chunk in enumerate(chunks, start=1):
-            logger.info(f"Summarizing chunk {i}/{len(chunks)}")
-            summary = _summarize_chunk(chunk)
-            chunk_summaries.append(f"Section {i}:\n{summary}")
-            if task_id:
-                progress = min(int((i / len(chunks)) * 85), 95)
-                update_task_progress(task_id, progress)
+    if task_id:
+        update_task_progress(task_id, 99)
 
-        words = max(len(text.split()), 1)
-        target_words = max(140, min(int(words * 0.22), 500))
+    return final_summary if final_summary else "Could not generate summary."
 
-        combined_points = "\n\n".join(chunk_summaries)
-        final_summary = _finalize_summary(combined_points, target_words)
+def summarize_text(text: str, task_id: str = None, checkpoint: Optional[Callable[[int], None]] = None) -> str:
+    """
+    Public wrapper for recursive summarization.
+    `checkpoint(progress)` is called after each section; it may raise JobCancelled to stop early.
+    Model errors propagate, so the summary job can retry.
+    """
+    logger.info(f"Starting summarization for text length: {len(text)}")
+    if not text or not text.strip():
+        return "No content available for summarization."
 
-        if task_id:
-            update_task_progress(task_id, 99)
+    chunk_size = settings.SUMMARY_CHUNK_SIZE
+    max_chunks = settings.SUMMARY_MAX_CHUNKS
+    chunks = _split_text_for_summary(text, chunk_size, max_chunks)
+    if not chunks:
+        return "No content available for summarization."
 
-        return final_summary if final_summary else "Could not generate summary."
-    except Exception as e:
-        logger.error(f"Top level summary error: {e}")
-        return "Summary generation failed."
+    logger.info(f"Summarization chunks prepared: {len(chunks)}")
+    sections = [(f"Section {i}", chunk) for i, chunk in enumerate(chunks, start=1)]
+    return _summarize_sections(sections, len(text.split()), task_id, checkpoint)
+
+def representative_chunks(embeddings: Sequence[Sequence[float]], k: int) -> List[Tuple[int, int]]:
+    """
+    Clusters chunk embeddings into `k` groups; returns (chunk index, cluster size) for the chunk
+    closest to each cluster centre, in document order.
+    """
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms > 0, norms, 1.0)
+    centroids, assignments = kmeans(vectors, k)
+    picks = []
+    for cluster, centroid in enumerate(centroids):
+        members = np.nonzero(assignments == cluster)[0]
+        if len(members):
+            best = members[int(np.argmax(vectors[members] @ centroid))]
+            picks.append((int(best), len(members)))
+    return sorted(picks)
+
+def summarize_by_coverage(chunks: List[str], embeddings: Sequence[Sequence[float]], task_id: str = None,
+                          checkpoint: Optional[Callable[[int], None]] = None) -> str:
+    """
+    Summarizes a long document for a fixed LLM budget: its indexed chunks are clustered into
+    SUMMARY_MAX_CHUNKS groups by embedding and only the most representative chunk of each group is
+    summarized, so every part of the document is covered. Cluster sizes weight the final summary.
+    Model errors propagate, so the summary job can retry.
+    """
+    logger.info(f"Starting coverage summarization for {len(chunks)} chunks")
+    if not chunks:
+        return "No content available for summarization."
+
+    picks = representative_chunks(embeddings, settings.SUMMARY_MAX_CHUNKS)
+    sections = [
+        (f"Section {i} (about {size / len(chunks):.0%} of the document)", chunks[index])
+        for i, (index, size) in enumerate(picks, start=1)
+    ]
+    logger.info(f"Coverage summary: {len(sections)} representative chunks out of {len(chunks)}")
+    total_words = sum(len(chunk.split()) for chunk in chunks)
+    return _summarize_sections(sections, total_words, task_id, checkpoint, weighted=True)
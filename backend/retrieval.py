@@ -0,0 +1,280 @@
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from backend.config import settings
+from backend.database import get_collection_version, get_recent_collections, touch_collection
+from backend.embedder import DIMENSION_KEY, EmbeddingMismatch, check_fingerprint
+from backend.vector_store import get_vector_store
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+ALL_COLLECTIONS = "all"
+
+_query_pool = ThreadPoolExecutor(max_workers=settings.RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+
+def resolve_collection_names(collection_name: Union[str, List[str], None]) -> List[str]:
+    """Expands a ChatRequest.collection_name value (name, list of names or "all") into collection names."""
+    if not collection_name:
+        return []
+    if isinstance(collection_name, str):
+        if collection_name == ALL_COLLECTIONS:
+            return [c.name for c in get_vector_store().list_collections()]
+        return [collection_name]
+    # Keep the caller's order but drop blanks and duplicates.
+    return list(dict.fromkeys(name for name in collection_name if name))
+
+
+def _normalized_distance(distance: float, space: str) -> float:
+    # New collections use the cosine space. Older Chroma ones may use l2 (the default), which
+    # returns squared L2 distance: twice the cosine distance for the unit vectors embed_texts() returns.
+    if space == "l2":
+        return distance / 2.0
+    return distance
+
+
+def _distance_space(collection) -> str:
+    space = (collection.metadata or {}).get("hnsw:space")
+    if not space:
+        configuration = getattr(collection, "configuration_json", None) or {}
+        space = (configuration.get("hnsw") or {}).get("space")
+    return space or "l2"
+
+
+class RetrievalService:
+    """
+    Keeps collection handles (and their distance space) between queries, so only the first
+    query after startup or a change pays for opening the collection and loading its index.
+    A handle is reused while the collection version is unchanged; uploads, deletes, rebuilds
+    and swaps all bump the version, and create/delete also invalidate explicitly.
+    Records per-collection latency of the first (cold) query on a handle and of later (warm) ones.
+    """
+
+    # Rewrite last_used_at at most this often per collection
+    TOUCH_INTERVAL_SECONDS = 60
+
+    def __init__(self):
+        self._handles: Dict[str, dict] = {}
+        self._latencies: Dict[str, dict] = {}
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.warmup = {"status": "idle", "collections": [], "seconds": None}
+
+    def _handle(self, name: str) -> dict:
+        version = get_collection_version(name)
+        with self._lock:
+            handle = self._handles.get(name)
+        if handle and handle["version"] == version:
+            return handle
+        collection = get_vector_store().get_collection(name=name)
+        handle = {"collection": collection, "space": _distance_space(collection), "version": version, "queries": 0}
+        with self._lock:
+            self._handles[name] = handle
+        return handle
+
+    def invalidate(self, name: Optional[str] = None):
+        with self._lock:
+            if name is None:
+                self._handles.clear()
+            else:
+                self._handles.pop(name, None)
+
+    def query(self, name: str, query_embedding: List[float], n_results: int) -> dict:
+        start = time.perf_counter()
+        handle = self._handle(name)
+        collection = handle["collection"]
+        # Vectors from another embedding model would return confident nonsense, not an error.
+        check_fingerprint(name, collection.metadata)
+        results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            include=["documents", "metadatas", "distances"],
+        )
+        hits = []
+        if results and results['documents']:
+            documents = results['documents'][0]
+            metadatas = (results.get('metadatas') or [[None] * len(documents)])[0]
+            distances = (results.get('distances') or [[0.0] * len(documents)])[0]
+            for doc, meta, dist in zip(documents, metadatas, distances):
+                hits.append((_normalized_distance(dist, handle["space"]), doc, meta))
+        latency_ms = (time.perf_counter() - start) * 1000
+        self._record(name, handle, latency_ms)
+        return {"hits": hits, "latency_ms": latency_ms}
+
+    def _record(self, name: str, handle: dict, latency_ms: float):
+        now = time.time()
+        with self._lock:
+            stats = self._latencies.setdefault(name, {"cold_ms": None, "cold_loads": 0, "warm_ms": collections.deque(maxlen=200)})
+            if handle["queries"] == 0:
+                stats["cold_ms"] = latency_ms
+                stats["cold_loads"] += 1
+            else:
+                stats["warm_ms"].append(latency_ms)
+            handle["queries"] += 1
+            touch = now - self._touched.get(name, 0) >= self.TOUCH_INTERVAL_SECONDS
+            if touch:
+                self._touched[name] = now
+        if touch:
+            try:
+                touch_collection(name)
+            except Exception as e:
+                logger.error(f"Could not record use of collection {name}: {e}")
+
+    def latency_stats(self) -> Dict[str, dict]:
+        with self._lock:
+            report = {}
+            for name, stats in self._latencies.items():
+                warm = list(stats["warm_ms"])
+                report[name] = {
+                    "cached": name in self._handles,
+                    "cold_ms": round(stats["cold_ms"], 1) if stats["cold_ms"] is not None else None,
+                    "cold_loads": stats["cold_loads"],
+                    "warm_queries": len(warm),
+                    "warm_p50_ms": round(float(np.percentile(warm, 50)), 1) if warm else None,
+                    "warm_p95_ms": round(float(np.percentile(warm, 95)), 1) if warm else None,
+                }
+            return report
+
+    def warm_up(self, limit: int):
+        """Opens the `limit` most recently queried collections and runs one query on each."""
+        started = time.perf_counter()
+        self.warmup = {"status": "running", "collections": [], "seconds": None}
+        try:
+            names = get_recent_collections(limit)
+        except Exception as e:
+            logger.error(f"Collection warm-up skipped: {e}")
+            names = []
+        for name in names:
+            try:
+                collection = self._handle(name)["collection"]
+                dim = (collection.metadata or {}).get(DIMENSION_KEY)
+                if not dim:
+                    sample = collection.get(limit=1, include=["embeddings"])
+                    embeddings = sample.get("embeddings")
+                    if embeddings is None or len(embeddings) == 0:
+                        continue
+                    dim = len(embeddings[0])
+                probe = [1.0 / np.sqrt(int(dim))] * int(dim)
+                result = self.query(name, probe, 1)
+                self.warmup["collections"].append({"name": name, "ms": round(result["latency_ms"], 1)})
+            except Exception as e:
+                # Deleted since last use, or indexed with another model; queries will report it.
+                logger.info(f"Skipped warm-up of collection {name}: {e}")
+        self.warmup["status"] = "completed"
+        self.warmup["seconds"] = round(time.perf_counter() - started, 2)
+        logger.info(f"Warmed up {len(self.warmup['collections'])} collections in {self.warmup['seconds']}s")
+
+    def start_warm_up(self):
+        if settings.RETRIEVAL_WARMUP_COLLECTIONS > 0:
+            threading.Thread(
+                target=self.warm_up, args=(settings.RETRIEVAL_WARMUP_COLLECTIONS,),
+                name="retrieval-warmup", daemon=True,
+            ).start()
+
+
+retrieval_service = RetrievalService()
+
+
+def query_collections(names: List[str], query_embedding: List[float], n_results: int) -> dict:
+    """
+    Queries every collection concurrently with one shared embedding and keeps the
+    global top `n_results` hits by normalized distance.
+    Returns documents, metadatas, per-collection latency in milliseconds and the collections
+    skipped because they were indexed with a different embedding model.
+    """
+    futures = {name: _query_pool.submit(retrieval_service.query, name, query_embedding, n_results) for name in names}
+
+    hits = []
+    latencies = {}
+    mismatched = []
+    for name, future in futures.items():
+        try:
+            result = future.result()
+        except EmbeddingMismatch as e:
+            logger.warning(str(e))
+            mismatched.append(name)
+            continue
+        except Exception as e:
+            logger.error(f"Error querying collection {name}: {e}")
+            continue
+        hits.extend(result["hits"])
+        latencies[name] = result["latency_ms"]
+        logger.info(f"Collection {name}: {len(result['hits'])} hits in {result['latency_ms']:.1f}ms")
+
+    hits.sort(key=lambda hit: hit[0])
+    top = hits[:n_results]
+    return {
+        "documents": [doc for _, doc, _ in top],
+        "metadatas": [meta for _, _, meta in top],
+        "latencies": latencies,
+        "mismatched": mismatched,
+    }
+
+
+def _join_adjacent(left: str, right: str, meta: dict) -> str:
+    """
+    Appends the next chunk of a document, dropping the characters it repeats from the previous one.
+    Only the overlap split_text() recorded at index time is removed; row-group chunks and chunks
+    indexed before it was recorded are joined whole.
+    """
+    overlap = meta.get("overlap")
+    if isinstance(overlap, int) and 0 < overlap <= len(right) and "row_start" not in meta \
+            and left.endswith(right[:overlap]):
+        return left + right[overlap:]
+    return f"{left}\n{right}"
+
+
+def merge_adjacent_chunks(documents: List[str], metadatas: Optional[List[dict]]) -> List[str]:
+    """
+    Collapses retrieved chunks into non-overlapping spans.
+    Hits from the same source with consecutive `chunk_index` values are stitched together
+    with the split_text() overlap recorded in their `overlap` metadata removed. Sources keep
+    their best retrieval rank and spans within a source follow document order.
+    """
+    if not documents:
+        return []
+    if not metadatas or len(metadatas) != len(documents):
+        return list(documents)
+
+    by_source = {}
+    passthrough = []
+    for rank, (doc, meta) in enumerate(zip(documents, metadatas)):
+        meta = meta or {}
+        source = meta.get("source")
+        chunk_index = meta.get("chunk_index")
+        if source is None or chunk_index is None:
+            passthrough.append((rank, doc))
+            continue
+        entry = by_source.setdefault(source, {"rank": rank, "chunks": {}})
+        entry["chunks"][int(chunk_index)] = (doc, meta)
+
+    spans = []
+    for source, entry in by_source.items():
+        indices = sorted(entry["chunks"])
+        current = entry["chunks"][indices[0]][0]
+        previous_index = indices[0]
+        for index in indices[1:]:
+            chunk, meta = entry["chunks"][index]
+            if index == previous_index + 1:
+                current = _join_adjacent(current, chunk, meta)
+            else:
+                spans.append((entry["rank"], current))
+                current = chunk
+            previous_index = index
+        spans.append((entry["rank"], current))
+
+    spans.extend(passthrough)
+    # Stable sort keeps document order for spans sharing a source rank.
+    spans.sort(key=lambda item: item[0])
+    merged = [text for _, text in spans]
+
+    saved = sum(len(d) for d in documents) - sum(len(m) for m in merged)
+    if len(merged) != len(documents):
+        logger.info(f"Merged {len(documents)} retrieved chunks into {len(merged)} spans ({saved} duplicate chars removed)")
+    return merged
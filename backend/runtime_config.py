@@ -0,0 +1,193 @@
+"""
+Changes model runtime parameters (N_CTX, N_BATCH, N_THREADS, CHAT_MAX_TOKENS) without a restart.
+
+POST /api/runtime/reconfigure validates the new values and hands them to a background thread that
+loads the affected model with them, lets running generations finish, switches traffic to the new
+instance and frees the old one. CHAT_MAX_TOKENS alone applies to the next chat with no reload.
+In server mode the model-server process does this, since it is the one running the models.
+Changes last until the process exits; put them in .env to keep them.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+from backend import model_server
+from backend.config import settings, _detect_memory_bytes
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+RUNTIME_PARAMS = ("N_CTX", "N_BATCH", "N_THREADS", "CHAT_MAX_TOKENS")
+# Parameters each model is built with; changing one reloads that model.
+CHAT_MODEL_PARAMS = {"N_CTX", "N_BATCH", "N_THREADS"}
+EMBED_MODEL_PARAMS = {"N_BATCH", "N_THREADS"}
+# Tokens kept for the system prompt and the question, on top of retrieved context and history.
+MIN_PROMPT_TOKENS = 256
+
+
+class ReconfigureError(ValueError):
+    """The requested parameters are invalid."""
+
+
+class ReconfigureBusy(ReconfigureError):
+    """Another reconfiguration is still running."""
+
+
+def current_params() -> dict:
+    return {name.lower(): getattr(settings, name) for name in RUNTIME_PARAMS}
+
+
+def _kv_cache_bytes(llm, n_ctx: int) -> Optional[int]:
+    """f16 K and V cache size for `n_ctx` tokens, from the GGUF metadata; None if it is not recorded."""
+    metadata = getattr(llm, "metadata", None) or {}
+    arch = metadata.get("general.architecture")
+    try:
+        layers = int(metadata[f"{arch}.block_count"])
+        embedding = int(metadata[f"{arch}.embedding_length"])
+        heads = int(metadata[f"{arch}.attention.head_count"])
+        kv_heads = int(metadata.get(f"{arch}.attention.head_count_kv", heads))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return 2 * layers * n_ctx * (embedding * kv_heads // heads) * 2
+
+
+def prompt_budget() -> int:
+    """
+    Largest prompt chat_stream() builds, in tokens estimated as for the history budget: the
+    retrieved chunks, recent history, the rolling conversation summary, system prompt and question.
+    """
+    from backend.conversation_memory import estimate_tokens
+    retrieved = estimate_tokens(" " * (settings.RETRIEVED_DOCS_COUNT * settings.CHUNK_SIZE))
+    # About 4/3 tokens per English word.
+    summary = settings.CONVERSATION_SUMMARY_WORDS * 4 // 3 if settings.CONVERSATION_SUMMARY_ENABLED else 0
+    return MIN_PROMPT_TOKENS + retrieved + settings.HISTORY_TOKEN_BUDGET + summary
+
+
+def validate(requested: dict) -> dict:
+    """
+    Checks requested values (keys in any case) against each other, the CPU, the model's training
+    context and free memory; returns {SETTING: value} for the ones that differ from the current settings.
+    """
+    from backend.rag_engine import get_llm
+
+    changes = {}
+    for key, value in (requested or {}).items():
+        name = key.upper()
+        if name not in RUNTIME_PARAMS:
+            raise ReconfigureError(f"Unknown parameter {key}; supported: {', '.join(p.lower() for p in RUNTIME_PARAMS)}")
+        try:
+            changes[name] = int(value)
+        except (TypeError, ValueError):
+            raise ReconfigureError(f"{key} must be an integer, got {value!r}")
+    merged = {name: changes.get(name, getattr(settings, name)) for name in RUNTIME_PARAMS}
+
+    llm = get_llm()
+    n_ctx_train = llm._model.n_ctx_train() if hasattr(getattr(llm, "_model", None), "n_ctx_train") else None
+    if merged["N_CTX"] < 512 or (n_ctx_train and merged["N_CTX"] > n_ctx_train):
+        raise ReconfigureError(f"n_ctx must be between 512 and {n_ctx_train or 'the model context length'}")
+    if not 32 <= merged["N_BATCH"] <= merged["N_CTX"]:
+        raise ReconfigureError(f"n_batch must be between 32 and n_ctx ({merged['N_CTX']})")
+    cores = os.cpu_count() or 1
+    if "N_THREADS" in changes and not 1 <= changes["N_THREADS"] <= cores:
+        raise ReconfigureError(f"n_threads must be between 1 and {cores} (logical cores)")
+    if merged["CHAT_MAX_TOKENS"] < 16:
+        raise ReconfigureError("chat_max_tokens must be at least 16")
+    # Checked only when it changes, so other parameters can still be tuned under a tight .env setup.
+    budget = prompt_budget()
+    if {"N_CTX", "CHAT_MAX_TOKENS"} & changes.keys() and merged["CHAT_MAX_TOKENS"] > merged["N_CTX"] - budget:
+        raise ReconfigureError(
+            f"n_ctx {merged['N_CTX']} leaves {merged['N_CTX'] - budget} tokens for chat_max_tokens "
+            f"{merged['CHAT_MAX_TOKENS']}: prompts take up to {budget} tokens "
+            f"({settings.RETRIEVED_DOCS_COUNT} retrieved chunks of {settings.CHUNK_SIZE} characters, "
+            f"HISTORY_TOKEN_BUDGET {settings.HISTORY_TOKEN_BUDGET}, conversation summary, system prompt)"
+        )
+
+    changes = {name: value for name, value in changes.items() if value != getattr(settings, name)}
+    if "N_CTX" in changes and changes["N_CTX"] > settings.N_CTX:
+        # The new context is allocated while the old one still serves.
+        needed = _kv_cache_bytes(llm, changes["N_CTX"])
+        _, available = _detect_memory_bytes()
+        if needed and available and needed > available * 0.9:
+            raise ReconfigureError(
+                f"n_ctx {changes['N_CTX']} needs about {needed / 1024 ** 3:.1f} GB for its KV cache, "
+                f"but only {available / 1024 ** 3:.1f} GB is available"
+            )
+    return changes
+
+
+class RuntimeReconfigurer:
+    """Runs one reconfiguration at a time on a background thread and reports its progress."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {"status": "idle"}
+
+    def _update(self, **fields):
+        with self._lock:
+            self._state.update(fields)
+
+    def status(self) -> dict:
+        if settings.INFERENCE_MODE == "server":
+            return model_server.call("reconfigure_status")
+        with self._lock:
+            return {**self._state, "current": current_params()}
+
+    def start(self, requested: dict) -> dict:
+        """Validates `requested` and starts applying it; raises ReconfigureError or ReconfigureBusy."""
+        if settings.INFERENCE_MODE == "server":
+            result = model_server.call("reconfigure", requested=requested)
+            if "rejected" in result:
+                raise (ReconfigureBusy if result.get("busy") else ReconfigureError)(result["rejected"])
+            return result
+
+        with self._lock:
+            if self._state["status"] in ("loading", "draining"):
+                raise ReconfigureBusy(f"A reconfiguration is already {self._state['status']}")
+            # Validated under the lock, against settings no other reconfiguration is changing.
+            changes = validate(requested)
+            if not changes:
+                return {"status": "unchanged", "current": current_params()}
+            self._state = {
+                "status": "loading",
+                "changes": {name.lower(): value for name, value in changes.items()},
+                "previous": current_params(),
+                "started_at": time.time(),
+            }
+        threading.Thread(target=self._run, args=(changes,), name="runtime-reconfigure", daemon=True).start()
+        return self.status()
+
+    def _run(self, changes: dict):
+        from backend.embedder import reload_embed_model
+        from backend.rag_engine import reload_llm
+
+        started = time.perf_counter()
+        reloaded = []
+        try:
+            if CHAT_MODEL_PARAMS & changes.keys():
+                reload_llm(
+                    changes.get("N_CTX", settings.N_CTX),
+                    changes.get("N_BATCH", settings.N_BATCH),
+                    changes.get("N_THREADS", settings.N_THREADS),
+                    settings.RECONFIGURE_DRAIN_TIMEOUT,
+                    on_drain=lambda: self._update(status="draining"),
+                )
+                reloaded.append("chat")
+            if "CHAT_MAX_TOKENS" in changes:
+                settings.CHAT_MAX_TOKENS = changes["CHAT_MAX_TOKENS"]
+            if EMBED_MODEL_PARAMS & changes.keys():
+                reload_embed_model(settings.N_BATCH, settings.N_THREADS)
+                reloaded.append("embedding")
+        except Exception as e:
+            logger.error(f"Runtime reconfiguration failed: {e}")
+            error = str(e)
+            if reloaded:
+                error = f"{error} (already applied: {', '.join(reloaded)} model)"
+            self._update(status="failed", error=error, reloaded=reloaded, finished_at=time.time())
+            return
+        seconds = round(time.perf_counter() - started, 2)
+        logger.info(f"Runtime reconfiguration applied in {seconds}s: {changes}")
+        self._update(status="completed", reloaded=reloaded, seconds=seconds, finished_at=time.time())
+
+
+runtime_config = RuntimeReconfigurer()
@@ -0,0 +1,262 @@
+"""
+Portable collection snapshots: one zip archive holding a collection's chunk texts, metadata,
+embedding matrix, embedding-model fingerprint and `documents` rows (with their summaries).
+A collection built once can be imported on other installations without re-embedding anything.
+
+Archive layout:
+    manifest.json    format version, collection name, counts, fingerprint, embedding dtype
+    chunks.jsonl     one {"id", "document", "metadata"} per row, in matrix order
+    embeddings.npy   (rows, dim) matrix, float16 unless a value does not fit
+    documents.jsonl  `documents` rows: filename, source, file_hash, summary, upload_timestamp
+"""
+import io
+import json
+import os
+import re
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+from backend.database import get_db_connection, bump_collection_version, delete_collection_alias
+from backend.dedup import dedup_scope, forget_signatures, record_signatures, signature
+from backend.embedder import (
+    DIMENSION_KEY, FINGERPRINT_KEY, EmbeddingMismatch, check_fingerprint, embed_fingerprint, model_digest,
+)
+from backend.indexing import _delete_document_locked, collection_lock
+from backend.retrieval import ALL_COLLECTIONS
+from backend.vector_store import SHADOW_MARKER, get_vector_store
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+CHUNKS_NAME = "chunks.jsonl"
+EMBEDDINGS_NAME = "embeddings.npy"
+DOCUMENTS_NAME = "documents.jsonl"
+# Rows per add() on import; stays under Chroma's maximum batch size.
+IMPORT_BATCH = 1000
+
+_DOCUMENT_COLUMNS = ("filename", "source", "file_hash", "summary", "upload_timestamp")
+
+
+class SnapshotError(ValueError):
+    """The archive is not a snapshot this version can read."""
+
+
+class SnapshotConflict(SnapshotError):
+    """The target collection already exists and the import was not asked to replace it."""
+
+
+def _collection_fingerprint(collection_name: str, metadata: dict, dim: Optional[int]) -> dict:
+    if metadata.get(FINGERPRINT_KEY):
+        return {FINGERPRINT_KEY: metadata[FINGERPRINT_KEY], DIMENSION_KEY: int(metadata.get(DIMENSION_KEY) or dim)}
+    # Written before fingerprints were recorded: vouch for it only if the current model fits its vectors.
+    check_fingerprint(collection_name, metadata)
+    current = embed_fingerprint()
+    if dim and dim != current[DIMENSION_KEY]:
+        raise EmbeddingMismatch(
+            f"Collection {collection_name} has {dim}-dim vectors but the embedding model produces "
+            f"{current[DIMENSION_KEY]}; re-index it before exporting"
+        )
+    return dict(current)
+
+
+def export_snapshot(collection_name: str, path: Union[str, Path]) -> dict:
+    """Writes `collection_name` to a snapshot archive at `path`; returns what was written."""
+    with collection_lock(collection_name):
+        collection = get_vector_store().get_collection(name=collection_name)
+        metadata = dict(collection.metadata or {})
+        stored = collection.get(include=["documents", "metadatas", "embeddings"])
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute(f"SELECT {', '.join(_DOCUMENT_COLUMNS)} FROM documents WHERE collection_name = ? ORDER BY id",
+                  (collection_name,))
+        rows = [dict(zip(_DOCUMENT_COLUMNS, row)) for row in c.fetchall()]
+        c.execute('''
+            SELECT json_extract(payload, '$.source') FROM jobs
+            WHERE kind = 'summarize' AND status IN ('queued', 'running') AND json_extract(payload, '$.collection_name') = ?
+        ''', (collection_name,))
+        summarizing = {row[0] for row in c.fetchall()}
+        conn.close()
+
+    ids = stored["ids"]
+    embeddings = stored.get("embeddings")
+    matrix = np.asarray(embeddings if embeddings is not None and len(embeddings) else [], dtype=np.float32)
+    dim = matrix.shape[1] if matrix.ndim == 2 else None
+    fingerprint = _collection_fingerprint(collection_name, metadata, dim)
+    if dim is None:
+        matrix = np.zeros((0, fingerprint[DIMENSION_KEY]), dtype=np.float32)
+    # Half the size of float32 and well within the precision retrieval needs for unit-length vectors.
+    half = matrix.astype(np.float16)
+    if np.isfinite(half).all():
+        matrix = half
+    for row in rows:
+        if row["source"] in summarizing:
+            row["summary"] = None  # The job stays here; the importing side has nothing that would finish it.
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "collection_name": collection_name,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "chunks": len(ids),
+        "documents": len(rows),
+        "dtype": str(matrix.dtype),
+        "fingerprint": fingerprint,
+    }
+    documents = stored.get("documents") or [""] * len(ids)
+    metadatas = stored.get("metadatas") or [{} for _ in ids]
+    buffer = io.BytesIO()
+    np.save(buffer, matrix, allow_pickle=False)
+
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(CHUNKS_NAME, "".join(
+            json.dumps({"id": i, "document": d, "metadata": m}, ensure_ascii=False) + "\n"
+            for i, d, m in zip(ids, documents, metadatas)
+        ))
+        # Dense floats barely deflate; storing them keeps export and import fast.
+        archive.writestr(EMBEDDINGS_NAME, buffer.getvalue(), compress_type=zipfile.ZIP_STORED)
+        archive.writestr(DOCUMENTS_NAME, "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2))
+    os.replace(tmp_path, path)
+
+    logger.info(f"Exported {collection_name} to {path}: {len(ids)} chunks, {len(rows)} documents ({manifest['dtype']})")
+    return {**manifest, "path": str(path), "bytes": path.stat().st_size}
+
+
+def _read_snapshot(path: Union[str, Path]) -> tuple[dict, list, np.ndarray, list]:
+    try:
+        with zipfile.ZipFile(path) as archive:
+            manifest = json.loads(archive.read(MANIFEST_NAME))
+            if manifest.get("format") != SNAPSHOT_FORMAT:
+                raise SnapshotError(f"Unsupported snapshot format {manifest.get('format')} (expected {SNAPSHOT_FORMAT})")
+            records = [json.loads(line) for line in archive.read(CHUNKS_NAME).decode("utf-8").splitlines() if line]
+            matrix = np.load(io.BytesIO(archive.read(EMBEDDINGS_NAME)), allow_pickle=False)
+            documents = [json.loads(line) for line in archive.read(DOCUMENTS_NAME).decode("utf-8").splitlines() if line]
+    except (zipfile.BadZipFile, KeyError, ValueError) as e:
+        if isinstance(e, SnapshotError):
+            raise
+        raise SnapshotError(f"Not a readable snapshot: {e}") from e
+    if matrix.ndim != 2 or matrix.shape[0] != len(records):
+        raise SnapshotError(f"Snapshot has {len(records)} chunks but a {matrix.shape} embedding matrix")
+    if matrix.shape[1] != manifest["fingerprint"][DIMENSION_KEY]:
+        raise SnapshotError(f"Snapshot vectors are {matrix.shape[1]}-dim, its manifest says {manifest['fingerprint'][DIMENSION_KEY]}")
+    return manifest, records, matrix, documents
+
+
+def import_snapshot(path: Union[str, Path], collection_name: Optional[str] = None, replace: bool = False) -> dict:
+    """
+    Loads a snapshot archive as `collection_name` (default: the name it was exported under) using
+    its stored embeddings; the embedding model is never called. The collection is built under a
+    hidden name and swapped in at the end, so a failed import leaves nothing behind and `replace`
+    switches an existing collection over in one step.
+    Raises EmbeddingMismatch if the snapshot was built with a different embedding model.
+    """
+    manifest, records, matrix, documents = _read_snapshot(path)
+    name = collection_name or manifest["collection_name"]
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", name) or name.lower() == ALL_COLLECTIONS or SHADOW_MARKER in name:
+        raise SnapshotError(f"Invalid collection name: {name}")
+    fingerprint = manifest["fingerprint"]
+    if fingerprint[FINGERPRINT_KEY] != model_digest():
+        raise EmbeddingMismatch(
+            f"Snapshot of {manifest['collection_name']} was embedded with a different model ({fingerprint[FINGERPRINT_KEY]}); "
+            "import it where that model is configured, or rebuild the collection from the original files"
+        )
+
+    store = get_vector_store()
+    exists = name in {c.name for c in store.list_collections()}
+    if exists and not replace:
+        raise SnapshotConflict(f"Collection {name} already exists; import with replace to overwrite it")
+
+    started = time.perf_counter()
+    shadow_name = f"{name}{SHADOW_MARKER}_import_{int(time.time() * 1000)}"
+    shadow = store.create_collection(name=shadow_name, metadata=dict(fingerprint),
+                                     backend=store.backend_for(store.resolve(name)))
+    # Signatures are not exported; computed from the imported texts for collection-scope dedup.
+    signatures_by_source = {}
+    if dedup_scope(name) == "collection":
+        for record in records:
+            signatures_by_source.setdefault((record["metadata"] or {}).get("source"), []).append(
+                signature(record["document"] or ""))
+
+    previous = None
+    swapped = committed = False
+    try:
+        for i in range(0, len(records), IMPORT_BATCH):
+            batch = records[i:i + IMPORT_BATCH]
+            shadow.add(
+                ids=[r["id"] for r in batch],
+                documents=[r["document"] for r in batch],
+                metadatas=[r["metadata"] for r in batch],
+                embeddings=matrix[i:i + IMPORT_BATCH].astype(np.float32).tolist(),
+            )
+
+        with collection_lock(name):
+            current = {c.name for c in store.list_collections()}
+            if name in current and not replace:
+                raise SnapshotConflict(f"Collection {name} was created while the snapshot was loading")
+            if name in current:
+                previous = store.resolve(name)
+            store.swap_collection(name, shadow_name)
+            swapped = True
+
+            new_sources = {row["source"] for row in documents}
+            conn = get_db_connection()
+            try:
+                c = conn.cursor()
+                c.execute("SELECT source FROM documents WHERE collection_name = ?", (name,))
+                stale = {row[0] for row in c.fetchall() if row[0] and row[0] not in new_sources}
+                c.execute("DELETE FROM documents WHERE collection_name = ? AND source IS NULL", (name,))
+                c.executemany("DELETE FROM documents WHERE collection_name = ? AND source = ?",
+                              [(name, source) for source in new_sources])
+                c.executemany(f"INSERT INTO documents (collection_name, {', '.join(_DOCUMENT_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                              [(name, *(row.get(column) for column in _DOCUMENT_COLUMNS)) for row in documents])
+                conn.commit()
+            finally:
+                conn.close()
+            # The import stands from here on; what follows tidies up after the documents it replaced.
+            committed = True
+            # Replaced documents the snapshot does not have: drop their uploads, cached text and summary jobs.
+            imported = store.get_collection(name=name)
+            for source in stale:
+                _delete_document_locked(imported, name, source)
+            forget_signatures(name)
+            for source, signatures in signatures_by_source.items():
+                record_signatures(name, source, signatures)
+            bump_collection_version(name)
+    except BaseException:
+        if swapped and not committed:
+            # The shadow is already serving `name`: point it back at what served it before dropping the shadow.
+            try:
+                if previous:
+                    store.swap_collection(name, previous)
+                else:
+                    delete_collection_alias(name)
+                bump_collection_version(name)
+                swapped = False
+            except Exception as e:
+                logger.error(f"Could not restore {name} after a failed import; it stays on {shadow_name}: {e}")
+        if not swapped:
+            store.delete_physical_collection(shadow_name)
+        elif committed and previous:
+            store.delete_physical_collection(previous)
+        raise
+    if previous:
+        store.delete_physical_collection(previous)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Imported {len(records)} chunks, {len(documents)} documents into {name} in {elapsed:.1f}s")
+    return {
+        "collection_name": name,
+        "chunks": len(records),
+        "documents": len(documents),
+        "replaced": previous is not None,
+        "removed_documents": len(stale),
+        "seconds": round(elapsed, 2),
+    }
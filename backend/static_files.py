@@ -0,0 +1,108 @@
+import json
+import mimetypes
+import os
+from email.utils import parsedate
+from pathlib import Path
+from typing import Set
+
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+BUILD_DIR_NAME = "static_build"
+MANIFEST_NAME = "manifest.json"
+# Content-hashed names never change content, so browsers may keep them for a year without asking.
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Everything else is revalidated on each use; the ETag turns that into a 304 with no body.
+REVALIDATE = "no-cache"
+# Precompressed siblings written by build_static.py, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def static_root(bundle_dir: Path) -> Path:
+    """The build_static.py output when it has been built, else the plain static/ folder."""
+    built = bundle_dir / BUILD_DIR_NAME
+    source = bundle_dir / "static"
+    if not (built / MANIFEST_NAME).exists():
+        return source
+    if source.exists():
+        built_at = (built / MANIFEST_NAME).stat().st_mtime
+        if any(p.stat().st_mtime > built_at for p in source.rglob("*") if p.is_file()):
+            logger.warning(f"{source} changed after the last build; run build_static.py to refresh {built}")
+    return built
+
+
+def _accepted_encodings(request_headers: Headers) -> Set[str]:
+    accepted = set()
+    for part in request_headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _is_not_modified(response_headers: Headers, request_headers: Headers) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return if_none_match.strip() == "*" or response_headers["etag"] in tags
+    if_modified_since = parsedate(request_headers.get("if-modified-since", ""))
+    last_modified = parsedate(response_headers.get("last-modified", ""))
+    return bool(if_modified_since and last_modified and if_modified_since >= last_modified)
+
+
+def cached_file_response(full_path: str, request_headers: Headers, cache_control: str,
+                         status_code: int = 200) -> Response:
+    """
+    FileResponse for `full_path`, or its .br/.gz sibling when the client accepts it, with
+    `cache_control` and a 304 when If-None-Match / If-Modified-Since still match.
+    """
+    media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    path = full_path
+    accepted = _accepted_encodings(request_headers)
+    for name, suffix in ENCODINGS:
+        if name in accepted and os.path.isfile(full_path + suffix):
+            path = full_path + suffix
+            headers["Content-Encoding"] = name
+            break
+
+    # The ETag comes from the file actually sent, so each encoding validates separately.
+    response = FileResponse(path, status_code=status_code, headers=headers, media_type=media_type,
+                            stat_result=os.stat(path))
+    if _is_not_modified(response.headers, request_headers):
+        return NotModifiedResponse(response.headers)
+    return response
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles for build_static.py output: files listed as hashed in its manifest are served
+    as immutable, the rest revalidate through ETag, and precompressed copies are preferred.
+    Serves the unbuilt static/ folder the same way, just without hashed names or compression.
+    """
+
+    def __init__(self, directory: Path):
+        super().__init__(directory=str(directory))
+        self.fingerprinted: Set[str] = set()
+        manifest_path = Path(directory) / MANIFEST_NAME
+        if manifest_path.exists():
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.fingerprinted = set(json.load(f).values())
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        relative = Path(os.path.relpath(full_path, os.path.realpath(self.directory))).as_posix()
+        cache_control = IMMUTABLE if relative in self.fingerprinted else REVALIDATE
+        return cached_file_response(str(full_path), Headers(scope=scope), cache_control, status_code)
+
+
+def page_response(request: Request, path: Path) -> Response:
+    """An HTML page; revalidated on every visit, so a rebuild is picked up immediately."""
+    return cached_file_response(str(path), request.headers, REVALIDATE)
@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from backend.config import APP_DIR
+from backend.ingest import chunk_extracted, chunk_table_rows, extract_document, is_table, iter_table_rows
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+TEXT_CACHE_DIR = APP_DIR / "text_cache"
+
+
+def hash_file(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_path(file_hash: str) -> Path:
+    return TEXT_CACHE_DIR / file_hash[:2] / f"{file_hash}.json.gz"
+
+
+def _rows_path(file_hash: str) -> Path:
+    # Spreadsheets: one JSON line per row, plus one {"sheet", "header"} line where each sheet starts.
+    return TEXT_CACHE_DIR / file_hash[:2] / f"{file_hash}.rows.jsonl.gz"
+
+
+def _read_rows(path: Path) -> Iterator[Tuple[Optional[str], List[str], int, str]]:
+    sheet, header = None, None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if isinstance(record, dict):
+                sheet, header = record["sheet"], record["header"]
+            else:
+                yield sheet, header, record[0], record[1]
+
+
+def _cache_rows(file_hash: str, rows: Iterable[Tuple[Optional[str], List[str], int, str]]) -> Iterator[Tuple[Optional[str], List[str], int, str]]:
+    """Passes table rows through while writing them to the cache; the entry appears once the last row is written."""
+    path = _rows_path(file_hash)
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            current_sheet, current_header = object(), None
+            for row in rows:
+                sheet, header, row_number, line = row
+                if sheet != current_sheet or header is not current_header:
+                    current_sheet, current_header = sheet, header
+                    f.write(json.dumps({"sheet": sheet, "header": header}, ensure_ascii=False) + "\n")
+                f.write(json.dumps([row_number, line], ensure_ascii=False) + "\n")
+                yield row
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            os.remove(tmp_path)
+
+
+def get_extracted(file_hash: str) -> Optional[dict]:
+    path = _cache_path(file_hash)
+    if not path.exists():
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Discarding unreadable text cache entry {path.name}: {e}")
+        remove_extracted(file_hash)
+        return None
+
+
+def put_extracted(file_hash: str, extracted: dict):
+    path = _cache_path(file_hash)
+    os.makedirs(path.parent, exist_ok=True)
+    # Write-then-rename so concurrent writers (CLI worker processes, upload jobs) never expose a partial file.
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+        json.dump(extracted, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def remove_extracted(file_hash: str):
+    for path in (_cache_path(file_hash), _rows_path(file_hash)):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_chunks_cached(file_path: Optional[str], file_hash: Optional[str]) -> Tuple[List[str], List[dict]]:
+    """
+    Chunks for a document, parsing the original file only on a cache miss.
+    Chunking runs on every call, so CHUNK_SIZE / CHUNK_OVERLAP changes apply without re-parsing.
+    Spreadsheet rows are streamed from the file or the cache into row groups, never held as a whole.
+    """
+    if file_hash and _rows_path(file_hash).exists():
+        chunks, metadatas = chunk_table_rows(_read_rows(_rows_path(file_hash)), _rows_path(file_hash).name)
+        if chunks:
+            return chunks, metadatas
+        logger.warning(f"Discarding unreadable text cache entry {_rows_path(file_hash).name}")
+        remove_extracted(file_hash)
+    extracted = get_extracted(file_hash) if file_hash else None
+    if extracted is not None:
+        return chunk_extracted(extracted)
+    if not file_path or not os.path.exists(file_path):
+        logger.error(f"No cached text and no original file for {file_path} ({file_hash})")
+        return [], []
+    if is_table(file_path):
+        logger.info(f"Streaming table rows: {file_path}")
+        rows = iter_table_rows(file_path)
+        return chunk_table_rows(_cache_rows(file_hash, rows) if file_hash else rows, file_path)
+    extracted = extract_document(file_path)
+    if extracted and file_hash:
+        put_extracted(file_hash, extracted)
+    return chunk_extracted(extracted)
@@ -0,0 +1,176 @@
+import asyncio
+import codecs
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncGenerator, List, Optional, Union
+
+from fastapi import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Non-file form fields are short strings (collection name, flags); they are held in memory.
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """The request body or one of its form fields is over its size limit."""
+
+
+@dataclass
+class ReceivedField:
+    name: str
+    value: str
+
+
+@dataclass
+class ReceivedFile:
+    filename: str
+    path: Path
+    size: int = 0
+    sha256: str = ""
+    error: Optional[str] = None
+
+
+class _Part:
+    def __init__(self):
+        self.headers = {}
+        self.name = ""
+        self.data = bytearray()
+        self.file: Optional[ReceivedFile] = None
+        self.handle = None
+        self.digest = None
+
+
+async def iter_multipart(request: Request, incoming_dir: Path, max_file_bytes: int,
+                         max_request_bytes: int) -> AsyncGenerator[Union[ReceivedField, ReceivedFile], None]:
+    """
+    Parses a multipart/form-data body as it arrives and yields each part once it is complete.
+    File parts are streamed to `incoming_dir` with their SHA-256 computed on the fly, so a file
+    can be processed while later files in the same request are still uploading.
+    A file larger than `max_file_bytes` is deleted as soon as it passes the limit, and yielded with
+    `error` set once its part ends. Raises UploadTooLarge when the body read so far passes
+    `max_request_bytes` (Content-Length is not trusted: chunked bodies have none) or a form field
+    passes MAX_FIELD_BYTES.
+    """
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise ValueError("Missing boundary in multipart body")
+    charset = params.get(b"charset", b"utf-8").decode("latin-1")
+    try:
+        charset = codecs.lookup(charset).name
+    except LookupError:
+        charset = "latin-1"
+
+    os.makedirs(incoming_dir, exist_ok=True)
+    # Parser callbacks are synchronous; they queue events that are handled after each write().
+    events: List[tuple] = []
+    current = {"part": _Part(), "header_name": b"", "header_value": b""}
+
+    def on_part_begin():
+        current["part"] = _Part()
+
+    def on_header_field(data, start, end):
+        current["header_name"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        current["header_value"] += data[start:end]
+
+    def on_header_end():
+        current["part"].headers[current["header_name"].lower()] = current["header_value"]
+        current["header_name"] = b""
+        current["header_value"] = b""
+
+    def on_headers_finished():
+        part = current["part"]
+        _, options = parse_options_header(part.headers.get(b"content-disposition", b""))
+        part.name = options.get(b"name", b"").decode(charset, errors="replace")
+        if b"filename" in options:
+            filename = options[b"filename"].decode(charset, errors="replace")
+            part.file = ReceivedFile(filename=filename, path=incoming_dir / f"{uuid.uuid4().hex}.part")
+            events.append(("open", part))
+
+    def on_part_data(data, start, end):
+        part = current["part"]
+        if part.file is None:
+            if len(part.data) + end - start > MAX_FIELD_BYTES:
+                raise UploadTooLarge(f"Form field {part.name!r} exceeds {MAX_FIELD_BYTES // 1024} KB")
+            part.data.extend(data[start:end])
+        else:
+            events.append(("data", part, bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end", current["part"]))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    open_parts: List[_Part] = []
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_request_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_request_bytes // (1024 * 1024)} MB")
+            parser.write(chunk)
+            pending, events[:] = list(events), []
+            for event in pending:
+                kind, part = event[0], event[1]
+                if kind == "open":
+                    part.handle = await asyncio.to_thread(open, part.file.path, "wb")
+                    part.digest = hashlib.sha256()
+                    open_parts.append(part)
+                elif kind == "data":
+                    data = event[2]
+                    if part.file.error:
+                        continue
+                    part.file.size += len(data)
+                    if part.file.size > max_file_bytes:
+                        part.file.error = f"File exceeds the {max_file_bytes // (1024 * 1024)} MB upload limit"
+                        logger.warning(f"Upload rejected: {part.file.filename} ({part.file.error})")
+                        # The rest of the part is read and dropped; nothing more reaches the disk.
+                        await asyncio.to_thread(part.handle.close)
+                        await asyncio.to_thread(_remove_quietly, part.file.path)
+                        open_parts.remove(part)
+                        continue
+                    part.digest.update(data)
+                    await asyncio.to_thread(part.handle.write, data)
+                elif kind == "end":
+                    if part.file is None:
+                        yield ReceivedField(part.name, part.data.decode(charset, errors="replace"))
+                        continue
+                    if not part.file.error:
+                        await asyncio.to_thread(part.handle.close)
+                        open_parts.remove(part)
+                        part.file.sha256 = part.digest.hexdigest()
+                    yield part.file
+        parser.finalize()
+    finally:
+        # Interrupted uploads leave no partial files behind.
+        for part in open_parts:
+            part.handle.close()
+            _remove_quietly(part.file.path)
+
+
+def _remove_quietly(path: Path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,706 @@
+import itertools
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from backend.config import settings, APP_DIR
+from backend.database import get_chroma_client, get_collection_aliases, set_collection_alias, delete_collection_alias
+from backend.file_lock import InterProcessLock
+from backend.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+VECTOR_INDEX_PATH = APP_DIR / "vector_index"
+BACKEND_CHROMA = "chroma"
+BACKEND_NUMPY = "numpy"
+# Physical collections built by a re-index carry this marker; they are only visible through an alias.
+SHADOW_MARKER = "__reindex"
+# Held by the process writing a NumPy collection; kept in the collection directory.
+WRITE_LOCK_FILE = "write.lock"
+
+# Rows scored per matrix multiply; bounds the float32 copy made from float16/int8 storage.
+_SCORE_BLOCK = 16384
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 12, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means on row vectors. Returns (centroids, assignments)."""
+    data = np.asarray(data, dtype=np.float32)
+    k = max(1, min(k, len(data)))
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    assignments = np.zeros(len(data), dtype=np.int32)
+    for _ in range(iterations):
+        assignments = np.argmax(data @ centroids.T, axis=1).astype(np.int32)
+        for c in range(k):
+            members = data[assignments == c]
+            if len(members):
+                centroid = members.mean(axis=0)
+                norm = np.linalg.norm(centroid)
+                centroids[c] = centroid / norm if norm > 0 else centroid
+    return centroids, assignments
+
+
+def _matches(metadata: Optional[dict], where: Optional[dict]) -> bool:
+    """Evaluates the subset of Chroma's `where` filter syntax used by this app."""
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, c) for c in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, expected in condition.items():
+                if op == "$eq" and value != expected:
+                    return False
+                if op == "$ne" and value == expected:
+                    return False
+                if op == "$in" and value not in expected:
+                    return False
+                if op == "$nin" and value in expected:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class NumpyCollection:
+    """
+    Brute-force vector collection stored as quantized NumPy arrays plus JSON-lines metadata sidecars.
+    Mirrors the subset of the Chroma Collection API used by the app (add/get/query/delete/count/modify).
+    Vectors are unit-normalized at insert time and distances are cosine distances.
+
+    Storage is append-only. Each add() writes one immutable segment (records, embeddings and, once
+    an IVF index exists, list assignments) and delete() only records the deleted rows. Trailing
+    segments are merged when the newest is at least as large as the one before it, so a collection
+    has O(log n) segments and every row is rewritten O(log n) times. Deleted rows are dropped by a
+    compaction, once they exceed VECTOR_COMPACT_DELETED_RATIO of the rows or when the IVF index is
+    retrained. collection.json names the live files and is switched atomically, so memory-mapped
+    readers never see a partially written index; other processes pick up changes through refresh(),
+    reading only the rows added since they last loaded. Writers hold an OS lock on write.lock from
+    that refresh until their commit, so API workers and the CLI never write concurrently.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._write_lock = InterProcessLock(path / WRITE_LOCK_FILE)
+        self._reset()
+        self._loaded_stamp = self._stamp(self.path / "collection.json")
+        self._apply(self._read_info())
+
+    # --- Storage ---
+
+    @staticmethod
+    def _stamp(info_path: Path) -> tuple:
+        stat = os.stat(info_path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _reset(self):
+        self._info: Optional[dict] = None
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[dict] = []
+        self._segments: List[dict] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._alive_count = 0
+        self._row_of: Dict[str, int] = {}
+        self._source_rows: Optional[Dict[str, List[int]]] = None
+        self._centroids = None
+        self._decoded = None
+
+    def _read_info(self) -> dict:
+        with open(self.path / "collection.json", "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if "segments" in info:
+            return info
+        # Written before segments: one generation of whole-collection files.
+        generation = info.get("generation", 0)
+        ivf_built_at = info.get("ivf_built_at", 0) if generation else 0
+        info["segments"] = [{
+            "records": f"records-{generation}.jsonl",
+            "embeddings": f"embeddings-{generation}.npy",
+            "scales": f"scales-{generation}.npy" if info.get("dtype") == "int8" else None,
+            "assignments": f"ivf_assignments-{generation}.npy" if ivf_built_at else None,
+            "rows": None,
+        }] if generation else []
+        info["ivf"] = {"centroids": f"ivf_centroids-{generation}.npy", "built_at": ivf_built_at} if ivf_built_at else None
+        info.update(next_segment=0, deleted=None, compaction=0)
+        info.pop("ivf_built_at", None)
+        return info
+
+    def _load_segment(self, entry: dict) -> dict:
+        embeddings = np.load(self.path / entry["embeddings"], mmap_mode="r")
+        return {
+            "embeddings": embeddings,
+            "scales": np.load(self.path / entry["scales"]) if entry["scales"] else None,
+            "assignments": np.load(self.path / entry["assignments"]) if entry["assignments"] else None,
+            "rows": len(embeddings),
+        }
+
+    def _apply(self, info: dict):
+        """
+        Brings the in-memory view up to `info`. Rows already loaded are kept unless a compaction
+        renumbered them; only the records of newly added rows are read. All files are read before
+        any state changes, so a FileNotFoundError (files replaced by another writer) leaves it intact.
+        """
+        old = self._info
+        if old is not None and info.get("compaction") != old.get("compaction"):
+            old = None
+        cached = {s["file"]: s for s in self._segments} if old is not None else {}
+        loaded = len(self.ids) if old is not None else 0
+
+        segments, start = [], 0
+        for entry in info["segments"]:
+            segment = cached.get(entry["embeddings"]) or self._load_segment(entry)
+            segment = {**segment, "file": entry["embeddings"], "start": start}
+            entry["rows"] = segment["rows"]
+            segments.append(segment)
+            start += segment["rows"]
+        total = start
+        if total < loaded:
+            old, loaded = None, 0
+
+        new_ids, new_documents, new_metadatas = [], [], []
+        for entry, segment in zip(info["segments"], segments):
+            if segment["start"] + segment["rows"] <= loaded:
+                continue
+            with open(self.path / entry["records"], "r", encoding="utf-8") as f:
+                for line in itertools.islice(f, max(0, loaded - segment["start"]), None):
+                    record = json.loads(line)
+                    new_ids.append(record["id"])
+                    new_documents.append(record["document"])
+                    new_metadatas.append(record["metadata"])
+        alive = np.ones(total, dtype=bool)
+        if info.get("deleted"):
+            alive[np.load(self.path / info["deleted"])] = False
+        centroids = self._centroids if old is not None and old.get("ivf") == info.get("ivf") else None
+        if info.get("ivf") and centroids is None:
+            centroids = np.load(self.path / info["ivf"]["centroids"])
+
+        if old is None:
+            self._reset()
+        previous_alive = self._alive
+        self._info = info
+        self.name = info["name"]
+        self.metadata = info.get("metadata") or {}
+        self.dtype = info.get("dtype", "float16")
+        self.dim = info.get("dim")
+        self._segments = segments
+        self._centroids = centroids if info.get("ivf") else None
+        self._decoded = None
+
+        for row in np.nonzero(previous_alive & ~alive[:loaded])[0].tolist():
+            self._row_of.pop(self.ids[row], None)
+        for offset, record_id in enumerate(new_ids):
+            if alive[loaded + offset]:
+                self._row_of[record_id] = loaded + offset
+        if self._source_rows is not None:
+            for offset, metadata in enumerate(new_metadatas):
+                self._source_rows.setdefault(metadata.get("source"), []).append(loaded + offset)
+        self.ids.extend(new_ids)
+        self.documents.extend(new_documents)
+        self.metadatas.extend(new_metadatas)
+        self._alive = alive
+        self._alive_count = int(alive.sum())
+
+    def _next_info(self) -> dict:
+        info = json.loads(json.dumps(self._info))
+        info.update(name=self.name, metadata=self.metadata, dim=self.dim, generation=info.get("generation", 0) + 1)
+        return info
+
+    def _new_segment_name(self, info: dict) -> str:
+        name = f"segment-{info['next_segment']}"
+        info["next_segment"] += 1
+        return name
+
+    def _commit(self, info: dict):
+        """Switches collection.json to `info`, whose files are already written, and loads the change."""
+        tmp_path = self.path / "collection.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(tmp_path, self.path / "collection.json")
+        self._loaded_stamp = self._stamp(self.path / "collection.json")
+        self._apply(info)
+        self._remove_unreferenced()
+
+    def refresh(self):
+        """Loads changes if collection.json was replaced since it was read, e.g. by another API worker."""
+        with self._lock:
+            for _ in range(3):
+                try:
+                    stamp = self._stamp(self.path / "collection.json")
+                except FileNotFoundError:
+                    return
+                if stamp == self._loaded_stamp:
+                    return
+                try:
+                    self._apply(self._read_info())
+                except FileNotFoundError:
+                    continue  # The writer replaced those files again meanwhile; read the newer collection.json.
+                self._loaded_stamp = stamp
+                return
+
+    def _remove_unreferenced(self):
+        info = self._info
+        referenced = {"collection.json", WRITE_LOCK_FILE}
+        for entry in info["segments"]:
+            referenced.update(name for key, name in entry.items() if key != "rows" and name)
+        if info.get("deleted"):
+            referenced.add(info["deleted"])
+        if info.get("ivf"):
+            referenced.add(info["ivf"]["centroids"])
+        for file in self.path.iterdir():
+            if file.name in referenced or file.suffix == ".tmp":
+                continue
+            try:
+                file.unlink()
+            except OSError:
+                # Still memory-mapped (Windows); removed after a later write.
+                pass
+
+    def _quantize(self, vectors: np.ndarray) -> tuple[np.ndarray, Optional[np.ndarray]]:
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+            return quantized, scales.astype(np.float32)
+        return vectors.astype(np.float16), None
+
+    @staticmethod
+    def _decode(segment: dict, local) -> np.ndarray:
+        block = np.asarray(segment["embeddings"][local], dtype=np.float32)
+        if segment["scales"] is not None:
+            block = block * segment["scales"][local][:, None]
+        return block
+
+    def _decoded_cache(self) -> Optional[np.ndarray]:
+        if self._decoded is None and self._segments:
+            # Small collections keep a float32 copy; float16/int8 -> float32 conversion dominates query time.
+            if len(self.ids) * (self.dim or 0) * 4 <= settings.VECTOR_DECODE_CACHE_MB * 1024 ** 2:
+                self._decoded = np.concatenate([self._decode(s, slice(None)) for s in self._segments])
+        return self._decoded
+
+    def _blocks(self):
+        """Yields (first row, float32 block) over every stored row, deleted ones included."""
+        decoded = self._decoded_cache()
+        if decoded is not None:
+            for start in range(0, len(decoded), _SCORE_BLOCK):
+                yield start, decoded[start:start + _SCORE_BLOCK]
+            return
+        for segment in self._segments:
+            for offset in range(0, segment["rows"], _SCORE_BLOCK):
+                yield segment["start"] + offset, self._decode(segment, slice(offset, offset + _SCORE_BLOCK))
+
+    def _gather(self, rows: np.ndarray, decode: bool = True) -> np.ndarray:
+        """Embeddings of global `rows`: float32, or as stored when `decode` is False."""
+        decoded = self._decoded_cache() if decode else None
+        if decoded is not None:
+            return decoded[rows]
+        dtype = np.float32 if decode else self._segments[0]["embeddings"].dtype
+        out = np.empty((len(rows), self.dim), dtype=dtype)
+        starts = np.array([s["start"] for s in self._segments])
+        owners = np.searchsorted(starts, rows, side="right") - 1
+        for index in np.unique(owners):
+            segment, picked = self._segments[index], owners == index
+            local = rows[picked] - segment["start"]
+            out[picked] = self._decode(segment, local) if decode else segment["embeddings"][local]
+        return out
+
+    def _gather_column(self, key: str, rows: np.ndarray) -> np.ndarray:
+        """Per-row `scales` or `assignments` of sorted global `rows`."""
+        return np.concatenate([
+            self._segments[i][key][rows[(rows >= s["start"]) & (rows < s["start"] + s["rows"])] - s["start"]]
+            for i, s in enumerate(self._segments)
+        ])
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+    def _merge_tail(self, info: dict):
+        """Merges trailing segments while the newest is at least as large as the one before it."""
+        segments = info["segments"]
+        while len(segments) >= 2 and segments[-1]["rows"] >= segments[-2]["rows"]:
+            pair = segments[-2:]
+            name = self._new_segment_name(info)
+            merged = {"records": f"{name}.records.jsonl", "embeddings": f"{name}.embeddings.npy",
+                      "scales": None, "assignments": None, "rows": pair[0]["rows"] + pair[1]["rows"]}
+            with open(self.path / merged["records"], "wb") as out:
+                for entry in pair:
+                    with open(self.path / entry["records"], "rb") as f:
+                        shutil.copyfileobj(f, out)
+            for key, suffix in (("embeddings", "embeddings"), ("scales", "scales"), ("assignments", "ivf")):
+                if pair[0][key]:
+                    merged[key] = f"{name}.{suffix}.npy"
+                    np.save(self.path / merged[key], np.concatenate([
+                        np.load(self.path / entry[key], mmap_mode="r") for entry in pair
+                    ]))
+            segments[-2:] = [merged]
+
+    def _needs_training(self) -> bool:
+        ivf = self._info.get("ivf")
+        count = self._alive_count
+        return count >= settings.VECTOR_IVF_MIN_VECTORS and (ivf is None or count >= ivf["built_at"] * 1.2)
+
+    def _compact(self):
+        """Rewrites the live rows as one segment, dropping deleted rows, and (re)builds the IVF index."""
+        info = self._next_info()
+        info["compaction"] = info.get("compaction", 0) + 1
+        info.update(segments=[], deleted=None, ivf=None)
+        rows = np.nonzero(self._alive)[0]
+        if len(rows):
+            name = self._new_segment_name(info)
+            entry = {"records": f"{name}.records.jsonl", "embeddings": f"{name}.embeddings.npy",
+                     "scales": None, "assignments": None, "rows": len(rows)}
+            with open(self.path / entry["records"], "w", encoding="utf-8") as f:
+                for row in rows.tolist():
+                    f.write(json.dumps({"id": self.ids[row], "document": self.documents[row], "metadata": self.metadatas[row]}) + "\n")
+            np.save(self.path / entry["embeddings"], self._gather(rows, decode=False))
+            if self.dtype == "int8":
+                entry["scales"] = f"{name}.scales.npy"
+                np.save(self.path / entry["scales"], self._gather_column("scales", rows))
+
+            count = len(rows)
+            ivf = self._info.get("ivf")
+            if count >= settings.VECTOR_IVF_MIN_VECTORS:
+                if self._centroids is not None and count < ivf["built_at"] * 1.2:
+                    # Reuse centroids until the collection has grown enough to retrain.
+                    centroids, built_at = self._centroids, ivf["built_at"]
+                    assignments = self._gather_column("assignments", rows)
+                else:
+                    nlist = int(np.sqrt(count))
+                    logger.info(f"Training IVF for {self.name}: {count} vectors, {nlist} lists")
+                    rng = np.random.default_rng(0)
+                    sample = np.sort(rng.choice(count, size=min(count, nlist * 64), replace=False))
+                    centroids, _ = kmeans(self._gather(rows[sample]), nlist)
+                    built_at = count
+                    assignments = np.concatenate([
+                        self._assign(self._gather(rows[i:i + _SCORE_BLOCK]), centroids)
+                        for i in range(0, count, _SCORE_BLOCK)
+                    ])
+                entry["assignments"] = f"{name}.ivf.npy"
+                np.save(self.path / entry["assignments"], assignments)
+                info["ivf"] = {"centroids": f"ivf_centroids-{info['generation']}.npy", "built_at": built_at}
+                np.save(self.path / info["ivf"]["centroids"], centroids)
+            info["segments"] = [entry]
+        self._commit(info)
+
+    # --- Chroma-compatible API ---
+
+    def count(self) -> int:
+        return self._alive_count
+
+    def modify(self, name: Optional[str] = None, metadata: Optional[dict] = None):
+        with self._write_lock, self._lock:
+            self.refresh()
+            if metadata is not None:
+                self.metadata = metadata
+            self._commit(self._next_info())
+
+    def add(self, ids: List[str], embeddings: List[List[float]], documents: Optional[List[str]] = None,
+            metadatas: Optional[List[dict]] = None):
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+        documents = documents or [""] * len(ids)
+        metadatas = metadatas or [{} for _ in ids]
+
+        with self._write_lock, self._lock:
+            self.refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimension {self.dim}")
+            duplicate = {i for i in ids if i in self._row_of}
+            if duplicate:
+                raise ValueError(f"IDs already exist in collection {self.name}: {sorted(duplicate)[:5]}")
+
+            info = self._next_info()
+            name = self._new_segment_name(info)
+            entry = {"records": f"{name}.records.jsonl", "embeddings": f"{name}.embeddings.npy",
+                     "scales": None, "assignments": None, "rows": len(ids)}
+            with open(self.path / entry["records"], "w", encoding="utf-8") as f:
+                for record_id, document, metadata in zip(ids, documents, metadatas):
+                    f.write(json.dumps({"id": record_id, "document": document, "metadata": metadata}) + "\n")
+            quantized, scales = self._quantize(vectors)
+            np.save(self.path / entry["embeddings"], quantized)
+            if scales is not None:
+                entry["scales"] = f"{name}.scales.npy"
+                np.save(self.path / entry["scales"], scales)
+            if self._centroids is not None:
+                # Only the new rows are assigned; the index is retrained (with a compaction) as it grows.
+                entry["assignments"] = f"{name}.ivf.npy"
+                np.save(self.path / entry["assignments"], self._assign(vectors, self._centroids))
+            info["segments"].append(entry)
+            self._merge_tail(info)
+            self._commit(info)
+            if self._needs_training():
+                self._compact()
+
+    def _rows_for_source(self, source: str) -> List[int]:
+        if self._source_rows is None:
+            index: Dict[str, List[int]] = {}
+            for i, metadata in enumerate(self.metadatas):
+                index.setdefault(metadata.get("source"), []).append(i)
+            self._source_rows = index
+        return [i for i in self._source_rows.get(source, []) if self._alive[i]]
+
+    def _select(self, ids: Optional[List[str]], where: Optional[dict]) -> List[int]:
+        if ids:
+            rows = sorted(self._row_of[i] for i in set(ids) if i in self._row_of)
+            return [i for i in rows if _matches(self.metadatas[i], where)]
+        source = where.get("source") if where and len(where) == 1 else None
+        if isinstance(source, str):
+            # Per-document operations (delete, replace, re-index) filter on source alone.
+            return self._rows_for_source(source)
+        return [i for i in np.nonzero(self._alive)[0].tolist() if _matches(self.metadatas[i], where)]
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[List[str]] = None) -> dict:
+        include = ["metadatas", "documents"] if include is None else include
+        with self._lock:
+            rows = self._select(ids, where)
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            result = {"ids": [self.ids[i] for i in rows]}
+            if "documents" in include:
+                result["documents"] = [self.documents[i] for i in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [self.metadatas[i] for i in rows]
+            if "embeddings" in include:
+                result["embeddings"] = self._gather(np.asarray(rows, dtype=np.int64)) if rows else np.zeros((0, self.dim or 0), dtype=np.float32)
+            return result
+
+    def _candidate_rows(self, query: np.ndarray, where: Optional[dict]) -> Optional[np.ndarray]:
+        rows = None
+        if self._centroids is not None:
+            nprobe = min(settings.VECTOR_IVF_NPROBE, len(self._centroids))
+            probed = np.argsort(-(self._centroids @ query))[:nprobe]
+            rows = np.concatenate([
+                np.nonzero(np.isin(s["assignments"], probed))[0] + s["start"] for s in self._segments
+            ])
+        if where:
+            filtered = np.asarray(self._select(None, where), dtype=np.int64)
+            rows = filtered if rows is None else np.intersect1d(rows, filtered)
+        if rows is not None:
+            rows = rows[self._alive[rows]]
+        return rows
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, where: Optional[dict] = None,
+              include: Optional[List[str]] = None) -> dict:
+        include = include or ["metadatas", "documents", "distances"]
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._lock:
+            for raw_query in query_embeddings:
+                query = np.asarray(raw_query, dtype=np.float32)
+                norm = np.linalg.norm(query)
+                if norm > 0:
+                    query = query / norm
+
+                rows = self._candidate_rows(query, where) if self.count() else np.zeros(0, dtype=np.int64)
+                if rows is None:
+                    scores = np.concatenate([block @ query for _, block in self._blocks()])
+                    scores[~self._alive] = -np.inf
+                    row_ids = np.arange(len(scores))
+                    available = self.count()
+                else:
+                    scores = self._gather(rows) @ query if len(rows) else np.zeros(0, dtype=np.float32)
+                    row_ids = rows
+                    available = len(rows)
+
+                k = min(n_results, available)
+                if k:
+                    top = np.argpartition(-scores, k - 1)[:k]
+                    top = top[np.argsort(-scores[top])]
+                else:
+                    top = np.zeros(0, dtype=np.int64)
+                picked = [int(row_ids[i]) for i in top]
+
+                result["ids"].append([self.ids[i] for i in picked])
+                result["documents"].append([self.documents[i] for i in picked])
+                result["metadatas"].append([self.metadatas[i] for i in picked])
+                result["distances"].append([float(1.0 - scores[i]) for i in top])
+        return {k: v for k, v in result.items() if k == "ids" or k in include}
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None):
+        with self._write_lock, self._lock:
+            self.refresh()
+            doomed = self._select(ids, where)
+            if not doomed:
+                return
+            info = self._next_info()
+            deleted = np.union1d(np.nonzero(~self._alive)[0], np.asarray(doomed, dtype=np.int64))
+            info["deleted"] = f"deleted-{info['generation']}.npy"
+            np.save(self.path / info["deleted"], deleted)
+            self._commit(info)
+            if len(deleted) > settings.VECTOR_COMPACT_DELETED_RATIO * len(self.ids) or not self.count():
+                self._compact()
+
+
+class NumpyVectorClient:
+    """Chroma-client-like container for NumpyCollection directories under `root`."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+
+    def exists(self, name: str) -> bool:
+        return (self.root / name / "collection.json").exists()
+
+    def list_collections(self) -> List[NumpyCollection]:
+        if not self.root.exists():
+            return []
+        return [self.get_collection(p.name) for p in sorted(self.root.iterdir()) if self.exists(p.name)]
+
+    def get_collection(self, name: str) -> NumpyCollection:
+        with self._lock:
+            if not self.exists(name):
+                self._collections.pop(name, None)
+                raise ValueError(f"Collection {name} does not exist.")
+            if name not in self._collections:
+                self._collections[name] = NumpyCollection(self.root / name)
+            else:
+                self._collections[name].refresh()
+            return self._collections[name]
+
+    def create_collection(self, name: str, metadata: Optional[dict] = None) -> NumpyCollection:
+        with self._lock:
+            if self.exists(name):
+                raise ValueError(f"Collection {name} already exists.")
+            path = self.root / name
+            os.makedirs(path, exist_ok=True)
+            info = {
+                "name": name,
+                "metadata": {**(metadata or {}), "hnsw:space": "cosine"},
+                "dtype": settings.VECTOR_QUANTIZATION,
+                "dim": None,
+                "generation": 0,
+                "next_segment": 0,
+                "segments": [],
+                "deleted": None,
+                "ivf": None,
+                "compaction": 0,
+            }
+            with open(path / "collection.json", "w", encoding="utf-8") as f:
+                json.dump(info, f)
+            self._collections[name] = NumpyCollection(path)
+            return self._collections[name]
+
+    def get_or_create_collection(self, name: str, metadata: Optional[dict] = None) -> NumpyCollection:
+        if self.exists(name):
+            return self.get_collection(name)
+        return self.create_collection(name, metadata=metadata)
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            if not self.exists(name):
+                raise ValueError(f"Collection {name} does not exist.")
+            self._collections.pop(name, None)
+            shutil.rmtree(self.root / name, ignore_errors=True)
+
+
+class VectorStore:
+    """
+    Routes collection operations to Chroma or the in-process NumPy backend.
+    Existing collections keep the backend they were created with; new collections use
+    VECTOR_BACKEND_COLLECTIONS overrides, falling back to VECTOR_BACKEND.
+    """
+
+    def __init__(self):
+        self.numpy_client = NumpyVectorClient(VECTOR_INDEX_PATH)
+
+    def backend_for(self, name: str) -> str:
+        if self.numpy_client.exists(name):
+            return BACKEND_NUMPY
+        configured = settings.VECTOR_BACKEND_COLLECTIONS.get(name, settings.VECTOR_BACKEND)
+        if configured == BACKEND_NUMPY and name not in {c.name for c in get_chroma_client().list_collections()}:
+            return BACKEND_NUMPY
+        return BACKEND_CHROMA
+
+    def _client(self, name: str):
+        return self.numpy_client if self.backend_for(name) == BACKEND_NUMPY else get_chroma_client()
+
+    def resolve(self, name: str) -> str:
+        """Physical collection currently serving the logical `name`."""
+        return get_collection_aliases().get(name, name)
+
+    def list_collections(self) -> list:
+        by_target = {target: name for name, target in get_collection_aliases().items()}
+        collections = []
+        for collection in list(get_chroma_client().list_collections()) + self.numpy_client.list_collections():
+            if collection.name in by_target:
+                collections.append(_AliasedCollection(collection, by_target[collection.name]))
+            elif SHADOW_MARKER not in collection.name:
+                # Shadows without an alias are re-indexes still running (or abandoned by a crash).
+                collections.append(collection)
+        return collections
+
+    def get_collection(self, name: str):
+        physical = self.resolve(name)
+        collection = self._client(physical).get_collection(name=physical)
+        return _AliasedCollection(collection, name) if physical != name else collection
+
+    @staticmethod
+    def _cosine(metadata: Optional[dict]) -> dict:
+        # Chroma defaults to l2; the space is fixed at creation (existing collections ignore it).
+        return {**(metadata or {}), "hnsw:space": "cosine"}
+
+    def create_collection(self, name: str, metadata: Optional[dict] = None, backend: Optional[str] = None):
+        if name in {c.name for c in self.list_collections()}:
+            raise ValueError(f"Collection {name} already exists.")
+        client = self._client(name) if backend is None else (self.numpy_client if backend == BACKEND_NUMPY else get_chroma_client())
+        return client.create_collection(name=name, metadata=self._cosine(metadata))
+
+    def get_or_create_collection(self, name: str, metadata: Optional[dict] = None):
+        physical = self.resolve(name)
+        collection = self._client(physical).get_or_create_collection(name=physical, metadata=self._cosine(metadata))
+        return _AliasedCollection(collection, name) if physical != name else collection
+
+    def delete_collection(self, name: str):
+        physical = self.resolve(name)
+        self._client(physical).delete_collection(name=physical)
+        if physical != name:
+            delete_collection_alias(name)
+
+    def delete_physical_collection(self, physical: str):
+        """Drops a collection by its physical name, e.g. a replaced original or an abandoned shadow."""
+        self._client(physical).delete_collection(name=physical)
+
+    def swap_collection(self, name: str, target: str) -> str:
+        """Points `name` at the physical collection `target` in one step; returns the one it replaced."""
+        previous = self.resolve(name)
+        set_collection_alias(name, target)
+        logger.info(f"Collection {name} now served by {target} (was {previous})")
+        return previous
+
+
+class _AliasedCollection:
+    """A physical collection presented under the logical name it serves."""
+
+    def __init__(self, collection, name: str):
+        self._collection = collection
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._collection, attr)
+
+
+_vector_store = VectorStore()
+
+
+def get_vector_store() -> VectorStore:
+    return _vector_store
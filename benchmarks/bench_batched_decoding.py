@@ -0,0 +1,84 @@
+"""
+Compares aggregate generation throughput for concurrent chats: one-at-a-time on the main
+context versus parallel sequences in the batched decoding engine.
+
+Usage:
+    python benchmarks/bench_batched_decoding.py --users 4 --max-tokens 128
+    python benchmarks/bench_batched_decoding.py --model path/to/model.gguf --slots 8
+"""
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from llama_cpp import Llama  # noqa: E402
+
+from backend.batch_engine import BatchedEngine  # noqa: E402
+from backend.config import settings  # noqa: E402
+
+PROMPTS = [
+    "Explain how a vector database finds similar documents.",
+    "Write a short note on leave policy best practices.",
+    "Summarize the benefits of retrieval-augmented generation.",
+    "List steps to onboard a new employee.",
+    "Describe how to keep meeting notes useful.",
+    "What makes a good project status update?",
+    "Give tips for writing clear documentation.",
+    "How should a team handle production incidents?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=str(settings.CHAT_MODEL_PATH))
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--slots", type=int, default=settings.BATCHED_SLOTS)
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--n-ctx", type=int, default=settings.N_CTX)
+    args = parser.parse_args()
+
+    llm = Llama(model_path=args.model, n_ctx=args.n_ctx, n_batch=settings.N_BATCH,
+                n_threads=settings.N_THREADS, verbose=False)
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(args.users)]
+
+    start = time.perf_counter()
+    sequential_tokens = 0
+    for prompt in prompts:
+        output = llm.create_completion(prompt, max_tokens=args.max_tokens, temperature=0.3)
+        sequential_tokens += output["usage"]["completion_tokens"]
+    sequential = time.perf_counter() - start
+
+    engine = BatchedEngine(llm, args.slots, args.n_ctx, settings.N_BATCH, settings.N_THREADS)
+    handles = []
+
+    def consume(handle):
+        for _ in handle:
+            pass
+
+    start = time.perf_counter()
+    for prompt in prompts:
+        handles.append(engine.submit(llm.tokenize(prompt.encode("utf-8"), add_bos=True, special=True),
+                                     max_tokens=args.max_tokens, temperature=0.3))
+    threads = [threading.Thread(target=consume, args=(h,)) for h in handles]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batched = time.perf_counter() - start
+    batched_tokens = sum(h.completion_tokens for h in handles)
+    engine.stop()
+    first_token = [h.first_token_at - h.queued_at for h in handles if h.first_token_at]
+
+    print(f"{args.users} users, {args.max_tokens} max tokens, {engine.slots} slots")
+    print(f"{'mode':<12}{'seconds':>10}{'tokens':>10}{'tok/s':>10}")
+    print(f"{'sequential':<12}{sequential:>10.2f}{sequential_tokens:>10}{sequential_tokens / sequential:>10.1f}")
+    print(f"{'batched':<12}{batched:>10.2f}{batched_tokens:>10}{batched_tokens / batched:>10.1f}")
+    if first_token:
+        print(f"batched time to first token: max {max(first_token):.2f}s, mean {sum(first_token) / len(first_token):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
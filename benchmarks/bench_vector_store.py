@@ -0,0 +1,106 @@
+"""
+Compares the Chroma and in-process NumPy vector backends on synthetic embeddings.
+
+Usage:
+    python benchmarks/bench_vector_store.py --vectors 20000 --dim 768 --queries 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from backend.config import settings  # noqa: E402
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def _percentile(values, pct):
+    return float(np.percentile(np.asarray(values), pct)) if values else 0.0
+
+
+def _unit(rows: np.ndarray) -> np.ndarray:
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def _run(name, collection, vectors, queries, batch_size, top_k, root):
+    ids = [f"chunk_{i}" for i in range(len(vectors))]
+    documents = [f"document text {i}" for i in range(len(vectors))]
+    metadatas = [{"source": f"file_{i // 50}", "chunk_index": i % 50} for i in range(len(vectors))]
+
+    start = time.perf_counter()
+    for i in range(0, len(vectors), batch_size):
+        collection.add(
+            ids=ids[i:i + batch_size],
+            embeddings=vectors[i:i + batch_size].tolist(),
+            documents=documents[i:i + batch_size],
+            metadatas=metadatas[i:i + batch_size],
+        )
+    build_s = time.perf_counter() - start
+
+    # Warm-up query so both backends are measured with their index loaded.
+    collection.query(query_embeddings=[queries[0].tolist()], n_results=top_k)
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[q.tolist()], n_results=top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "backend": name,
+        "build_s": build_s,
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "disk_mb": _dir_size(root) / (1024 ** 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=settings.RETRIEVED_DOCS_COUNT)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--quantization", choices=["float16", "int8"], default=settings.VECTOR_QUANTIZATION)
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = _unit(rng.normal(size=(args.vectors, args.dim)).astype(np.float32))
+    queries = _unit(rng.normal(size=(args.queries, args.dim)).astype(np.float32))
+
+    from backend.vector_store import NumpyVectorClient
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.VECTOR_QUANTIZATION = args.quantization
+        numpy_root = Path(tmp) / "numpy"
+        client = NumpyVectorClient(numpy_root)
+        rows.append(_run(f"numpy-{args.quantization}", client.create_collection("bench"), vectors, queries,
+                         args.batch_size, args.top_k, numpy_root))
+
+        if not args.skip_chroma:
+            import chromadb
+            from chromadb.config import Settings
+
+            chroma_root = Path(tmp) / "chroma"
+            chroma = chromadb.PersistentClient(path=str(chroma_root), settings=Settings(anonymized_telemetry=False))
+            rows.append(_run("chroma", chroma.create_collection("bench"), vectors, queries,
+                             args.batch_size, args.top_k, chroma_root))
+
+    print(f"\n{args.vectors} vectors x {args.dim} dims, {args.queries} queries, top_k={args.top_k}")
+    print(f"{'backend':<16}{'build (s)':>12}{'p50 (ms)':>12}{'p95 (ms)':>12}{'disk (MB)':>12}")
+    for r in rows:
+        print(f"{r['backend']:<16}{r['build_s']:>12.2f}{r['p50_ms']:>12.2f}{r['p95_ms']:>12.2f}{r['disk_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Reports what importing the app costs before the server can bind, using `python -X importtime`.
+The import runs in a fresh interpreter with INFERENCE_MODE=server so models are not loaded;
+only module import time is measured.
+
+Usage:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --module backend.api --top 25
+    python benchmarks/import_time.py --budget-ms 1500    # exit 1 when the total is over budget
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Libraries the app loads lazily; any of them showing up here is a startup regression.
+LAZY_PACKAGES = ("chromadb", "fitz", "pymupdf", "pandas", "pptx", "docx", "openpyxl")
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)\s*$")
+
+
+def measure(module: str) -> list:
+    """Imports `module` in a child interpreter; returns (self_us, cumulative_us, depth, name) rows."""
+    env = dict(os.environ, INFERENCE_MODE="server", PYTHONDONTWRITEBYTECODE="1")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(ROOT), env=env, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr[-4000:])
+        raise SystemExit(f"Importing {module} failed")
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(self_us), int(cumulative_us), (len(indent) - 1) // 2, name))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    rows = measure(args.module)
+    total_ms = sum(row[0] for row in rows) / 1000
+
+    packages = {}
+    for self_us, _, _, name in rows:
+        top_level = name.split(".", 1)[0]
+        packages[top_level] = packages.get(top_level, 0) + self_us
+
+    print(f"import {args.module}: {total_ms:.0f} ms across {len(rows)} modules")
+    print(f"\n{'package':<32}{'ms':>10}{'share':>8}")
+    for name, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<32}{self_us / 1000:>10.1f}{self_us / 1000 / total_ms:>8.0%}")
+
+    print(f"\n{'slowest imports (cumulative)':<48}{'ms':>10}")
+    for _, cumulative_us, depth, name in sorted(rows, key=lambda row: -row[1])[:args.top]:
+        print(f"{'  ' * min(depth, 4) + name:<48}{cumulative_us / 1000:>10.1f}")
+
+    eager = [name for name in LAZY_PACKAGES if name in packages]
+    print("\nlazy packages imported at startup: " + (", ".join(eager) if eager else "none"))
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        raise SystemExit(f"Import time {total_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+End-to-end HTTP load test: runs the real app in-process under uvicorn with a fake model and drives a
+scripted mix of /api/chat, /api/upload, /api/history and /api/notifications traffic at it.
+Reports per-endpoint latency percentiles, chat time-to-first-token, and how late the server's event
+loop ran; anything that blocks inside an async handler shows up as loop lag.
+
+Runs offline against a throwaway data directory (RAG_APP_DIR), so no model files are needed and the
+real chat history and collections are never touched. The fake model stands in for the model server
+(INFERENCE_MODE=server): chat decodes one token every --token-ms on --slots parallel sequences, and
+each embedding call takes --embed-ms.
+
+Usage:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --mix chat --users 8 --duration 30
+    python benchmarks/load_test.py --mix "chat=1,upload=1,notifications=6" --token-ms 20
+    python benchmarks/load_test.py --json load_test.json
+"""
+import argparse
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+COLLECTION = "load_test"
+ENDPOINTS = ("chat", "upload", "history", "notifications")
+# Relative weights of each request type per simulated user
+MIXES = {
+    "mixed": {"chat": 2, "upload": 1, "history": 3, "notifications": 4},
+    "chat": {"chat": 1},
+    "upload": {"upload": 1, "notifications": 2},
+    "polling": {"history": 1, "notifications": 1},
+}
+QUESTIONS = [
+    "What does the handbook say about leave requests?",
+    "Summarize the onboarding steps.",
+    "Who approves travel expenses?",
+    "How are production incidents handled?",
+    "What did we talk about so far?",
+]
+WORDS = ("policy", "employee", "request", "approval", "manager", "incident", "travel", "expense",
+         "onboarding", "review", "security", "document", "process", "team", "deadline", "report")
+
+
+def _percentile(values, pct):
+    return float(np.percentile(np.asarray(values), pct)) if values else 0.0
+
+
+def _parse_mix(value: str) -> dict:
+    if value in MIXES:
+        return MIXES[value]
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {name!r}; use {', '.join(ENDPOINTS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _document(rng: random.Random, words: int) -> bytes:
+    lines = []
+    for _ in range(max(1, words // 12)):
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(12)) + ".")
+    return "\n".join(lines).encode("utf-8")
+
+
+class FakeModel:
+    """
+    Replaces model_server.call / stream_chat. Decoding holds one of `slots` sequences and sleeps per
+    token off the event loop, like llama.cpp on a worker thread; embeddings are deterministic per text.
+    """
+
+    def __init__(self, dim: int, token_seconds: float, embed_seconds: float, slots: int, answer_tokens: int):
+        self.dim = dim
+        self.token_seconds = token_seconds
+        self.embed_seconds = embed_seconds
+        self.answer_tokens = answer_tokens
+        self.slots = threading.BoundedSemaphore(slots)
+        self.embed_lock = threading.Lock()
+
+    def _vector(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def call(self, op: str, **payload):
+        if op == "ping":
+            return {"pid": os.getpid()}
+        if op == "embed":
+            with self.embed_lock:
+                time.sleep(self.embed_seconds)
+            return [self._vector(text) for text in payload["texts"]]
+        if op == "complete":
+            max_tokens = (payload.get("kwargs") or {}).get("max_tokens") or 32
+            with self.slots:
+                time.sleep(self.token_seconds * min(max_tokens, 32))
+            return "knowledge" if payload.get("kind") == "intent" else "A short fake completion."
+        if op == "stats":
+            return None
+        raise ValueError(f"Unknown model server op: {op}")
+
+    def stream_chat(self, messages, cancel=None, **kwargs):
+        queued_at = time.perf_counter()
+        tokens = 0
+        first_token_seconds = None
+        with self.slots:
+            for _ in range(self.answer_tokens):
+                if cancel is not None and cancel.is_set():
+                    break
+                time.sleep(self.token_seconds)
+                if first_token_seconds is None:
+                    first_token_seconds = time.perf_counter() - queued_at
+                tokens += 1
+                yield f"{random.choice(WORDS)} "
+        return {"tokens": tokens, "first_token_seconds": first_token_seconds or 0.0}
+
+
+class LoopMonitor:
+    """Runs on the server's event loop and records how late each periodic wake-up was."""
+
+    def __init__(self, interval: float, stall_seconds: float, in_flight: collections.Counter):
+        self.interval = interval
+        self.stall_seconds = stall_seconds
+        self.in_flight = in_flight
+        self.recording = False
+        self.lags = []
+        self.stalls = []  # (lag, requests in flight when it happened)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - due)
+            if self.recording:
+                self.lags.append(lag)
+                if lag >= self.stall_seconds:
+                    self.stalls.append((lag, {k: v for k, v in self.in_flight.items() if v}))
+
+
+async def _serve(server, monitor: LoopMonitor):
+    task = asyncio.create_task(monitor.run())
+    try:
+        await server.serve()
+    finally:
+        task.cancel()
+
+
+class LoadTest:
+    def __init__(self, args, base_url: str, monitor: LoopMonitor, in_flight: collections.Counter):
+        self.args = args
+        self.base_url = base_url
+        self.monitor = monitor
+        self.in_flight = in_flight
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = collections.Counter()
+        self.error_samples = {}
+        self.ttft = []
+
+    async def _chat(self, client, rng: random.Random, session_id: int):
+        payload = {
+            "session_id": session_id,
+            "collection_name": COLLECTION,
+            "messages": [{"role": "user", "content": rng.choice(QUESTIONS)}],
+        }
+        started = time.perf_counter()
+        first_token = None
+        async with client.stream("POST", "/api/chat", json=payload) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_text():
+                if chunk and first_token is None:
+                    first_token = time.perf_counter() - started
+        if first_token is not None:
+            self.ttft.append(first_token)
+
+    async def _upload(self, client, rng: random.Random):
+        body = _document(rng, self.args.upload_words)
+        response = await client.post(
+            "/api/upload",
+            data={"collection_name": COLLECTION, "summarize": "false", "file_count": "1"},
+            files=[("files", (f"load_{rng.randrange(1 << 30)}.txt", body, "text/plain"))],
+        )
+        response.raise_for_status()
+        last = json.loads(response.text.strip().splitlines()[-1])
+        if last.get("status") != "all_completed":
+            raise RuntimeError(f"upload ended with {last}")
+
+    async def _get(self, client, path: str):
+        response = await client.get(path)
+        response.raise_for_status()
+
+    async def _request(self, name: str, client, rng: random.Random, session_id: int):
+        if name == "chat":
+            await self._chat(client, rng, session_id)
+        elif name == "upload":
+            await self._upload(client, rng)
+        elif name == "history":
+            await self._get(client, "/api/history")
+        else:
+            await self._get(client, "/api/notifications")
+
+    async def _user(self, n: int, client, mix: dict, deadline: float):
+        rng = random.Random(self.args.seed * 1000 + n)
+        response = await client.post("/api/sessions", params={"title": f"Load user {n}"})
+        session_id = response.json()["id"]
+        names, weights = list(mix), list(mix.values())
+        # Staggered start, so users do not all fire their first request in the same tick.
+        await asyncio.sleep(rng.uniform(0, self.args.think_ms / 1000))
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            self.in_flight[name] += 1
+            started = time.perf_counter()
+            try:
+                await self._request(name, client, rng, session_id)
+                self.latencies[name].append(time.perf_counter() - started)
+            except Exception as e:
+                self.errors[name] += 1
+                self.error_samples.setdefault(name, f"{type(e).__name__}: {e}")
+            finally:
+                self.in_flight[name] -= 1
+            await asyncio.sleep(rng.uniform(0, 2 * self.args.think_ms / 1000))
+
+    async def run(self, mix: dict) -> float:
+        import httpx
+
+        timeout = httpx.Timeout(self.args.request_timeout)
+        limits = httpx.Limits(max_connections=self.args.users * 2)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=timeout, limits=limits) as client:
+            # Seed collection, so chats have something to retrieve from the first request on.
+            await client.post("/api/collections", json={"name": COLLECTION})
+            seed = random.Random(self.args.seed)
+            for _ in range(3):
+                await self._upload(client, seed)
+
+            self.monitor.recording = True
+            started = time.perf_counter()
+            deadline = started + self.args.duration
+            await asyncio.gather(*(self._user(n, client, mix, deadline) for n in range(self.args.users)))
+            elapsed = time.perf_counter() - started
+            self.monitor.recording = False
+        return elapsed
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name in ENDPOINTS:
+            values = self.latencies[name]
+            if not values and not self.errors[name]:
+                continue
+            endpoints[name] = {
+                "requests": len(values),
+                "errors": self.errors[name],
+                "rps": len(values) / elapsed,
+                "p50_ms": _percentile(values, 50) * 1000,
+                "p95_ms": _percentile(values, 95) * 1000,
+                "p99_ms": _percentile(values, 99) * 1000,
+                "max_ms": max(values, default=0.0) * 1000,
+            }
+        during = collections.Counter()
+        for _, in_flight in self.monitor.stalls:
+            during.update(in_flight.keys())
+        return {
+            "seconds": elapsed,
+            "users": self.args.users,
+            "endpoints": endpoints,
+            "ttft_ms": {
+                "p50": _percentile(self.ttft, 50) * 1000,
+                "p95": _percentile(self.ttft, 95) * 1000,
+                "p99": _percentile(self.ttft, 99) * 1000,
+            },
+            "loop_lag_ms": {
+                "samples": len(self.monitor.lags),
+                "p50": _percentile(self.monitor.lags, 50) * 1000,
+                "p99": _percentile(self.monitor.lags, 99) * 1000,
+                "max": max(self.monitor.lags, default=0.0) * 1000,
+                "stalls": len(self.monitor.stalls),
+                "stall_threshold": self.args.stall_ms,
+                "stall_total": sum(lag for lag, _ in self.monitor.stalls) * 1000,
+                "in_flight_during_stalls": dict(during.most_common()),
+            },
+            "errors": self.error_samples,
+        }
+
+
+def _print_report(result: dict, mix: dict):
+    print(f"\n{result['users']} users for {result['seconds']:.1f}s, mix "
+          + ", ".join(f"{name}={weight:g}" for name, weight in mix.items()))
+    print(f"\n{'endpoint':<16}{'requests':>10}{'errors':>8}{'req/s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, row in result["endpoints"].items():
+        print(f"{name:<16}{row['requests']:>10}{row['errors']:>8}{row['rps']:>8.1f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}")
+    ttft = result["ttft_ms"]
+    if "chat" in result["endpoints"]:
+        print(f"\nchat time to first token: p50 {ttft['p50']:.1f} ms | p95 {ttft['p95']:.1f} ms | p99 {ttft['p99']:.1f} ms")
+    lag = result["loop_lag_ms"]
+    print(f"event loop lag ({lag['samples']} samples): p50 {lag['p50']:.1f} ms | p99 {lag['p99']:.1f} ms | max {lag['max']:.1f} ms")
+    print(f"stalls >= {lag['stall_threshold']:g} ms: {lag['stalls']} ({lag['stall_total']:.0f} ms in total)")
+    if lag["in_flight_during_stalls"]:
+        print("  requests in flight during stalls: "
+              + ", ".join(f"{name} x{count}" for name, count in lag["in_flight_during_stalls"].items()))
+    for name, sample in result["errors"].items():
+        print(f"first {name} error: {sample}")
+
+
+def _run(args, mix: dict) -> dict:
+    """Starts the app on a free port with the fake model, runs the traffic and returns the report."""
+    import uvicorn
+    from backend import model_server
+    import main as app_main
+
+    model = FakeModel(args.dim, args.token_ms / 1000, args.embed_ms / 1000, args.slots, args.answer_tokens)
+    model_server.call = model.call
+    model_server.stream_chat = model.stream_chat
+    # Per-request INFO lines would cost the server more than the requests being measured.
+    logging.getLogger().setLevel(logging.WARNING)
+
+    in_flight = collections.Counter()
+    monitor = LoopMonitor(args.lag_interval_ms / 1000, args.stall_ms / 1000, in_flight)
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app_main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=lambda: asyncio.run(_serve(server, monitor)), name="load-test-server", daemon=True)
+    thread.start()
+    try:
+        while not server.started:
+            if not thread.is_alive():
+                raise SystemExit("Server failed to start")
+            time.sleep(0.05)
+        test = LoadTest(args, f"http://127.0.0.1:{port}", monitor, in_flight)
+        elapsed = asyncio.run(test.run(mix))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=30)
+    return test.report(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process HTTP load test with a fake model")
+    parser.add_argument("--mix", type=_parse_mix, default="mixed",
+                        help=f"{', '.join(MIXES)} or weights like 'chat=2,history=1'")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of traffic")
+    parser.add_argument("--think-ms", type=float, default=200.0, help="Mean pause between a user's requests")
+    parser.add_argument("--token-ms", type=float, default=15.0, help="Fake decode time per token")
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--slots", type=int, default=1, help="Chats the fake model decodes at once")
+    parser.add_argument("--embed-ms", type=float, default=20.0, help="Fake time per embedding call")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--upload-words", type=int, default=1500)
+    parser.add_argument("--vector-backend", default="numpy", choices=("numpy", "chroma"))
+    parser.add_argument("--lag-interval-ms", type=float, default=10.0)
+    parser.add_argument("--stall-ms", type=float, default=50.0)
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary data directory")
+    args = parser.parse_args()
+    mix = args.mix
+
+    data_dir = Path(tempfile.mkdtemp(prefix="rag-load-test-"))
+    # Placeholders: startup checks that model files exist, and the embedding fingerprint hashes one.
+    (data_dir / "chat.nextgen").write_bytes(b"load test placeholder chat model")
+    (data_dir / "embed.nextgen").write_bytes(b"load test placeholder embedding model")
+    os.environ.update({
+        "RAG_APP_DIR": str(data_dir),
+        "INFERENCE_MODE": "server",
+        "VECTOR_BACKEND": args.vector_backend,
+    })
+
+    try:
+        result = _run(args, mix)
+    finally:
+        if not args.keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    _print_report(result, mix)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mix": mix, **result}, f, indent=2)
+    if args.keep:
+        print(f"\nData directory kept at {data_dir}")
+
+
+if __name__ == "__main__":
+    main()
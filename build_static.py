@@ -0,0 +1,96 @@
+"""
+Builds static_build/ from static/ for production serving:
+- CSS and JS get content-hashed names (app.js -> app.3f2a9c1e04bd.js), so they can be cached forever
+- HTML pages are rewritten to reference the hashed names
+- text assets get .gz copies, and .br copies when the `brotli` package is installed
+
+main.py serves static_build/ whenever it exists; rerun this after editing anything in static/.
+
+Usage:
+    python build_static.py
+    python build_static.py --source static --output static_build
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import shutil
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip alone is understood by every browser.
+    brotli = None
+
+ROOT = Path(__file__).resolve().parent
+HASHED_SUFFIXES = {".css", ".js"}
+COMPRESSED_SUFFIXES = {".css", ".js", ".html", ".svg", ".json", ".txt", ".map"}
+MIN_COMPRESS_BYTES = 256
+
+
+def _write_compressed(target: Path, data: bytes) -> dict:
+    sizes = {"raw": len(data)}
+    if target.suffix not in COMPRESSED_SUFFIXES or len(data) < MIN_COMPRESS_BYTES:
+        return sizes
+    # mtime=0 keeps the output (and so its ETag) stable across identical builds.
+    gzipped = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gzipped) < len(data):
+        target.with_name(target.name + ".gz").write_bytes(gzipped)
+        sizes["gzip"] = len(gzipped)
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data):
+            target.with_name(target.name + ".br").write_bytes(compressed)
+            sizes["br"] = len(compressed)
+    return sizes
+
+
+def build(source: Path, output: Path) -> dict:
+    files = sorted(p for p in source.rglob("*") if p.is_file())
+    manifest = {}
+    for path in files:
+        if path.suffix in HASHED_SUFFIXES:
+            digest = hashlib.sha256(path.read_bytes()).hexdigest()[:12]
+            rel = path.relative_to(source)
+            manifest[rel.as_posix()] = rel.with_name(f"{path.stem}.{digest}{path.suffix}").as_posix()
+
+    shutil.rmtree(output, ignore_errors=True)
+    report = {}
+    for path in files:
+        rel = path.relative_to(source).as_posix()
+        data = path.read_bytes()
+        if path.suffix == ".html":
+            text = data.decode("utf-8")
+            for original, hashed in manifest.items():
+                text = text.replace(f"/static/{original}", f"/static/{hashed}")
+            data = text.encode("utf-8")
+        # Hashed assets are also kept under their plain name for anything that links to it directly.
+        for name in {rel, manifest.get(rel, rel)}:
+            target = output / name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(data)
+            report[name] = _write_compressed(target, data)
+
+    # Written last: the server only switches to this folder once the manifest exists.
+    with open(output / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hash and precompress static assets")
+    parser.add_argument("--source", default=str(ROOT / "static"))
+    parser.add_argument("--output", default=str(ROOT / "static_build"))
+    args = parser.parse_args()
+
+    report = build(Path(args.source), Path(args.output))
+    print(f"{'file':<40}{'raw':>10}{'gzip':>10}{'br':>10}")
+    for name, sizes in sorted(report.items()):
+        print(f"{name:<40}{sizes['raw']:>10}{sizes.get('gzip', '-'):>10}{sizes.get('br', '-'):>10}")
+    if brotli is None:
+        print("brotli not installed; wrote gzip copies only (pip install brotli for .br)")
+    print(f"Built {len(report)} files into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
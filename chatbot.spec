@@ -15,6 +15,11 @@ hiddenimports = (
     ]
 )
 
+datas = [(str(project_root / "static"), "static")]
+# Hashed, precompressed assets from build_static.py; main.py prefers them when bundled
+if (project_root / "static_build" / "manifest.json").exists():
+    datas.append((str(project_root / "static_build"), "static_build"))
+
 llama_cpp_dir = Path(llama_cpp.__file__).parent
 llama_cpp_lib = llama_cpp_dir / "lib"
 
@@ -22,9 +27,7 @@ a = Analysis(
     ["main.py"],
     pathex=[str(project_root)],
     hiddenimports=hiddenimports,
-    datas=[
-        (str(project_root / "static"), "static"),
-    ],
+    datas=datas,
     binaries=[
         (str(llama_cpp_lib), "llama_cpp/lib"),
     ],
@@ -0,0 +1,291 @@
+"""
+Command-line tools that work without the web server.
+
+    python cli.py ingest ./docs --collection handbook
+    python cli.py export handbook -o handbook.snapshot.zip
+    python cli.py import handbook.snapshot.zip
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from backend.config import settings, APP_DIR
+from backend.ingest import SUPPORTED_EXTENSIONS
+from backend.text_cache import hash_file, load_chunks_cached
+
+
+def _parse_file(path: str) -> dict:
+    """Runs in a worker process: hashes, extracts (through the text cache) and chunks one file."""
+    file_hash = hash_file(path)
+    chunks, chunk_metadata = load_chunks_cached(path, file_hash)
+    return {"path": path, "sha256": file_hash, "chunks": chunks, "chunk_metadata": chunk_metadata}
+
+
+def _walk(root: Path, extensions: tuple) -> list:
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in extensions:
+                files.append(os.path.join(dirpath, filename))
+    return files
+
+
+def _file_key(path: str) -> str:
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{int(stat.st_mtime)}"
+
+
+def _load_checkpoint(path: Path) -> set:
+    done = set()
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["key"])
+                except (ValueError, KeyError):
+                    continue  # A line cut short by an interrupted run
+    return done
+
+
+def cmd_ingest(args) -> int:
+    from backend.database import init_sqlite, get_db_connection, bump_collection_version
+    from backend.dedup import deduplicate, record_signatures
+    from backend.embedder import embed_texts
+    from backend.embedder import EmbeddingMismatch
+    from backend.indexing import (
+        chunk_records, clear_document, collection_lock, enqueue_summary, prepare_collection, record_document,
+        restore_duplicates, source_name,
+    )
+    from backend.vector_store import get_vector_store
+
+    root = Path(args.directory)
+    if not root.is_dir():
+        print(f"Not a directory: {root}", file=sys.stderr)
+        return 2
+    collection_name = args.collection
+    if collection_name == "all":
+        print("'all' is reserved", file=sys.stderr)
+        return 2
+
+    # No crash recovery: a running server owns the jobs and notifications it would reset.
+    init_sqlite(recover=False)
+    upload_dir = APP_DIR / "uploads"
+    os.makedirs(upload_dir, exist_ok=True)
+    checkpoint_path = Path(args.checkpoint) if args.checkpoint else APP_DIR / "ingest_checkpoints" / f"{collection_name}.jsonl"
+    os.makedirs(checkpoint_path.parent, exist_ok=True)
+
+    done = set() if args.restart else _load_checkpoint(checkpoint_path)
+    files = _walk(root, SUPPORTED_EXTENSIONS)
+    todo = [f for f in files if _file_key(f) not in done]
+    print(f"{len(files)} files found, {len(files) - len(todo)} already done (checkpoint: {checkpoint_path})")
+    if not todo:
+        return 0
+
+    try:
+        prepare_collection(collection_name)
+    except EmbeddingMismatch as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    conn = get_db_connection()
+    known_hashes = {row[0] for row in conn.execute(
+        "SELECT file_hash FROM documents WHERE collection_name = ? AND file_hash IS NOT NULL", (collection_name,))}
+    conn.close()
+
+    stats = {"files": 0, "chunks": 0, "duplicates": 0, "skipped": 0, "failed": 0, "embed_seconds": 0.0}
+    pending = []  # Parsed files waiting for the next embedding batch
+    checkpoint_file = open(checkpoint_path, "w" if args.restart else "a", encoding="utf-8")
+
+    def mark_done(parsed: dict, status: str, source: str = None):
+        checkpoint_file.write(json.dumps({
+            "key": parsed["key"], "status": status, "source": source,
+            "sha256": parsed["sha256"], "chunks": len(parsed["chunks"]),
+        }) + "\n")
+        checkpoint_file.flush()
+
+    def flush():
+        if not pending:
+            return
+        # Shared with the server (an OS file lock), so its uploads and re-index swaps wait for these writes.
+        with collection_lock(collection_name):
+            collection = get_vector_store().get_collection(name=collection_name)
+            for parsed in pending:
+                orig_name = os.path.basename(parsed["path"])
+                # Content-derived name: a rerun after a crash overwrites its own partial writes.
+                source = source_name(orig_name, collection_name, parsed["sha256"][:12])
+                clear_document(collection, collection_name, source)
+                ids, metadatas = chunk_records(orig_name, source, parsed["chunks"], parsed["sha256"], parsed["chunk_metadata"])
+                parsed["source"] = source
+                parsed["dedup"] = deduplicate(collection_name, ids, parsed["chunks"], metadatas, exclude_sources=(source,))
+                # Recorded before embedding, so later files in this batch are compared against it too.
+                record_signatures(collection_name, source, parsed["dedup"]["signatures"], parsed["dedup"]["dropped"])
+                stats["duplicates"] += parsed["dedup"]["duplicates"]
+
+        texts = [chunk for parsed in pending for chunk in parsed["dedup"]["chunks"]]
+        started = time.perf_counter()
+        embeddings = []
+        for i in range(0, len(texts), args.batch_size):
+            embeddings.extend(embed_texts(texts[i:i + args.batch_size]))
+        stats["embed_seconds"] += time.perf_counter() - started
+
+        with collection_lock(collection_name):
+            # Resolved again: the server may have swapped in a rebuilt collection while this batch was embedding.
+            collection = get_vector_store().get_collection(name=collection_name)
+            offset = 0
+            for parsed in pending:
+                path, source, dedup = parsed["path"], parsed["source"], parsed["dedup"]
+                orig_name = os.path.basename(path)
+                chunks = dedup["chunks"]
+                shutil.copy2(path, upload_dir / source)
+                collection.add(documents=chunks, embeddings=embeddings[offset:offset + len(chunks)], metadatas=dedup["metadatas"], ids=dedup["ids"])
+                offset += len(chunks)
+                # A rerun replaces the file's earlier copy, which other files' dropped chunks may point at.
+                restore_duplicates(collection, collection_name, source)
+                record_document(collection_name, orig_name, source, parsed["sha256"],
+                                "Summary generation in progress..." if args.summarize else "No summary requested.")
+                if args.summarize:
+                    enqueue_summary(collection_name, orig_name, source, str(upload_dir / source))
+                stats["files"] += 1
+                stats["chunks"] += len(chunks)
+                mark_done(parsed, "indexed", source)
+            bump_collection_version(collection_name)
+        pending.clear()
+
+        elapsed = time.perf_counter() - started_at
+        print(f"[{stats['files'] + stats['skipped'] + stats['failed']}/{len(todo)}] "
+              f"{stats['files'] / elapsed:.2f} files/s, {stats['chunks'] / elapsed:.1f} chunks/s")
+
+    started_at = time.perf_counter()
+    workers = args.workers or max(1, (os.cpu_count() or 2) - 1)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            queue = iter(todo)
+            in_flight = {}
+            # Bounded submission keeps at most a few parsed documents in memory per worker.
+            for path in queue:
+                in_flight[pool.submit(_parse_file, path)] = path
+                if len(in_flight) >= workers * 2:
+                    break
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = in_flight.pop(future)
+                    next_path = next(queue, None)
+                    if next_path:
+                        in_flight[pool.submit(_parse_file, next_path)] = next_path
+                    try:
+                        parsed = future.result()
+                    except Exception as e:
+                        print(f"Failed: {path}: {e}", file=sys.stderr)
+                        stats["failed"] += 1
+                        continue
+                    parsed["key"] = _file_key(path)
+                    if not parsed["chunks"]:
+                        print(f"Skipped (no text): {path}")
+                        stats["skipped"] += 1
+                        mark_done(parsed, "empty")
+                    elif parsed["sha256"] in known_hashes:
+                        print(f"Skipped (already in {collection_name}): {path}")
+                        stats["skipped"] += 1
+                        mark_done(parsed, "duplicate")
+                    else:
+                        known_hashes.add(parsed["sha256"])
+                        pending.append(parsed)
+                        if sum(len(p["chunks"]) for p in pending) >= args.batch_size:
+                            flush()
+            flush()
+    finally:
+        checkpoint_file.close()
+
+    elapsed = time.perf_counter() - started_at
+    print(
+        f"Indexed {stats['files']} files ({stats['chunks']} chunks, {stats['duplicates']} near-duplicates skipped) "
+        f"into '{collection_name}' in {elapsed:.1f}s | "
+        f"{stats['files'] / elapsed:.2f} files/s | {stats['chunks'] / elapsed:.1f} chunks/s | "
+        f"embedding {stats['embed_seconds']:.1f}s | skipped {stats['skipped']} | failed {stats['failed']}"
+    )
+    if args.summarize and stats["files"]:
+        print("Summaries are queued and will run the next time the server starts.")
+    return 1 if stats["failed"] else 0
+
+
+def cmd_export(args) -> int:
+    from backend.database import init_sqlite
+    from backend.embedder import EmbeddingMismatch
+    from backend.snapshots import export_snapshot
+    from backend.vector_store import get_vector_store
+
+    init_sqlite(recover=False)
+    if args.collection not in [c.name for c in get_vector_store().list_collections()]:
+        print(f"Collection not found: {args.collection}", file=sys.stderr)
+        return 2
+    output = Path(args.output or f"{args.collection}.snapshot.zip")
+    try:
+        result = export_snapshot(args.collection, output)
+    except EmbeddingMismatch as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    print(f"Exported '{args.collection}' to {output}: {result['chunks']} chunks, {result['documents']} documents, "
+          f"{result['dtype']} embeddings, {result['bytes'] / 1024 / 1024:.1f} MB")
+    return 0
+
+
+def cmd_import(args) -> int:
+    from backend.database import init_sqlite
+    from backend.embedder import EmbeddingMismatch
+    from backend.snapshots import SnapshotError, import_snapshot
+
+    init_sqlite(recover=False)
+    try:
+        result = import_snapshot(args.snapshot, args.collection, replace=args.replace)
+    except (EmbeddingMismatch, SnapshotError) as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    action = "Replaced" if result["replaced"] else "Imported"
+    print(f"{action} '{result['collection_name']}': {result['chunks']} chunks, {result['documents']} documents "
+          f"in {result['seconds']:.1f}s (no embedding needed)")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="RAG Chatbot command-line tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest = sub.add_parser("ingest", help="Index every supported file under a directory")
+    ingest.add_argument("directory")
+    ingest.add_argument("--collection", "-c", required=True)
+    ingest.add_argument("--workers", type=int, default=0, help="Parser processes (default: CPU count - 1)")
+    ingest.add_argument("--batch-size", type=int, default=settings.INGEST_EMBED_BATCH, help="Chunks per embedding call")
+    ingest.add_argument("--summarize", action="store_true", help="Queue a summary job for each indexed file")
+    ingest.add_argument("--checkpoint", help="Checkpoint file (default: ingest_checkpoints/<collection>.jsonl)")
+    ingest.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    ingest.set_defaults(func=cmd_ingest)
+
+    export = sub.add_parser("export", help="Write a collection to a snapshot archive")
+    export.add_argument("collection")
+    export.add_argument("--output", "-o", help="Archive path (default: <collection>.snapshot.zip)")
+    export.set_defaults(func=cmd_export)
+
+    load = sub.add_parser("import", help="Load a snapshot archive without re-embedding")
+    load.add_argument("snapshot")
+    load.add_argument("--collection", "-c", help="Collection name (default: the exported name)")
+    load.add_argument("--replace", action="store_true", help="Overwrite the collection if it exists")
+    load.set_defaults(func=cmd_import)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
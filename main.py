@@ -1,12 +1,14 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Request
 
 from dotenv import load_dotenv
 load_dotenv()
 
 from backend.api import router as api_router, settings, APP_DIR, BUNDLE_DIR
 from backend.database import init_sqlite
+from backend.jobs import job_queue
+from backend.batch_engine import stop_engine
+from backend.retrieval import retrieval_service
+from backend.static_files import CachedStaticFiles, page_response, static_root
 import os
 import socket
 
@@ -32,35 +34,55 @@ validate_models()
 
 app = FastAPI(title="RAG Chatbot")
 
-# Initialize Database
-init_sqlite()
+# Initialize Database. Extra API worker processes leave crash recovery to the launcher,
+# which already ran it; requeueing here would steal jobs another worker is running.
+API_WORKER_ENV = "RAG_API_WORKER"
+init_sqlite(recover=not os.getenv(API_WORKER_ENV))
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    # Workers also resume jobs that were queued or interrupted before the last shutdown.
+    job_queue.start()
+    # Opens recently used collections in the background so the first chat does not pay for it.
+    retrieval_service.start_warm_up()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    job_queue.stop()
+    stop_engine()
 
 # Mount API Router
 app.include_router(api_router, prefix="/api")
 
-# Mount Static Files
-STATIC_DIR = BUNDLE_DIR / "static"
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+# Mount Static Files (hashed, precompressed build from build_static.py when present)
+STATIC_DIR = static_root(BUNDLE_DIR)
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR), name="static")
 
 
 @app.get("/")
-async def read_root():
-    return FileResponse(STATIC_DIR / "index.html")
+async def read_root(request: Request):
+    return page_response(request, STATIC_DIR / "index.html")
 
 
 @app.get("/manage")
-async def read_manage():
-    return FileResponse(STATIC_DIR / "manage.html")
+async def read_manage(request: Request):
+    return page_response(request, STATIC_DIR / "manage.html")
 
 
 @app.get("/profile")
-async def read_profile():
-    return FileResponse(STATIC_DIR / "profile.html")
+async def read_profile(request: Request):
+    return page_response(request, STATIC_DIR / "profile.html")
 
 
 if __name__ == "__main__":
+    import multiprocessing
     import uvicorn
 
+    # Lets the model-server and API worker processes start from a frozen executable.
+    multiprocessing.freeze_support()
+
     HOST = os.getenv("HOST", "127.0.0.1")
     preferred_port = int(os.getenv("PORT", "8000"))
 
@@ -83,5 +105,25 @@ if __name__ == "__main__":
     print(f"Visit: {URL}")
     print("=" * 50 + "\n")
 
-    # Pass app object directly; string import is brittle in PyInstaller bundles.
-    uvicorn.run(app, host=HOST, port=PORT, reload=False, log_level="info")
+    if settings.INFERENCE_MODE != "server":
+        if settings.API_WORKERS > 1:
+            print("API_WORKERS > 1 needs INFERENCE_MODE=server (each worker would load its own models); using 1 worker.")
+        # Pass app object directly; string import is brittle in PyInstaller bundles.
+        uvicorn.run(app, host=HOST, port=PORT, reload=False, log_level="info")
+    else:
+        from backend.model_server import start_model_server
+
+        if settings.API_WORKERS > 1 and settings.VECTOR_BACKEND == "chroma":
+            print("Warning: Chroma caches its index per process, so documents indexed by one API worker "
+                  "may not show up in another worker's answers until restart. Use VECTOR_BACKEND=numpy "
+                  "with API_WORKERS > 1.")
+        os.environ[API_WORKER_ENV] = "1"
+        print(f"Starting model server on {settings.MODEL_SERVER_HOST}:{settings.MODEL_SERVER_PORT}...")
+        model_process = start_model_server()
+        try:
+            # Several workers need an import string; a single one keeps the bundle-safe app object.
+            target = "main:app" if settings.API_WORKERS > 1 else app
+            uvicorn.run(target, host=HOST, port=PORT, reload=False, log_level="info", workers=settings.API_WORKERS)
+        finally:
+            model_process.terminate()
+            model_process.join(timeout=10)
@@ -68,6 +68,9 @@ async function loadCollections() {
 
         if (collectionSelect) {
             collectionSelect.innerHTML = '<option value="">No Collection (General Chat)</option>';
+            if (collections.length > 1) {
+                collectionSelect.innerHTML += '<option value="all">All Collections</option>';
+            }
             collections.forEach(c => {
                 const opt = document.createElement('option');
                 opt.value = c.name;
@@ -227,8 +230,15 @@ window.renameSessionPrompt = async function (e, id, currentTitle) {
 // --- Chat Logic ---
 
 let currentAbortController = null;
+let currentRequestId = null;
+let stopRequested = false;
 let isStreaming = false;
 
+function newRequestId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
 async function sendMessage() {
     if (isStreaming) return;
     const content = messageInput.value.trim();
@@ -249,6 +259,8 @@ async function sendMessage() {
 
     // Setup AbortController for stop functionality
     currentAbortController = new AbortController();
+    currentRequestId = newRequestId();
+    stopRequested = false;
     isStreaming = true;
     updateSendButtonState();
 
@@ -264,7 +276,8 @@ async function sendMessage() {
                 session_id: currentSessionId,
                 messages: messages,
                 collection_name: collectionName,
-                stream: true
+                stream: true,
+                request_id: currentRequestId
             }),
             signal: currentAbortController.signal
         });
@@ -297,6 +310,9 @@ async function sendMessage() {
             chatArea.scrollTop = chatArea.scrollHeight;
         }
 
+        if (stopRequested) {
+            contentDiv.innerHTML += `<div class="interrupted-msg">Stopped due to User interruption</div>`;
+        }
         messages.push({ role: 'assistant', content: botResponse });
         loadHistory();
 
@@ -322,14 +338,23 @@ async function sendMessage() {
     } finally {
         isStreaming = false;
         currentAbortController = null;
+        currentRequestId = null;
         updateSendButtonState();
     }
 }
 
-function stopGeneration() {
-    if (currentAbortController) {
-        currentAbortController.abort();
+async function stopGeneration() {
+    if (!currentAbortController || stopRequested) return;
+    stopRequested = true;
+    const controller = currentAbortController;
+    try {
+        // The server stops before the next token and still sends (and saves) the partial answer.
+        const res = await fetch(`/api/chat/${encodeURIComponent(currentRequestId)}/cancel`, { method: 'POST' });
+        if (res.ok) return;
+    } catch (e) {
+        console.error('Cancel request failed', e);
     }
+    controller.abort();
 }
 
 function updateSendButtonState() {
@@ -383,7 +408,7 @@ function initUpload() {
 
     if (openModalBtn) {
         openModalBtn.addEventListener('click', () => {
-            if (!collectionSelect.value) {
+            if (!collectionSelect.value || collectionSelect.value === 'all') {
                 alert("Please select a collection first.");
                 return;
             }
@@ -438,7 +463,7 @@ window.removeFile = function (index) {
 
 async function handleMultiUpload() {
     if (stagedFiles.length === 0) return;
-    if (!collectionSelect.value) {
+    if (!collectionSelect.value || collectionSelect.value === 'all') {
         alert("Please select a collection first.");
         return;
     }
@@ -455,7 +480,9 @@ async function handleMultiUpload() {
     // Get summarize toggle value
     const summarizeToggle = document.getElementById('summarizeToggle');
     formData.append('summarize', summarizeToggle ? summarizeToggle.checked : false);
+    formData.append('file_count', stagedFiles.length);
 
+    // Files are appended last: the server indexes each one as soon as it has arrived.
     stagedFiles.forEach(file => {
         formData.append('files', file);
     });
@@ -532,11 +559,13 @@ async function loadCollectionsManage() {
         card.className = 'card';
         card.innerHTML = `
             <h3>${c.name}</h3>
-            <p>Ready for chat</p>
+            <p>${c.needs_reindex ? 'Indexed with a different embedding model' : 'Ready for chat'}</p>
             <div id="summary-${c.name}" class="collection-summary" style="font-size:0.8rem; color:var(--text-secondary); margin-bottom:0.5rem;"></div>
             <div style="display:flex; gap:0.5rem;">
                 <button class="action-btn" onclick="openUploadModal('${c.name}')">Add Doc</button>
                 <button class="action-btn" onclick="fetchSummary('${c.name}')">Summarize</button>
+                <button class="action-btn" onclick="rebuildCollection('${c.name}')">Rebuild</button>
+                ${c.needs_reindex ? `<button class="action-btn" onclick="reindexCollection('${c.name}')">Re-index</button>` : ''}
                 <button class="btn-danger" onclick="deleteCollection('${c.name}')">Delete</button>
             </div>
         `;
@@ -567,6 +596,17 @@ window.fetchSummary = async function (name) {
                         <h4>${doc.filename}</h4>
                         <div class="summary-content">${doc.summary}</div>
                     `;
+                    if (doc.source) {
+                        const actions = document.createElement('div');
+                        actions.style.cssText = 'display:flex; gap:0.5rem; margin-top:0.5rem;';
+                        actions.innerHTML = `
+                            <button class="action-btn">Replace</button>
+                            <button class="btn-danger">Delete</button>
+                        `;
+                        actions.children[0].onclick = () => replaceDocument(name, doc.source, doc.filename);
+                        actions.children[1].onclick = () => deleteDocument(name, doc.source, doc.filename);
+                        item.appendChild(actions);
+                    }
                     list.appendChild(item);
                 });
             } else {
@@ -629,6 +669,90 @@ async function deleteCollection(name) {
 }
 
 
+async function deleteDocument(name, source, filename) {
+    if (!confirm(`Remove "${filename}" from "${name}"?`)) return;
+
+    try {
+        const res = await fetch(`/api/collections/${name}/documents/${encodeURIComponent(source)}`, {
+            method: 'DELETE'
+        });
+
+        if (res.ok) {
+            fetchSummary(name);
+        } else {
+            const err = await res.json();
+            alert(err.detail || 'Delete failed');
+        }
+    } catch (e) {
+        console.error(e);
+    }
+}
+
+function replaceDocument(name, source, filename) {
+    const input = document.createElement('input');
+    input.type = 'file';
+    input.onchange = async () => {
+        if (!input.files.length) return;
+        const formData = new FormData();
+        formData.append('summarize', 'false');
+        formData.append('file', input.files[0]);
+
+        const list = document.getElementById('summaryList');
+        if (list) list.innerHTML = `<div style="text-align:center; padding:2rem;">Replacing ${filename}...</div>`;
+        try {
+            const res = await fetch(`/api/collections/${name}/documents/${encodeURIComponent(source)}`, {
+                method: 'PUT',
+                body: formData
+            });
+            if (!res.ok) {
+                const err = await res.json();
+                alert(err.detail || 'Replace failed');
+            }
+        } catch (e) {
+            console.error(e);
+        }
+        fetchSummary(name);
+    };
+    input.click();
+}
+
+window.rebuildCollection = async function (name) {
+    if (!confirm(`Re-chunk and re-embed every document in "${name}"? Chat keeps working while it runs.`)) return;
+
+    try {
+        const res = await fetch(`/api/collections/${name}/rebuild`, {
+            method: 'POST'
+        });
+
+        if (res.ok) {
+            notifications.loadNotifications();
+        } else {
+            const err = await res.json();
+            alert(err.detail || 'Rebuild failed to start');
+        }
+    } catch (e) {
+        console.error(e);
+    }
+}
+
+window.reindexCollection = async function (name) {
+    if (!confirm(`Re-embed "${name}" with the current embedding model? Chat skips this collection until the re-index finishes.`)) return;
+
+    try {
+        const res = await fetch(`/api/collections/${name}/reindex`, {
+            method: 'POST'
+        });
+
+        if (res.ok) {
+            notifications.loadNotifications();
+        } else {
+            const err = await res.json();
+            alert(err.detail || 'Re-index failed to start');
+        }
+    } catch (e) {
+        console.error(e);
+    }
+}
 
 let uploadTargetCollection = null;
 
@@ -779,13 +903,15 @@ window.uploadFileFromManage = async function () {
 
     if (!file) return;
 
+    // Fields go before the file so the server can start indexing as soon as the file arrives.
     const formData = new FormData();
-    formData.append('files', file);
     formData.append('collection_name', uploadTargetCollection);
 
     // Get summarize toggle value from manage page
     const summarizeToggle = document.getElementById('manageSummarizeToggle');
     formData.append('summarize', summarizeToggle ? summarizeToggle.checked : false);
+    formData.append('file_count', 1);
+    formData.append('files', file);
 
     status.textContent = "Starting...";
 